@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Main entry point for aistocktrack application.
-Runs the Flask development server.
+Runs the Flask development server, or gunicorn when SERVER_MODE=production.
 """
 
 import os
@@ -9,10 +9,16 @@ import sys
 import logging
 from pathlib import Path
 
-# Add src to Python path
-sys.path.insert(0, str(Path(__file__).parent / "src" / "main" / "python"))
+# Import the app as a package so its relative imports resolve from any working directory
+sys.path.insert(0, str(Path(__file__).parent))
 
-from api.app import create_app
+from src.main.python.api.app import create_app, reset_after_fork
+from src.main.python.utils.metrics import clear_multiprocess_dir, mark_process_dead
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # gunicorn is only needed in production mode
+    BaseApplication = None
 
 def setup_logging():
     """Configure logging for the application."""
@@ -25,19 +31,80 @@ def setup_logging():
         ]
     )
 
+def production_options(host: str, port: int) -> dict:
+    """
+    gunicorn settings from the environment.
+    
+    Threaded workers keep a slow client or an open event stream from
+    blocking a whole process; the app caps event streams per worker below
+    the thread count with STREAM_MAX_CLIENTS. The app is loaded once in the master and
+    workers are forked from it, sharing its warmed caches and indexes
+    copy-on-write. Workers are recycled after a jittered number of requests
+    so they don't all restart at once.
+    """
+    return {
+        'bind': f'{host}:{port}',
+        'workers': int(os.environ.get('WEB_WORKERS', (os.cpu_count() or 1) * 2 + 1)),
+        'worker_class': 'gthread',
+        'threads': int(os.environ.get('WEB_THREADS', 8)),
+        'keepalive': int(os.environ.get('WEB_KEEPALIVE', 5)),
+        'timeout': int(os.environ.get('WEB_TIMEOUT', 30)),
+        'graceful_timeout': int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30)),
+        'max_requests': int(os.environ.get('WEB_MAX_REQUESTS', 5000)),
+        'max_requests_jitter': int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 500)),
+        'preload_app': True,
+        'accesslog': '-',
+    }
+
+def serve_production(host: str, port: int):
+    """Serve the app with gunicorn."""
+    if BaseApplication is None:
+        sys.exit("SERVER_MODE=production requires gunicorn: pip install gunicorn")
+    
+    # Workers share one database; an in-memory one would be private to each worker
+    os.environ.setdefault('DATABASE_PATH', 'data/aistocktrack.db')
+    # Workers write metrics snapshots here so a scrape of any worker reports them all
+    metrics_dir = os.environ.setdefault('METRICS_DIR', 'data/metrics')
+    clear_multiprocess_dir(metrics_dir)
+    
+    class ProductionServer(BaseApplication):
+        """gunicorn application serving a preloaded app."""
+        
+        def __init__(self, options: dict):
+            self.options = options
+            self.application = None
+            super().__init__()
+        
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+            self.cfg.set('post_fork', lambda server, worker: reset_after_fork(self.application))
+            self.cfg.set('worker_exit', lambda server, worker: self.application.extensions['metrics'].write_snapshot())
+            self.cfg.set('child_exit', lambda server, worker: mark_process_dead(metrics_dir, worker.pid))
+        
+        def load(self):
+            if self.application is None:
+                self.application = create_app('production')
+            return self.application
+    
+    ProductionServer(production_options(host, port)).run()
+
 if __name__ == '__main__':
     setup_logging()
     
-    app = create_app()
-    
     # Get configuration from environment
     host = os.environ.get('FLASK_HOST', '0.0.0.0')
     port = int(os.environ.get('FLASK_PORT', 5000))
     debug = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
+    production = os.environ.get('SERVER_MODE', 'development').lower() == 'production'
     
     print(f"🚀 Starting aistocktrack server on http://{host}:{port}")
     print(f"📱 Pop Mart interface: http://{host}:{port}/pop_mart")
     print(f"🎮 Pokémon interface: http://{host}:{port}/pokemon")
     print(f"🔧 API health check: http://{host}:{port}/api/health")
     
-    app.run(host=host, port=port, debug=debug)
\ No newline at end of file
+    if production:
+        serve_production(host, port)
+    else:
+        app = create_app()
+        app.run(host=host, port=port, debug=debug)
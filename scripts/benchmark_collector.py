@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Benchmark collector throughput against a local stub retailer.
+Runs offline; reports pages/sec, fetch latency and database write rate.
+"""
+
+import sys
+import json
+import argparse
+import logging
+from pathlib import Path
+
+# Add repository root to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.main.python.utils.stub_retailer import StubConfig
+from src.main.python.utils.collector_harness import run_collector_harness
+
+def main():
+    """Run the collector load harness."""
+    parser = argparse.ArgumentParser(description="Collector load harness")
+    parser.add_argument('--products', type=int, default=200, help="Products per brand")
+    parser.add_argument('--rounds', type=int, default=2, help="Collection rounds")
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="Stub base latency")
+    parser.add_argument('--jitter-ms', type=float, default=5.0, help="Stub random extra latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of 500 responses")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Fraction of 429 responses")
+    parser.add_argument('--mutate', type=float, default=0.1, help="Fraction of products changed per round")
+    parser.add_argument('--db', help="SQLite file to write to (default: in-memory)")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    parser.add_argument('--verbose', action='store_true', help="Show collector logs")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+    
+    config = StubConfig(
+        products_per_brand=args.products,
+        latency=args.latency_ms / 1000,
+        latency_jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate
+    )
+    report = run_collector_harness(config, rounds=args.rounds, mutate_fraction=args.mutate, db_path=args.db)
+    
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2))
+        return
+    
+    print(f"📄 Pages fetched:     {report.pages_fetched} in {report.elapsed_seconds:.2f}s")
+    print(f"⚡ Throughput:        {report.pages_per_second:.1f} pages/sec")
+    print(f"⏱️  Fetch latency:     p50 {report.fetch_latency_p50_ms:.1f}ms, p99 {report.fetch_latency_p99_ms:.1f}ms")
+    print(f"💾 DB writes:         {report.products_written} ({report.db_writes_per_second:.0f} rows/sec)")
+    print(f"📊 Status codes:      {report.status_counts}")
+    if report.errors:
+        print(f"⚠️  {len(report.errors)} collection errors")
+
+if __name__ == "__main__":
+    main()
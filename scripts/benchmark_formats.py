@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark JSON and MessagePack API responses.
+Compares body size and encode time of product lists and price history
+for the default jsonify path and Accept: application/msgpack.
+"""
+
+import sys
+import time
+import gzip
+import random
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add repository root to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from flask import Flask, jsonify
+
+from src.main.python.models.product import Product, PriceHistory, BrandType, StockStatus
+from src.main.python.utils.json_stream import stream_json_response
+from src.main.python.utils.msgpack_format import (
+    history_columns, init_msgpack, msgpack, msgpack_response, stream_api_response
+)
+
+JSON = {'Accept': 'application/json'}
+MSGPACK = {'Accept': 'application/msgpack'}
+
+def make_products(count: int) -> list:
+    """Synthetic products shaped like collector output."""
+    rng = random.Random(0)
+    now = datetime.now()
+    return [
+        Product(
+            id=f"bench_{i:07d}",
+            name=f"Bench Product {i}",
+            brand=BrandType.POKEMON if i % 2 else BrandType.POP_MART,
+            source="Bench Store",
+            purchase_link=f"https://example.com/products/{i}",
+            price=round(rng.uniform(5, 150), 2),
+            original_price=round(rng.uniform(150, 200), 2) if i % 3 == 0 else None,
+            stock_level=rng.randint(0, 100),
+            stock_status=StockStatus.IN_STOCK,
+            image_url=f"/static/images/bench_{i}.jpg",
+            category="box",
+            tags=["bench", "synthetic"],
+            last_updated=now - timedelta(minutes=i),
+            metadata={"sku": f"SKU{i:07d}"}
+        )
+        for i in range(count)
+    ]
+
+def make_history(count: int) -> list:
+    """Synthetic hourly price history of one product."""
+    rng = random.Random(1)
+    start = datetime.now() - timedelta(hours=count)
+    return [
+        PriceHistory("bench_0000001", round(rng.uniform(5, 150), 2), start + timedelta(hours=i), "Bench Store")
+        for i in range(count)
+    ]
+
+def body(response) -> bytes:
+    """Full body of a buffered or streamed response."""
+    return b''.join(response.response)
+
+def timed(label: str, app: Flask, headers: dict, func, repeat: int = 5) -> bytes:
+    """Print the best-of-N time and body size of a response factory."""
+    best = float('inf')
+    data = b''
+    for _ in range(repeat):
+        with app.test_request_context(headers=headers):
+            started = time.perf_counter()
+            data = body(func())
+            best = min(best, time.perf_counter() - started)
+    print(f"  {label:<34} {best * 1000:8.2f} ms  {len(data) / 1024:9.1f} KB  "
+          f"{len(gzip.compress(data, 6)) / 1024:8.1f} KB gzip")
+    return data
+
+def main():
+    """Run format benchmarks."""
+    parser = argparse.ArgumentParser(description="Response format benchmarks")
+    parser.add_argument('--products', type=int, default=100)
+    parser.add_argument('--history', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    if msgpack is None:
+        sys.exit("msgpack is not installed: pip install msgpack")
+    
+    app = Flask(__name__)
+    init_msgpack(app)
+    products = make_products(args.products)
+    history = make_history(args.history)
+    
+    print(f"⏱️  {args.products} products, envelope as served by /api/products (best of {args.repeat}):")
+    timed("jsonify", app, JSON, lambda: jsonify({'success': True, 'data': [p.to_dict() for p in products]}),
+          args.repeat)
+    timed("streamed JSON", app, JSON, lambda: stream_json_response(p.to_dict() for p in products), args.repeat)
+    timed("msgpack", app, MSGPACK, lambda: stream_api_response(products), args.repeat)
+    
+    print(f"⏱️  {args.history} price points, as served by /api/products/<id>/history:")
+    timed("jsonify, one object per point", app, JSON,
+          lambda: jsonify({'success': True, 'data': [h.to_dict() for h in history]}), args.repeat)
+    timed("msgpack, one map per point", app, MSGPACK,
+          lambda: msgpack_response({'success': True, 'data': [h.to_dict() for h in history]}), args.repeat)
+    timed("jsonify, columnar", app, JSON,
+          lambda: jsonify({'success': True, 'data': history_columns(history)}), args.repeat)
+    timed("msgpack, columnar", app, MSGPACK,
+          lambda: msgpack_response({'success': True, 'data': history_columns(history)}), args.repeat)
+
+if __name__ == "__main__":
+    main()
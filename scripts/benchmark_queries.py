@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark catalog queries against a large synthetic database.
+Useful for checking query plans and latency at production scale.
+"""
+
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add repository root to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.main.python.core.database import DatabaseManager
+from src.main.python.models.product import BrandType
+
+def populate(db: DatabaseManager, products: int, history: int, days: int):
+    """Bulk insert synthetic products and price history."""
+    rng = random.Random(0)
+    now = datetime.now()
+    statuses = ['in_stock', 'low_stock', 'out_of_stock', 'discontinued']
+    
+    product_rows = []
+    for i in range(products):
+        brand = 'pop_mart' if i % 2 else 'pokemon'
+        stock = rng.randint(0, 100)
+        product_rows.append((
+            f"bench_{i:07d}", f"Bench Product {i}", brand, "Bench Store",
+            f"https://example.com/{i}", round(rng.uniform(5, 150), 2), None,
+            stock, statuses[0] if stock > 5 else rng.choice(statuses[1:]),
+            "/static/images/bench.jpg", None, None, "box", '[]',
+            (now - timedelta(minutes=i)).isoformat(), '{}'
+        ))
+    db.connection.executemany(
+        'INSERT OR REPLACE INTO products (id, name, brand, source, purchase_link, price, original_price, '
+        'stock_level, stock_status, image_url, video_url, description, category, tags, last_updated, metadata) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        product_rows
+    )
+    
+    batch = []
+    for i in range(history):
+        timestamp = now - timedelta(seconds=rng.randint(0, days * 86400))
+        batch.append((f"bench_{rng.randrange(products):07d}", round(rng.uniform(5, 150), 2), timestamp.isoformat()))
+        if len(batch) >= 100000:
+            db.connection.executemany(
+                'INSERT INTO price_history (product_id, price, timestamp) VALUES (?, ?, ?)', batch
+            )
+            batch = []
+    if batch:
+        db.connection.executemany('INSERT INTO price_history (product_id, price, timestamp) VALUES (?, ?, ?)', batch)
+    db.connection.commit()
+    db.connection.execute('ANALYZE')
+
+def timed(label: str, func, repeat: int = 5):
+    """Print the best-of-N runtime of a query function."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    print(f"  {label:<40} {best * 1000:8.2f} ms  ({len(result)} rows)")
+
+def main():
+    """Run query benchmarks."""
+    parser = argparse.ArgumentParser(description="Catalog query benchmarks")
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--history', type=int, default=1000000)
+    parser.add_argument('--history-days', type=int, default=365)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = DatabaseManager(str(Path(tmp_dir) / "bench.db"))
+        
+        print(f"🏗️  Populating {args.products} products and {args.history} price points...")
+        started = time.perf_counter()
+        populate(db, args.products, args.history, args.history_days)
+        print(f"   done in {time.perf_counter() - started:.1f}s")
+        
+        since = datetime.now() - timedelta(days=7)
+        print("⏱️  Queries (best of 5):")
+        timed("low stock (threshold 5)", lambda: db.get_low_stock_products(5))
+        timed("low stock, pokemon, page 3", lambda: db.get_low_stock_products(5, BrandType.POKEMON, page=3))
+        timed("price drops (7 days)", lambda: db.get_price_drop_products(since))
+        timed("price drops (7 days), pop_mart", lambda: db.get_price_drop_products(since, BrandType.POP_MART))
+        timed("single product history", lambda: db.get_price_history("bench_0000042"))
+        
+        db.close()
+
+if __name__ == "__main__":
+    main()
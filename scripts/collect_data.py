@@ -5,27 +5,46 @@ Can be run manually or scheduled via cron.
 """
 
 import sys
+import argparse
 import logging
 from pathlib import Path
 
-# Add src to Python path
-sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "main" / "python"))
+# Import the app as a package so its relative imports resolve
+sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from services.data_collector import DataCollectionManager
-from core.database import DatabaseManager
+from src.main.python.services.data_collector import DataCollectionManager
+from src.main.python.core.database import DatabaseManager
+from src.main.python.core.response_store import ResponseStore
+from src.main.python.utils.metrics import MetricsRegistry, fetch_hook, instrument_database
 
 def main():
     """Run data collection."""
+    parser = argparse.ArgumentParser(description="Collect product data from retailers")
+    parser.add_argument('--store', help="Directory for archiving raw response bodies")
+    parser.add_argument('--replay', action='store_true',
+                        help="Re-parse bodies from --store without network access")
+    parser.add_argument('--metrics-file',
+                        help="Write fetch and query metrics here in Prometheus text format")
+    args = parser.parse_args()
+    if args.replay and not args.store:
+        parser.error("--replay requires --store")
+    
     logging.basicConfig(
         level=logging.INFO,
         format='%(asctime)s - %(levelname)s - %(message)s'
     )
     
-    print("🔄 Starting data collection...")
+    print("🔁 Replaying stored responses..." if args.replay else "🔄 Starting data collection...")
     
     # Initialize database and collector
     db_manager = DatabaseManager()
-    collector = DataCollectionManager(db_manager)
+    store = ResponseStore(args.store) if args.store else None
+    collector = DataCollectionManager(db_manager, response_store=store, replay=args.replay)
+    metrics = MetricsRegistry()
+    if args.metrics_file:
+        instrument_database(db_manager, metrics)
+        for brand_collector in collector.collectors:
+            brand_collector.fetch_hooks.append(fetch_hook(metrics, brand_collector.brand.value))
     
     # Run collection
     results = collector.run_collection()
@@ -45,6 +64,12 @@ def main():
         for error in results['errors']:
             print(f"    {error}")
     
+    if args.metrics_file:
+        # e.g. for the node_exporter textfile collector; renamed so it is never read half-written
+        temp_path = Path(args.metrics_file).with_suffix('.tmp')
+        temp_path.write_text(metrics.render())
+        temp_path.replace(args.metrics_file)
+    
     db_manager.close()
 
 if __name__ == "__main__":
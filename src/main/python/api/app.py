@@ -3,17 +3,125 @@ Flask application for aistocktrack API and web interface.
 Provides unified backend with brand-specific frontend rendering.
 """
 
-from flask import Flask, render_template, jsonify, request, redirect, url_for
+from flask import Flask, Response, g, render_template, jsonify, request, redirect, url_for, make_response
+from markupsafe import Markup
 from flask_cors import CORS
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Mapping, Tuple
+import hashlib
 import json
 import os
-from datetime import datetime
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from pathlib import Path
 
-from ..models.product import Product, BrandType, StockStatus
-from ..models.brand_config import get_brand_config
-from ..services.product_service import ProductService
+from ..models.product import Product, BrandType, StockStatus, parse_product_fields
+from ..models.brand_config import get_brand_config, compile_brand_themes
+from ..services.product_service import (
+    ProductService, MAX_INGEST_LINE_BYTES, PRODUCT_EXPORT_COLUMNS, PRICE_HISTORY_EXPORT_COLUMNS
+)
+from ..services.canonicalizer import ProductCanonicalizer
+from ..services.related_products import RelatedProductsIndex
+from ..services.change_feed import ChangeBroker, StreamLimitReached
 from ..core.database import DatabaseManager
+from ..core.cache import ProductCache, PageCache, ProductJsonCache
+from ..utils.compression import init_compression
+from ..utils.json_stream import iter_lines
+from ..utils.msgpack_format import history_columns, init_msgpack, msgpack_response, stream_api_response, wants_msgpack
+from ..utils.export import export_response
+from ..utils.downsampling import downsample_history
+from ..utils.profiling import init_profiling
+from ..utils.metrics import (
+    MetricsRegistry, PROMETHEUS_MIMETYPE, cache_collector, init_metrics, instrument_database
+)
+
+# The product page chart is a few hundred pixels wide; more points than this can't be seen
+CHART_MAX_POINTS = 300
+
+
+def _template_fingerprint(app: Flask) -> str:
+    """Short hash of template files, so rendered pages change with a deploy."""
+    digest = hashlib.sha1()
+    template_dir = Path(app.root_path) / (app.template_folder or 'templates')
+    for path in sorted(template_dir.rglob('*')):
+        if path.is_file():
+            digest.update(path.name.encode('utf-8'))
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:8]
+
+
+def _page_args(default_per_page: int = 50, max_per_page: int = 100) -> Tuple[int, int]:
+    """
+    Validated page and per_page query parameters.
+    
+    Both must be at least 1: SQLite treats a negative LIMIT as no limit, and
+    page 0 would give a negative offset. per_page is capped at max_per_page.
+    """
+    page = int(request.args.get('page', 1))
+    per_page = int(request.args.get('per_page', default_per_page))
+    if page < 1 or per_page < 1:
+        raise ValueError("page and per_page must be at least 1")
+    return page, min(per_page, max_per_page)
+
+
+def init_change_polling(app: Flask, db_manager: DatabaseManager, interval: float):
+    """
+    Pass writes committed by other processes to the change listeners.
+    
+    Other gunicorn workers and the collector write to the same database
+    file, and listeners such as the page cache, the related-products index
+    and the change feed otherwise only hear about this process's writes. A
+    daemon thread calls ``poll_external_changes`` every interval seconds.
+    It is started by the first request rather than here, so a preloading
+    server never forks while it holds the database lock; threads don't
+    survive fork() anyway. An in-memory database or an interval of 0
+    disables polling.
+    """
+    if interval <= 0 or db_manager.db_path == ":memory:":
+        return
+    lock = threading.Lock()
+    poller: Optional[threading.Thread] = None
+    
+    def poll():
+        while True:
+            time.sleep(interval)
+            try:
+                db_manager.poll_external_changes()
+            except sqlite3.ProgrammingError:
+                return  # The database was closed
+            except Exception as e:
+                app.logger.error(f"Polling for external changes failed: {e}")
+    
+    @app.before_request
+    def start_change_polling():
+        nonlocal poller
+        if poller is not None and poller.is_alive():
+            return
+        with lock:
+            if poller is None or not poller.is_alive():
+                poller = threading.Thread(target=poll, name='change-poller', daemon=True)
+                poller.start()
+
+
+def reset_after_fork(app: Flask):
+    """
+    Prepare an app created before fork() to serve in the child process.
+    
+    Opens the child's own database connection, drops cached products, pages
+    and JSON, which may predate writes made by other workers since the app
+    was created, and restarts the change feed's event ids. Metrics recorded
+    while creating the app are dropped, so workers sharing a metrics
+    directory don't each report them. The related-products index is kept:
+    the child's first poll for external changes replays every write since
+    the app was created into it.
+    """
+    app.extensions['database'].reconnect()
+    for name in ('product_cache', 'page_cache', 'product_json'):
+        app.extensions[name].clear()
+    app.extensions['change_broker'].reset()
+    app.extensions['metrics'].reset()
 
 
 def create_app(config_name: str = 'development') -> Flask:
@@ -24,20 +132,167 @@ def create_app(config_name: str = 'development') -> Flask:
     
     # Enable CORS for API endpoints
     CORS(app, resources={r"/api/*": {"origins": "*"}})
+    init_compression(app, min_size=int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)))
+    init_msgpack(app)
+    metrics = MetricsRegistry(multiprocess_dir=os.environ.get('METRICS_DIR'))
+    init_metrics(app, metrics)
+    app.extensions['metrics'] = metrics
+    init_profiling(
+        app,
+        profile_dir=os.environ.get('PROFILE_DIR', 'profiles'),
+        secret=os.environ.get('PROFILE_SECRET'),
+        sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+        mode=os.environ.get('PROFILE_MODE', 'cprofile')
+    )
     
     # Initialize services
-    db_manager = DatabaseManager()
-    product_service = ProductService(db_manager)
+    db_manager = DatabaseManager(os.environ.get('DATABASE_PATH'))
+    app.extensions['database'] = db_manager
+    instrument_database(db_manager, metrics)
+    related_index = RelatedProductsIndex(db_manager, background=True).build()
+    db_manager.add_change_listener(related_index.on_product_change)
+    product_cache = ProductCache(
+        db_manager,
+        max_bytes=int(os.environ.get('PRODUCT_CACHE_MAX_MB', 64)) * 1024 * 1024,
+        list_ttl=float(os.environ.get('PRODUCT_CACHE_TTL', 30))
+    )
+    db_manager.add_change_listener(product_cache.on_product_change)
+    app.extensions['product_cache'] = product_cache
+    canonicalizer = ProductCanonicalizer(db_manager)
+    product_service = ProductService(
+        db_manager, related_index=related_index, cache=product_cache, canonicalizer=canonicalizer
+    )
+    page_cache = PageCache(max_bytes=int(os.environ.get('PAGE_CACHE_MAX_MB', 16)) * 1024 * 1024)
+    db_manager.add_change_listener(page_cache.on_product_change)
+    app.extensions['page_cache'] = page_cache
+    product_json = ProductJsonCache(max_bytes=int(os.environ.get('PRODUCT_JSON_CACHE_MAX_MB', 16)) * 1024 * 1024)
+    db_manager.add_change_listener(product_json.on_product_change)
+    app.extensions['product_json'] = product_json
+    change_broker = ChangeBroker(
+        product_service.get_product_by_id,
+        heartbeat=float(os.environ.get('STREAM_HEARTBEAT', 15)),
+        # Each open stream holds a worker thread; leave the rest for ordinary requests
+        max_subscribers=int(os.environ.get('STREAM_MAX_CLIENTS', 4)) or None
+    )
+    db_manager.add_change_listener(change_broker.on_product_change)
+    app.extensions['change_broker'] = change_broker
+    init_change_polling(app, db_manager, float(os.environ.get('CHANGE_POLL_INTERVAL', 1)))
+    metrics.add_collector(cache_collector({
+        'products': product_cache.stats,
+        'pages': page_cache.stats,
+        'product_json': product_json.stats,
+    }))
+    canonicalizer.backfill()
+    related_index.flush()  # Warm before serving, and idle if a server forks workers from here
+    
+    # Validators change with the catalog version and, for pages, the templates
+    template_token = _template_fingerprint(app)
+    
+    def conditional(view=None, daily: bool = False):
+        """
+        Answer unchanged requests with 304 before running the view.
+        
+        Views over a price history window that ends today pass daily=True:
+        the window moves at midnight without a catalog write, so the date
+        is part of their validators.
+        """
+        if view is None:
+            return lambda view: conditional(view, daily)
+        
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version, modified_at = product_service.get_catalog_version()
+            etag = f"{template_token}-{version}"
+            if daily:
+                today = datetime.now().date()
+                etag += f"-{today.isoformat()}"
+                modified_at = max(modified_at, datetime.combine(today, datetime.min.time()).timestamp())
+            etag += '-msgpack' if wants_msgpack() else ''
+            last_modified = datetime.fromtimestamp(int(modified_at), tz=timezone.utc)
+            # Last-Modified has whole-second resolution: until the second of the last
+            # write is over, another write could land in it without changing the date
+            settled = time.time() >= int(modified_at) + 1
+            
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = settled and since is not None and last_modified <= since
+            
+            if not_modified:
+                response = app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            
+            # Weak because compression may change the bytes of the same representation
+            response.set_etag(etag, weak=True)
+            if settled:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'public, no-cache'
+            return response
+        return wrapper
+    
+    def cached_page(view=None, daily: bool = False):
+        """Serve a rendered page from the page cache for the current catalog version, and date if daily."""
+        if view is None:
+            return lambda view: cached_page(view, daily)
+        
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if g.get('profiler') is not None:
+                return view(*args, **kwargs)  # Profile the rendering, not a cache hit
+            version, _ = product_service.get_catalog_version()
+            key = (
+                request.endpoint,
+                tuple(sorted(kwargs.items())),
+                tuple(sorted(request.args.items(multi=True))),
+                version,
+                datetime.now().date() if daily else None
+            )
+            return page_cache.get_page(key, lambda: view(*args, **kwargs))
+        return wrapper
+    
+    # Brand stylesheets and theme dicts are built once per process
+    brand_themes = compile_brand_themes(app.static_folder)
+    
+    @app.after_request
+    def cache_theme_stylesheets(response):
+        """Let browsers keep fingerprinted theme stylesheets indefinitely."""
+        if request.path.startswith('/static/themes/') and response.status_code == 200:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = 31536000
+            response.cache_control.immutable = True
+        return response
     
     # Template globals for brand theming
     @app.template_global()
-    def get_brand_theme(brand_type: str) -> Dict[str, Any]:
-        """Get brand configuration for template rendering."""
+    def get_brand_theme(brand_type: str) -> Mapping[str, Any]:
+        """Get the precomputed, read-only brand theme for template rendering."""
         try:
-            brand_enum = BrandType(brand_type)
-            return get_brand_config(brand_enum).to_dict()
+            return brand_themes[BrandType(brand_type)].theme
         except ValueError:
-            return get_brand_config(BrandType.POP_MART).to_dict()
+            return brand_themes[BrandType.POP_MART].theme
+    
+    @app.template_global()
+    def product_card(variant: str, product: Dict[str, Any], brand_type: str) -> Markup:
+        """Render a product card, reusing it until the product changes."""
+        key = (variant, brand_type, product['id'], product['last_updated'])
+        return page_cache.get_fragment(key, lambda: Markup(render_template(
+            f'cards/{variant}_card.html', product=product, brand_type=brand_type
+        )))
+    
+    # Jinja has no max/min builtins; pagination uses them
+    app.jinja_env.globals.update(max=max, min=min)
+    
+    @app.template_filter('datetime')
+    def datetime_filter(value: Any, fmt: str = '%Y-%m-%d %H:%M') -> str:
+        """Format a datetime or ISO timestamp string."""
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        return value.strftime(fmt)
     
     @app.template_filter('currency')
     def currency_filter(value: float) -> str:
@@ -62,6 +317,8 @@ def create_app(config_name: str = 'development') -> Flask:
         return render_template('index.html')
     
     @app.route('/<brand_type>')
+    @conditional
+    @cached_page
     def brand_home(brand_type: str):
         """Brand-specific homepage."""
         try:
@@ -71,12 +328,14 @@ def create_app(config_name: str = 'development') -> Flask:
                 'brand_home.html',
                 brand_type=brand_type,
                 products=[p.to_dict() for p in products],
-                featured_products=products[:4]
+                featured_products=[p.to_dict() for p in product_service.get_featured_products(brand_enum, limit=4)]
             )
         except ValueError:
             return redirect(url_for('index'))
     
     @app.route('/<brand_type>/products')
+    @conditional
+    @cached_page
     def brand_products(brand_type: str):
         """Brand-specific product listing page."""
         try:
@@ -86,8 +345,7 @@ def create_app(config_name: str = 'development') -> Flask:
             category = request.args.get('category')
             search = request.args.get('search', '').strip()
             sort_by = request.args.get('sort', 'name')
-            page = int(request.args.get('page', 1))
-            per_page = int(request.args.get('per_page', 24))
+            page, per_page = _page_args(default_per_page=24)
             
             # Get filtered products
             products = product_service.search_products(
@@ -116,6 +374,8 @@ def create_app(config_name: str = 'development') -> Flask:
             return redirect(url_for('index'))
     
     @app.route('/<brand_type>/product/<product_id>')
+    @conditional(daily=True)
+    @cached_page(daily=True)
     def product_detail(brand_type: str, product_id: str):
         """Individual product detail page."""
         try:
@@ -125,8 +385,9 @@ def create_app(config_name: str = 'development') -> Flask:
             if not product or product.brand != brand_enum:
                 return redirect(url_for('brand_products', brand_type=brand_type))
             
-            # Get price history
+            # Get price history; the chart gets a downsampled copy sized to its width
             price_history = product_service.get_price_history(product_id)
+            chart_history = downsample_history(price_history, CHART_MAX_POINTS)
             
             # Get related products
             related_products = product_service.get_related_products(
@@ -138,6 +399,7 @@ def create_app(config_name: str = 'development') -> Flask:
                 brand_type=brand_type,
                 product=product.to_dict(),
                 price_history=[ph.to_dict() for ph in price_history],
+                chart_history=[ph.to_dict() for ph in chart_history],
                 related_products=[p.to_dict() for p in related_products]
             )
         except ValueError:
@@ -145,6 +407,7 @@ def create_app(config_name: str = 'development') -> Flask:
     
     # API Routes - Unified backend interface
     @app.route('/api/products')
+    @conditional
     def api_products():
         """Get products with filtering and pagination."""
         try:
@@ -153,8 +416,8 @@ def create_app(config_name: str = 'development') -> Flask:
             category = request.args.get('category')
             search = request.args.get('search', '').strip()
             sort_by = request.args.get('sort', 'name')
-            page = int(request.args.get('page', 1))
-            per_page = min(int(request.args.get('per_page', 50)), 100)  # Limit max per_page
+            page, per_page = _page_args()
+            fields = parse_product_fields(request.args.get('fields'))
             
             brand_enum = BrandType(brand) if brand else None
             
@@ -164,44 +427,277 @@ def create_app(config_name: str = 'development') -> Flask:
                 search_term=search,
                 sort_by=sort_by,
                 page=page,
-                per_page=per_page
+                per_page=per_page,
+                fields=fields
+            )
+            
+            return stream_api_response(
+                products,
+                encode=product_json.encode if fields is None else None,
+                fields={
+                    'pagination': {
+                        'page': page,
+                        'per_page': per_page,
+                        'total': len(products)  # In a real app, get total count
+                    }
+                }
+            )
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    
+    @app.route('/api/products/low-stock')
+    def api_low_stock_products():
+        """Get available products at or below a stock threshold."""
+        try:
+            brand = request.args.get('brand')
+            threshold = int(request.args.get('threshold', 5))
+            page, per_page = _page_args()
+            fields = parse_product_fields(request.args.get('fields'))
+            
+            brand_enum = BrandType(brand) if brand else None
+            products = product_service.get_low_stock_products(
+                threshold=threshold, brand=brand_enum, page=page, per_page=per_page, fields=fields
             )
             
+            return stream_api_response(
+                products,
+                encode=product_json.encode if fields is None else None,
+                fields={
+                    'pagination': {
+                        'page': page,
+                        'per_page': per_page,
+                        'total': len(products)
+                    }
+                }
+            )
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    
+    @app.route('/api/products/price-drops')
+    def api_price_drop_products():
+        """Get products whose price dropped within the last days."""
+        try:
+            brand = request.args.get('brand')
+            days = int(request.args.get('days', 7))
+            page, per_page = _page_args()
+            fields = parse_product_fields(request.args.get('fields'))
+            
+            brand_enum = BrandType(brand) if brand else None
+            products = product_service.get_price_drop_products(
+                days=days, brand=brand_enum, page=page, per_page=per_page, fields=fields
+            )
+            
+            return stream_api_response(
+                products,
+                encode=product_json.encode if fields is None else None,
+                fields={
+                    'pagination': {
+                        'page': page,
+                        'per_page': per_page,
+                        'total': len(products)
+                    }
+                }
+            )
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    
+    @app.route('/api/products/bulk', methods=['POST'])
+    def api_bulk_ingest_products():
+        """Upsert products streamed as NDJSON, one product per line."""
+        try:
+            summary = product_service.ingest_products(
+                iter_lines(request.stream, max_line_bytes=MAX_INGEST_LINE_BYTES),
+                source=request.args.get('source')
+            )
             return jsonify({
                 'success': True,
-                'data': [p.to_dict() for p in products],
-                'pagination': {
-                    'page': page,
-                    'per_page': per_page,
-                    'total': len(products)  # In a real app, get total count
-                }
+                'data': summary
             })
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 400
     
+    @app.route('/api/products/changes')
+    def api_product_changes():
+        """Get products changed or deleted since a cursor."""
+        try:
+            since = int(request.args.get('since', 0))
+            limit = int(request.args.get('limit', 500))
+            changes = product_service.get_changes_since(since, limit)
+            
+            return stream_api_response(
+                changes.products,
+                encode=product_json.encode,
+                fields={
+                    'cursor': changes.cursor,
+                    'has_more': changes.has_more,
+                    'deleted': changes.deleted_ids
+                }
+            )
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    
     @app.route('/api/products/<product_id>')
+    @conditional
     def api_product_detail(product_id: str):
         """Get single product details."""
         try:
+            fields = parse_product_fields(request.args.get('fields'))
             product = product_service.get_product_by_id(product_id)
             if not product:
                 return jsonify({'success': False, 'error': 'Product not found'}), 404
             
             return jsonify({
                 'success': True,
-                'data': product.to_dict()
+                'data': product.to_dict(fields)
             })
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 400
     
     @app.route('/api/products/<product_id>/history')
+    @conditional(daily=True)
     def api_price_history(product_id: str):
         """Get product price history."""
         try:
-            history = product_service.get_price_history(product_id)
+            max_points = request.args.get('max_points')
+            history = product_service.get_price_history(
+                product_id, max_points=int(max_points) if max_points else None
+            )
+            if wants_msgpack():
+                return msgpack_response({'success': True, 'data': history_columns(history)})
+            return stream_api_response(h.to_dict() for h in history)
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    
+    @app.route('/api/history')
+    @conditional(daily=True)
+    def api_price_histories():
+        """Get price history of several products, grouped by product id."""
+        try:
+            ids = request.args.get('ids', '')
+            max_points = request.args.get('max_points')
+            histories = product_service.get_price_histories(
+                [i for i in ids.split(',') if i],
+                days=int(request.args.get('days', 30)),
+                resolution=request.args.get('resolution') or None,
+                max_points=int(max_points) if max_points else None
+            )
+            if wants_msgpack():
+                return msgpack_response({
+                    'success': True,
+                    'data': {product_id: history_columns(history) for product_id, history in histories.items()}
+                })
+            return jsonify({
+                'success': True,
+                'data': {
+                    product_id: [point.to_dict() for point in history]
+                    for product_id, history in histories.items()
+                }
+            })
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    
+    @app.route('/api/stream')
+    def api_stream():
+        """Stream stock and price changes as Server-Sent Events."""
+        try:
+            brand = request.args.get('brand')
+            ids = request.args.get('ids')
+            last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+            
+            brand_value = BrandType(brand).value if brand else None
+            product_ids = {i for i in ids.split(',') if i} if ids else None
+            resume_from = int(last_event_id) if last_event_id else None
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        try:
+            stream = change_broker.listen(resume_from, brand=brand_value, product_ids=product_ids)
+        except StreamLimitReached as e:
+            # Streams hold a thread each; clients over the cap poll the change cursor from here instead
+            response = jsonify({
+                'success': False,
+                'error': str(e),
+                'changes': url_for('api_product_changes', since=product_service.get_changes_since(0, 0).cursor)
+            })
+            response.status_code = 503
+            response.headers['Retry-After'] = '30'
+            return response
+        
+        response = Response(stream, mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering events
+        return response
+    
+    @app.route('/api/export/products')
+    def api_export_products():
+        """Stream every matching product as NDJSON or CSV."""
+        try:
+            brand = request.args.get('brand')
+            brand_enum = BrandType(brand) if brand else None
+            
+            records = product_service.export_products(
+                brand=brand_enum,
+                category=request.args.get('category'),
+                search_term=request.args.get('search')
+            )
+            return export_response(
+                records, request.args.get('format', 'ndjson'), PRODUCT_EXPORT_COLUMNS, 'products'
+            )
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    
+    @app.route('/api/export/price-history')
+    def api_export_price_history():
+        """Stream price history of some or all products as NDJSON or CSV."""
+        try:
+            ids = request.args.get('ids')
+            days = request.args.get('days')
+            
+            records = product_service.export_price_history(
+                product_ids=[i for i in ids.split(',') if i] if ids else None,
+                days=int(days) if days else None
+            )
+            return export_response(
+                records, request.args.get('format', 'ndjson'), PRICE_HISTORY_EXPORT_COLUMNS, 'price-history'
+            )
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    
+    @app.route('/api/canonical-products')
+    def api_canonical_products():
+        """Get the best current offer per canonical product."""
+        try:
+            brand = request.args.get('brand')
+            page, per_page = _page_args()
+            
+            brand_enum = BrandType(brand) if brand else None
+            listings = product_service.get_canonical_listings(
+                brand=brand_enum, page=page, per_page=per_page
+            )
+            
             return jsonify({
                 'success': True,
-                'data': [h.to_dict() for h in history]
+                'data': [listing.to_dict() for listing in listings],
+                'pagination': {
+                    'page': page,
+                    'per_page': per_page,
+                    'total': len(listings)
+                }
+            })
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    
+    @app.route('/api/canonical-products/<canonical_id>/offers')
+    def api_canonical_offers(canonical_id: str):
+        """Get all retailer offers for a canonical product."""
+        try:
+            offers = product_service.get_canonical_offers(canonical_id)
+            if not offers:
+                return jsonify({'success': False, 'error': 'Canonical product not found'}), 404
+            
+            return jsonify({
+                'success': True,
+                'data': [p.to_dict() for p in offers]
             })
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 400
@@ -244,6 +740,45 @@ def create_app(config_name: str = 'development') -> Flask:
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 400
     
+    @app.route('/api/stats')
+    def api_stats():
+        """Get catalog statistics, optionally for one brand."""
+        try:
+            brand = request.args.get('brand')
+            brand_enum = BrandType(brand) if brand else None
+            
+            return jsonify({
+                'success': True,
+                'data': product_service.get_statistics(brand_enum)
+            })
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    
+    @app.route('/api/products/bulk-update', methods=['POST'])
+    def api_bulk_update_products():
+        """Apply stock and price changes to many products in one transaction."""
+        try:
+            data = request.get_json()
+            updates = data.get('updates') if isinstance(data, dict) else None
+            
+            if not isinstance(updates, list):
+                return jsonify({
+                    'success': False,
+                    'error': 'updates must be a list'
+                }), 400
+            
+            results = product_service.bulk_update_products(updates)
+            
+            return jsonify({
+                'success': True,
+                'data': {
+                    'updated': sum(1 for r in results if r['status'] == 'updated'),
+                    'results': results
+                }
+            })
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    
     @app.route('/api/stock-alerts', methods=['POST'])
     def api_create_stock_alert():
         """Create a stock alert for a product."""
@@ -281,6 +816,11 @@ def create_app(config_name: str = 'development') -> Flask:
             'version': '1.0.0'
         })
     
+    @app.route('/api/metrics')
+    def api_metrics():
+        """Request, query, fetch and cache metrics in Prometheus text format."""
+        return Response(metrics.render(), content_type=PROMETHEUS_MIMETYPE)
+    
     # Error handlers
     @app.errorhandler(404)
     def not_found(error):
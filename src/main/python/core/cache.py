@@ -0,0 +1,425 @@
+"""
+In-process caches for catalog reads.
+Provides an LRU cache and a TTL cache with hit/miss/eviction counters and a memory cap.
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields, is_dataclass
+from enum import Enum
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+from ..models.product import Product
+from .database import DatabaseManager, ProductChange
+
+
+def approximate_size(value: Any, _depth: int = 0) -> int:
+    """
+    Approximate the memory held by a value in bytes.
+    
+    Walks containers and dataclasses a few levels deep, which is enough for
+    products and lists of products without the cost of an exact measure.
+    """
+    size = sys.getsizeof(value)
+    if _depth > 4 or isinstance(value, (str, bytes, int, float, bool, Enum)) or value is None:
+        return size
+    if isinstance(value, dict):
+        return size + sum(
+            approximate_size(k, _depth + 1) + approximate_size(v, _depth + 1) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(approximate_size(item, _depth + 1) for item in value)
+    if is_dataclass(value):
+        return size + sum(approximate_size(getattr(value, f.name), _depth + 1) for f in fields(value))
+    return size
+
+
+@dataclass
+class CacheStats:
+    """Counters for one cache."""
+    
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0  # Entries dropped for size or age
+    invalidations: int = 0  # Entries dropped because their data changed
+    
+    def to_dict(self) -> Dict[str, int]:
+        """Convert to dictionary for serialization."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by entry count and bytes.
+    
+    Entry sizes come from approximate_size unless a sizeof callable is given.
+    on_evict is called with the key and value of each entry dropped for
+    size or age, including a value too large to be stored, after the
+    cache's lock is released.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = approximate_size,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.stats = CacheStats()
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, int, float]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    @property
+    def size_bytes(self) -> int:
+        """Approximate bytes held by cached values."""
+        return self._bytes
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value and mark it recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry):
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._remove(key)
+                self.stats.evictions += 1
+            self.stats.misses += 1
+        if entry is not None:
+            self._evicted([(key, entry[0])])
+        return default
+    
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value without touching recency or counters."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return default if entry is None else entry[0]
+    
+    def put(self, key: Hashable, value: Any):
+        """Store a value, evicting least recently used entries over the caps."""
+        size = self.sizeof(value)
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                evicted.append((key, value))  # Never cache a value larger than the whole cache
+            else:
+                self._entries[key] = (value, size, time.monotonic())
+                self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                evicted.append((oldest, self._remove(oldest)))
+                self.stats.evictions += 1
+        self._evicted(evicted)
+    
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Get a cached value, loading and caching it on a miss."""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = loader()
+            self.put(key, value)
+        return value
+    
+    def invalidate(self, key: Hashable) -> bool:
+        """Drop one entry because its data changed."""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            self.stats.invalidations += 1
+            return True
+    
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches the predicate."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            self.stats.invalidations += len(keys)
+            return len(keys)
+    
+    def clear(self):
+        """Drop every entry."""
+        self.invalidate_where(lambda key: True)
+    
+    def _expired(self, entry: Tuple[Any, int, float]) -> bool:
+        """Whether an entry is too old to serve; LRU entries never expire."""
+        return False
+    
+    def _remove(self, key: Hashable) -> Any:
+        """Remove an entry with the lock held and return its value."""
+        value, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        return value
+    
+    def _evicted(self, entries: List[Tuple[Hashable, Any]]):
+        """Pass evicted entries to on_evict, without the lock held."""
+        if self.on_evict is not None:
+            for key, value in entries:
+                self.on_evict(key, value)
+
+
+class TTLCache(LRUCache):
+    """LRU cache whose entries also expire a fixed number of seconds after being stored."""
+    
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int = 256,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = approximate_size
+    ):
+        super().__init__(max_entries=max_entries, max_bytes=max_bytes, sizeof=sizeof)
+        self.ttl = ttl
+    
+    def _expired(self, entry: Tuple[Any, int, float]) -> bool:
+        return time.monotonic() - entry[2] > self.ttl
+
+
+class ProductCache:
+    """
+    Read-through cache for products and product lists.
+    
+    Products are held in an LRU keyed by id; list and search results in a
+    TTL cache keyed by ``(kind, brand, *normalized params)``. Register
+    ``on_product_change`` as a database change listener: a write drops the
+    product's entry and the cached lists of its brand. Commits made through
+    other connections, such as other workers or a separate collector, reach
+    the listener through ``DatabaseManager.poll_external_changes``, so reads
+    don't query the database to check for them.
+    
+    Cached products are shared between callers and must not be mutated.
+    """
+    
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        max_bytes: int = 64 * 1024 * 1024,
+        list_ttl: float = 30.0,
+        max_products: int = 10000,
+        max_lists: int = 512
+    ):
+        """
+        Initialize the cache.
+        
+        Args:
+            db_manager: Database to read through to.
+            max_bytes: Memory cap shared 3:1 between products and lists.
+            list_ttl: Seconds a list result may be served.
+            max_products: Maximum number of cached products.
+            max_lists: Maximum number of cached list results.
+        """
+        self.db = db_manager
+        self.products = LRUCache(max_entries=max_products, max_bytes=max_bytes * 3 // 4)
+        self.lists = TTLCache(list_ttl, max_entries=max_lists, max_bytes=max_bytes // 4)
+        self._lock = threading.Lock()  # Orders invalidations against storing loaded values
+        self._catalog_version: Optional[Tuple[int, float]] = None
+        self._generation = 0  # Bumped on every invalidation
+    
+    def get_product(self, product_id: str) -> Optional[Product]:
+        """Get a product by id."""
+        return self._get_or_load(self.products, product_id, lambda: self.db.get_product_by_id(product_id))
+    
+    def get_products_by_ids(self, product_ids: Sequence[str]) -> List[Product]:
+        """Get several products in the given order, loading misses in one query."""
+        missing = object()
+        cached = {product_id: self.products.get(product_id, missing) for product_id in product_ids}
+        to_load = [product_id for product_id, product in cached.items() if product is missing]
+        if to_load:
+            generation = self._generation
+            loaded = {product.id: product for product in self.db.get_products_by_ids(to_load)}
+            with self._lock:
+                current = generation == self._generation
+                for product_id in to_load:
+                    cached[product_id] = loaded.get(product_id)
+                    if current:
+                        self.products.put(product_id, cached[product_id])  # None too: a known miss
+        return [cached[product_id] for product_id in product_ids if cached[product_id] is not None]
+    
+    def get_list(self, key: Tuple, loader: Callable[[], List[Any]]) -> List[Any]:
+        """Get a list result; key is (kind, brand value or None, *params)."""
+        return list(self._get_or_load(self.lists, key, lambda: tuple(loader())))
+    
+    def get_catalog_version(self) -> Tuple[int, float]:
+        """Catalog version and modification time, read once per change."""
+        version = self._catalog_version
+        if version is None:
+            generation = self._generation
+            version = self.db.get_catalog_version()
+            with self._lock:
+                if generation == self._generation:  # Don't keep a version read before a write
+                    self._catalog_version = version
+        return version
+    
+    def on_product_change(self, change: ProductChange):
+        """Database change listener dropping affected entries."""
+        with self._lock:
+            self._generation += 1
+            self._catalog_version = None
+            previous = self.products.peek(change.product_id)
+            self.products.invalidate(change.product_id)
+            
+            brands = {p.brand.value for p in (previous, change.product) if p is not None}
+            if previous is None and change.product is None:
+                # Without either row we can't tell which brand's lists held it
+                self.lists.clear()
+            else:
+                self.lists.invalidate_where(lambda key: key[1] is None or key[1] in brands)
+    
+    def clear(self):
+        """Drop every cached entry."""
+        with self._lock:
+            self._generation += 1
+            self._catalog_version = None
+            self.products.clear()
+            self.lists.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Counters and sizes for both caches."""
+        return {
+            name: dict(cache.stats.to_dict(), entries=len(cache), bytes=cache.size_bytes)
+            for name, cache in (('products', self.products), ('lists', self.lists))
+        }
+    
+    def _get_or_load(self, cache: LRUCache, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Read through one cache, keeping the result only if nothing was invalidated meanwhile.
+        
+        A read racing a write could otherwise store the old row after
+        on_product_change dropped it, and serve it until the next write. The
+        check and the store, of None for a missing product as well, happen
+        under the lock invalidations take, so neither can fall in between.
+        """
+        missing = object()
+        value = cache.get(key, missing)
+        if value is missing:
+            generation = self._generation
+            value = loader()
+            with self._lock:
+                if generation == self._generation:
+                    cache.put(key, value)
+        return value
+
+
+class PageCache:
+    """
+    Rendered HTML pages and per-product fragments.
+    
+    Page keys include the catalog version, so a page is never served after
+    a write; ``on_product_change`` also clears pages and drops the changed
+    product's fragments so their memory is released right away. Fragment
+    keys are ``(variant, brand, product id, last_updated)``.
+    """
+    
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, max_pages: int = 512, max_fragments: int = 5000):
+        self.pages = LRUCache(max_entries=max_pages, max_bytes=max_bytes // 2, sizeof=len)
+        self.fragments = LRUCache(
+            max_entries=max_fragments, max_bytes=max_bytes // 2, sizeof=len, on_evict=self._forget_fragment
+        )
+        self._fragment_keys: Dict[str, Set[Tuple]] = {}  # Product id to its cached fragment keys
+        self._lock = threading.Lock()  # Guards _fragment_keys
+    
+    def get_page(self, key: Tuple, render: Callable[[], Any]) -> Any:
+        """Get a rendered page; results that aren't HTML strings are passed through uncached."""
+        html = self.pages.get(key)
+        if html is None:
+            html = render()
+            if isinstance(html, str):
+                self.pages.put(key, html)
+        return html
+    
+    def get_fragment(self, key: Tuple, render: Callable[[], str]) -> str:
+        """Get a rendered fragment."""
+        # Indexed before rendering, so a write during the render still finds the key to drop
+        with self._lock:
+            self._fragment_keys.setdefault(key[2], set()).add(key)
+        return self.fragments.get_or_load(key, render)
+    
+    def on_product_change(self, change: ProductChange):
+        """Database change listener dropping stale pages and fragments."""
+        if len(self.pages):
+            self.pages.clear()
+        with self._lock:
+            keys = self._fragment_keys.pop(change.product_id, ())
+        for key in keys:
+            self.fragments.invalidate(key)
+    
+    def clear(self):
+        """Drop every page and fragment."""
+        self.pages.clear()
+        with self._lock:
+            self.fragments.clear()
+            self._fragment_keys.clear()
+    
+    def _forget_fragment(self, key: Tuple, html: str):
+        """Eviction callback removing an evicted fragment's key from the index."""
+        with self._lock:
+            keys = self._fragment_keys.get(key[2])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._fragment_keys[key[2]]
+    
+    def stats(self) -> Dict[str, Any]:
+        """Counters and sizes for pages and fragments."""
+        return {
+            name: dict(cache.stats.to_dict(), entries=len(cache), bytes=cache.size_bytes)
+            for name, cache in (('pages', self.pages), ('fragments', self.fragments))
+        }
+
+
+class ProductJsonCache:
+    """
+    Encoded JSON of products for API responses.
+    
+    Entries are keyed by product id and stamped with ``last_updated``, so a
+    product's bytes are only reused while its row is unchanged; a newer row
+    is simply re-encoded. Register ``on_product_change`` as a database change
+    listener to release a product's bytes as soon as it is written.
+    """
+    
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, max_entries: int = 20000):
+        self.entries = LRUCache(max_entries=max_entries, max_bytes=max_bytes, sizeof=lambda entry: len(entry[1]))
+    
+    def encode(self, product: Product) -> bytes:
+        """JSON bytes of product.to_dict(), from cache when the row is unchanged."""
+        entry = self.entries.get(product.id)
+        if entry is not None and entry[0] == product.last_updated:
+            return entry[1]
+        
+        encoded = json.dumps(product.to_dict()).encode('utf-8')
+        self.entries.put(product.id, (product.last_updated, encoded))
+        return encoded
+    
+    def on_product_change(self, change: ProductChange):
+        """Database change listener dropping the changed product's bytes."""
+        self.entries.invalidate(change.product_id)
+    
+    def clear(self):
+        """Drop every entry."""
+        self.entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Counters and size of the cache."""
+        return dict(self.entries.stats.to_dict(), entries=len(self.entries), bytes=self.entries.size_bytes)
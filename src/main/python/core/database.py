@@ -5,11 +5,87 @@ Handles product data storage and retrieval using SQLite with in-memory fallback.
 
 import sqlite3
 import json
-from typing import List, Optional, Dict, Any
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import List, Optional, Dict, Any, Callable, Iterator, Sequence, Tuple, Union
 from datetime import datetime
 from pathlib import Path
 
-from ..models.product import Product, BrandType, StockStatus, PriceHistory, StockAlert
+from ..models.product import (
+    Product, BrandType, StockStatus, PriceHistory, StockAlert, CanonicalProduct, CanonicalListing,
+    product_columns
+)
+
+
+# Price history buckets: SQL expressions over the ISO timestamp column
+HISTORY_RESOLUTIONS = {
+    'hour': 'substr(timestamp, 1, 13)',
+    'day': 'substr(timestamp, 1, 10)',
+    'week': "strftime('%Y-%W', timestamp)",
+}
+
+# Featured ranking: up to 3 points for stock depth, 4 for discount and 2 for
+# alert subscribers, stored as a generated column, plus up to
+# FEATURED_FRESHNESS_POINTS for a recent last_updated, fading out over two
+# weeks. Freshness depends on the current time, so it is added at query time.
+FEATURED_SCORE_SQL = '''
+    MIN(stock_level, 50) / 50.0 * 3
+    + CASE WHEN original_price > price AND price > 0
+           THEN (original_price - price) / original_price * 4 ELSE 0 END
+    + MIN(alert_count, 20) / 20.0 * 2
+'''
+FEATURED_FRESHNESS_POINTS = 2
+FEATURED_FRESHNESS_SQL = f'''
+    MAX(0, MIN({FEATURED_FRESHNESS_POINTS},
+        {FEATURED_FRESHNESS_POINTS} - (julianday('now') - COALESCE(julianday(last_updated), 0)) / 7))
+'''
+
+
+@dataclass
+class ProductChange:
+    """Notification that a product row was written."""
+    
+    product_id: str
+    product: Optional[Product] = None  # Full product when the whole row was saved
+    deleted: bool = False
+
+
+@dataclass
+class ProductUpdate:
+    """Targeted stock and/or price change for one product."""
+    
+    product_id: str
+    stock_level: Optional[int] = None
+    stock_status: Optional[StockStatus] = None
+    price: Optional[float] = None
+    source: Optional[str] = None  # Recorded with the price history entry
+    expected_last_updated: Optional[datetime] = None  # Compare-and-set guard
+
+
+@dataclass
+class ProductChangeSet:
+    """Products written and deleted after a change cursor, oldest first."""
+    
+    products: List[Product]
+    deleted_ids: List[str]
+    cursor: int  # Pass as since to read the next page
+    has_more: bool
+
+
+# Outcomes reported by DatabaseManager.apply_product_updates
+UPDATE_APPLIED = 'updated'
+UPDATE_CONFLICT = 'conflict'
+UPDATE_NOT_FOUND = 'not_found'
+
+# Canonical products and (product_id, canonical_id) offers saved with a batch of products
+CanonicalLinks = Tuple[Sequence[CanonicalProduct], Sequence[Tuple[str, str]]]
+
+# Outcomes reported by DatabaseManager.save_products
+SAVE_CREATED = 'created'
+SAVE_UPDATED = 'updated'
+SAVE_UNCHANGED = 'unchanged'
 
 
 class DatabaseManager:
@@ -30,10 +106,16 @@ class DatabaseManager:
             # Ensure directory exists
             Path(db_path).parent.mkdir(parents=True, exist_ok=True)
         
-        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
-        self.connection.row_factory = sqlite3.Row  # Enable dict-like access
+        self.connection = self._connect()
+        self.logger = logging.getLogger(__name__)
+        self._change_listeners: List[Callable[[ProductChange], None]] = []
+        # Held by every write: threads share one connection, so a commit would also commit another writer's open transaction
+        self._write_lock = threading.RLock()
         self._create_tables()
         self._populate_sample_data()  # Add sample data for development
+        # Where poll_external_changes resumes; None data version forces a read
+        self._change_cursor = self.get_change_seq()
+        self._seen_data_version: Optional[int] = self.data_version()
     
     def _create_tables(self):
         """Create database tables if they don't exist."""
@@ -87,14 +169,246 @@ class DatabaseManager:
             )
         ''')
         
+        # Canonical products group listings of the same item across retailers
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS canonical_products (
+                id TEXT PRIMARY KEY,
+                brand TEXT NOT NULL,
+                name TEXT NOT NULL,
+                name_key TEXT NOT NULL,
+                category TEXT,
+                created_at TEXT NOT NULL
+            )
+        ''')
+        
+        # Offers map each retailer listing (product) to its canonical product
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS offers (
+                product_id TEXT PRIMARY KEY,
+                canonical_id TEXT NOT NULL,
+                FOREIGN KEY (product_id) REFERENCES products (id),
+                FOREIGN KEY (canonical_id) REFERENCES canonical_products (id)
+            )
+        ''')
+        
+        # Per-brand aggregates kept current by triggers on products
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_stats (
+                brand TEXT NOT NULL,
+                stock_status TEXT NOT NULL,
+                category TEXT NOT NULL DEFAULT '',  -- '' for uncategorized
+                product_count INTEGER NOT NULL DEFAULT 0,
+                priced_count INTEGER NOT NULL DEFAULT 0,  -- products with price > 0
+                price_sum REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (brand, stock_status, category)
+            )
+        ''')
+        self._create_stats_triggers(cursor)
+        self._create_featured_ranking(cursor)
+        
+        # Single-row counter bumped by every catalog write, for HTTP validators
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL,
+                modified_at REAL NOT NULL  -- Unix time of the last write
+            )
+        ''')
+        cursor.execute('''
+            INSERT INTO catalog_version (id, version, modified_at)
+            SELECT 1, 0, (julianday('now') - 2440587.5) * 86400.0
+            WHERE NOT EXISTS (SELECT 1 FROM catalog_version)
+        ''')
+        self._create_version_triggers(cursor)
+        self._create_change_tracking(cursor)
+        
         # Create indexes for better performance
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_brand ON products (brand)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_category ON products (category)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_stock_status ON products (stock_status)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_price_history_product ON price_history (product_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_price_history_timestamp ON price_history (timestamp)')
+        # Covering index for time-range scans; supersedes the plain timestamp index
+        cursor.execute('DROP INDEX IF EXISTS idx_price_history_timestamp')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_price_history_time ON price_history (timestamp, product_id, price)'
+        )
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_products_low_stock ON products (stock_level)
+            WHERE stock_status != 'out_of_stock'
+        ''')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_price_history_product_time ON price_history (product_id, timestamp, price)'
+        )
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_canonical_brand_key ON canonical_products (brand, name_key)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_offers_canonical ON offers (canonical_id)')
         
         self.connection.commit()
+        
+        # Databases created before catalog_stats existed need a first build
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM catalog_stats)')
+        if not cursor.fetchone()[0]:
+            self.rebuild_catalog_stats()
+    
+    def _create_stats_triggers(self, cursor: sqlite3.Cursor):
+        """Create triggers applying product changes to catalog_stats as deltas."""
+        # INSERT OR IGNORE can't be used here: the conflict policy of the
+        # statement firing a trigger overrides the one inside it
+        def apply(row: str, sign: str) -> str:
+            return f'''
+                INSERT INTO catalog_stats (brand, stock_status, category)
+                SELECT {row}.brand, {row}.stock_status, COALESCE({row}.category, '')
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM catalog_stats
+                    WHERE brand = {row}.brand
+                      AND stock_status = {row}.stock_status
+                      AND category = COALESCE({row}.category, '')
+                );
+                UPDATE catalog_stats SET
+                    product_count = product_count {sign} 1,
+                    priced_count = priced_count {sign} ({row}.price > 0),
+                    price_sum = price_sum {sign} (CASE WHEN {row}.price > 0 THEN {row}.price ELSE 0 END)
+                WHERE brand = {row}.brand
+                  AND stock_status = {row}.stock_status
+                  AND category = COALESCE({row}.category, '');
+            '''
+        
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_products_stats_insert AFTER INSERT ON products
+            BEGIN {apply('NEW', '+')} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_products_stats_delete AFTER DELETE ON products
+            BEGIN {apply('OLD', '-')} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_products_stats_update
+            AFTER UPDATE OF brand, stock_status, category, price ON products
+            BEGIN {apply('OLD', '-')} {apply('NEW', '+')} END
+        ''')
+    
+    def _create_version_triggers(self, cursor: sqlite3.Cursor):
+        """Create triggers bumping catalog_version on product and price writes."""
+        bump = '''
+            UPDATE catalog_version SET
+                version = version + 1,
+                modified_at = (julianday('now') - 2440587.5) * 86400.0
+            WHERE id = 1;
+        '''
+        for table, event in (
+            ('products', 'INSERT'), ('products', 'UPDATE'), ('products', 'DELETE'),
+            ('price_history', 'INSERT')
+        ):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN {bump} END
+            ''')
+    
+    # Product columns whose changes clients mirroring the catalog need to see
+    _SYNCED_COLUMNS = (
+        'name, brand, source, purchase_link, price, original_price, stock_level, stock_status, '
+        'image_url, video_url, description, category, tags, last_updated, metadata'
+    )
+    
+    def _create_change_tracking(self, cursor: sqlite3.Cursor):
+        """Add the product change sequence, delete tombstones and their triggers."""
+        # A product's change_seq is the counter value at its latest write, so
+        # rows written after a cursor are a range scan of the change_seq index
+        self._ensure_column(cursor, 'catalog_version', 'change_seq', 'INTEGER NOT NULL DEFAULT 0')
+        if self._ensure_column(cursor, 'products', 'change_seq', 'INTEGER NOT NULL DEFAULT 0'):
+            cursor.execute('UPDATE products SET change_seq = rowid')
+            cursor.execute('''
+                UPDATE catalog_version SET change_seq = (SELECT COALESCE(MAX(change_seq), 0) FROM products)
+                WHERE id = 1
+            ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS product_tombstones (
+                product_id TEXT PRIMARY KEY,
+                change_seq INTEGER NOT NULL,
+                deleted_at TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_change_seq ON products (change_seq)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tombstones_change_seq ON product_tombstones (change_seq)')
+        
+        next_seq = 'UPDATE catalog_version SET change_seq = change_seq + 1 WHERE id = 1;'
+        current_seq = '(SELECT change_seq FROM catalog_version WHERE id = 1)'
+        # The stamping UPDATE sets no synced column, so it can't fire these again
+        for event, timing in (('insert', 'INSERT'), ('update', f'UPDATE OF {self._SYNCED_COLUMNS}')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_products_change_{event}
+                AFTER {timing} ON products
+                BEGIN
+                    {next_seq}
+                    UPDATE products SET change_seq = {current_seq} WHERE id = NEW.id;
+                    DELETE FROM product_tombstones WHERE product_id = NEW.id;
+                END
+            ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_products_change_delete AFTER DELETE ON products
+            BEGIN
+                {next_seq}
+                INSERT INTO product_tombstones (product_id, change_seq, deleted_at)
+                VALUES (OLD.id, {current_seq}, datetime('now'));
+            END
+        ''')
+    
+    def _ensure_column(self, cursor: sqlite3.Cursor, table: str, column: str, definition: str) -> bool:
+        """Add a column to an existing table if it is missing."""
+        cursor.execute(f'PRAGMA table_xinfo({table})')
+        if any(row['name'] == column for row in cursor.fetchall()):
+            return False
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        return True
+    
+    def _create_featured_ranking(self, cursor: sqlite3.Cursor):
+        """Add the featured score column, its index and alert count triggers."""
+        if self._ensure_column(cursor, 'products', 'alert_count', 'INTEGER NOT NULL DEFAULT 0'):
+            cursor.execute('''
+                UPDATE products SET alert_count = (
+                    SELECT COUNT(*) FROM stock_alerts
+                    WHERE product_id = products.id AND is_active
+                )
+            ''')
+        # A generated column keeps the formula it was added with; rebuild it when the formula changes
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'products'")
+        table_sql = ' '.join(cursor.fetchone()['sql'].split())
+        if 'featured_score' in table_sql and ' '.join(FEATURED_SCORE_SQL.split()) not in table_sql:
+            cursor.execute('DROP INDEX IF EXISTS idx_products_featured')
+            cursor.execute('ALTER TABLE products DROP COLUMN featured_score')
+        # Virtual generated column: the index below stores the computed score,
+        # so it is materialized on write and ranking reads never compute it
+        self._ensure_column(
+            cursor, 'products', 'featured_score',
+            f'REAL GENERATED ALWAYS AS ({FEATURED_SCORE_SQL}) VIRTUAL'
+        )
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_products_featured ON products (brand, featured_score DESC)
+            WHERE stock_status = 'in_stock'
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_alerts_count_insert AFTER INSERT ON stock_alerts
+            WHEN NEW.is_active
+            BEGIN
+                UPDATE products SET alert_count = alert_count + 1 WHERE id = NEW.product_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_alerts_count_delete AFTER DELETE ON stock_alerts
+            WHEN OLD.is_active
+            BEGIN
+                UPDATE products SET alert_count = alert_count - 1 WHERE id = OLD.product_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_alerts_count_update
+            AFTER UPDATE OF is_active, product_id ON stock_alerts
+            BEGIN
+                UPDATE products SET alert_count = alert_count - (OLD.is_active != 0) WHERE id = OLD.product_id;
+                UPDATE products SET alert_count = alert_count + (NEW.is_active != 0) WHERE id = NEW.product_id;
+            END
+        ''')
     
     def _populate_sample_data(self):
         """Add sample data for development and testing."""
@@ -218,17 +532,105 @@ class DatabaseManager:
         for history in sample_history:
             self.save_price_history(history)
     
+    # Upsert rather than REPLACE so update triggers see OLD and NEW rows
+    _UPSERT_PRODUCT_SQL = '''
+        INSERT INTO products (
+            id, name, brand, source, purchase_link, price, original_price,
+            stock_level, stock_status, image_url, video_url, description,
+            category, tags, last_updated, metadata
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            name = excluded.name,
+            brand = excluded.brand,
+            source = excluded.source,
+            purchase_link = excluded.purchase_link,
+            price = excluded.price,
+            original_price = excluded.original_price,
+            stock_level = excluded.stock_level,
+            stock_status = excluded.stock_status,
+            image_url = excluded.image_url,
+            video_url = excluded.video_url,
+            description = excluded.description,
+            category = excluded.category,
+            tags = excluded.tags,
+            last_updated = excluded.last_updated,
+            metadata = excluded.metadata
+    '''
+    _PRICE_PARAM, _LAST_UPDATED_PARAM = 5, 14  # Positions in _product_params
+    
     def save_product(self, product: Product):
         """Save or update a product in the database."""
-        cursor = self.connection.cursor()
+        with self._write_lock:
+            cursor = self.connection.cursor()
+            cursor.execute(self._UPSERT_PRODUCT_SQL, self._product_params(product))
+            
+            self.connection.commit()
+        self._notify_change(ProductChange(product.id, product))
+    
+    def save_products(
+        self,
+        products: Sequence[Product],
+        source: Optional[str] = None,
+        canonicalize: Optional[Callable[[List[Product]], CanonicalLinks]] = None
+    ) -> Dict[str, str]:
+        """
+        Upsert many products in one transaction, skipping unchanged rows.
         
-        cursor.execute('''
-            INSERT OR REPLACE INTO products (
-                id, name, brand, source, purchase_link, price, original_price,
-                stock_level, stock_status, image_url, video_url, description,
-                category, tags, last_updated, metadata
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        Rows are compared on every column except last_updated, so resending
+        an unchanged product writes nothing. New products and price changes
+        are recorded in price_history. A later product with the same id
+        replaces an earlier one.
+        
+        Args:
+            products: Products to save.
+            source: Recorded with the price history entries.
+            canonicalize: Called with the products being written; the canonical
+                products and offers it returns are saved in the same transaction.
+        
+        Returns:
+            SAVE_CREATED, SAVE_UPDATED or SAVE_UNCHANGED per product id.
+        """
+        latest = {product.id: product for product in products}
+        params = {product_id: self._product_params(product) for product_id, product in latest.items()}
+        results: Dict[str, str] = {}
+        written: List[Product] = []
+        
+        with self._write_lock:
+            cursor = self.connection.cursor()
+            try:
+                existing = self._stored_product_params(cursor, list(params))
+                history = []
+                skip = self._LAST_UPDATED_PARAM
+                for product_id, row in params.items():
+                    stored = existing.get(product_id)
+                    if stored is not None and stored[:skip] + stored[skip + 1:] == row[:skip] + row[skip + 1:]:
+                        results[product_id] = SAVE_UNCHANGED
+                        continue
+                    results[product_id] = SAVE_CREATED if stored is None else SAVE_UPDATED
+                    written.append(latest[product_id])
+                    price = row[self._PRICE_PARAM]
+                    if stored is None or stored[self._PRICE_PARAM] != price:
+                        history.append((product_id, price, row[skip], source))
+                
+                cursor.executemany(self._UPSERT_PRODUCT_SQL, [params[product.id] for product in written])
+                cursor.executemany('''
+                    INSERT INTO price_history (product_id, price, timestamp, source)
+                    VALUES (?, ?, ?, ?)
+                ''', history)
+                if canonicalize is not None and written:
+                    self._save_offers(cursor, *canonicalize(written))
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+        
+        for product in written:
+            self._notify_change(ProductChange(product.id, product))
+        return results
+    
+    def _product_params(self, product: Product) -> Tuple[Any, ...]:
+        """Column values of a product in _UPSERT_PRODUCT_SQL order."""
+        return (
             product.id,
             product.name,
             product.brand.value,
@@ -245,20 +647,146 @@ class DatabaseManager:
             json.dumps(product.tags),
             product.last_updated.isoformat(),
             json.dumps(product.metadata)
-        ))
+        )
+    
+    def _stored_product_params(self, cursor: sqlite3.Cursor, product_ids: List[str]) -> Dict[str, Tuple[Any, ...]]:
+        """Stored column values of existing products in _UPSERT_PRODUCT_SQL order."""
+        stored = {}
+        for start in range(0, len(product_ids), 500):  # Stay under SQLite's bound parameter limit
+            batch = product_ids[start:start + 500]
+            cursor.execute(f'''
+                SELECT id, name, brand, source, purchase_link, price, original_price,
+                       stock_level, stock_status, image_url, video_url, description,
+                       category, tags, last_updated, metadata
+                FROM products WHERE id IN ({', '.join('?' * len(batch))})
+            ''', batch)
+            stored.update((row['id'], tuple(row)) for row in cursor.fetchall())
+        return stored
+    
+    def add_change_listener(self, listener: Callable[[ProductChange], None]):
+        """Register a callback invoked after every committed product write."""
+        self._change_listeners.append(listener)
+    
+    def get_catalog_version(self) -> Tuple[int, float]:
+        """Get the catalog write counter and the Unix time of the last write."""
+        row = self.connection.execute('SELECT version, modified_at FROM catalog_version WHERE id = 1').fetchone()
+        return row['version'], row['modified_at']
+    
+    def data_version(self) -> int:
+        """SQLite data version; changes when another connection commits."""
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+    
+    def get_change_seq(self) -> int:
+        """Change sequence value of the latest product write or delete."""
+        return self.connection.execute('SELECT change_seq FROM catalog_version WHERE id = 1').fetchone()[0]
+    
+    def get_changes_since(self, since: int, limit: int = 500) -> ProductChangeSet:
+        """
+        Get products written and deleted after a change cursor.
         
-        self.connection.commit()
+        Each product appears once, at its latest write; a deleted product is
+        reported by id until it is saved again.
+        
+        Args:
+            since: Cursor from a previous call, or 0 for the whole catalog.
+            limit: Maximum number of products and deleted ids returned.
+        """
+        latest = self.get_change_seq()
+        if since >= latest:
+            return ProductChangeSet([], [], since, False)  # Nothing written: a single-row read
+        
+        cursor = self.connection.cursor()
+        cursor.execute(
+            'SELECT * FROM products WHERE change_seq > ? ORDER BY change_seq LIMIT ?', (since, limit)
+        )
+        written = [(row['change_seq'], row) for row in cursor.fetchall()]
+        cursor.execute(
+            'SELECT product_id, change_seq FROM product_tombstones WHERE change_seq > ? ORDER BY change_seq LIMIT ?',
+            (since, limit)
+        )
+        deleted = [(row['change_seq'], row['product_id']) for row in cursor.fetchall()]
+        
+        page = sorted(written + deleted, key=lambda item: item[0])[:limit]
+        last = page[-1][0] if page else latest
+        return ProductChangeSet(
+            products=[self._row_to_product(item) for seq, item in page if not isinstance(item, str)],
+            deleted_ids=[item for seq, item in page if isinstance(item, str)],
+            cursor=last,
+            has_more=last < latest  # The latest write always holds the latest value
+        )
+    
+    def poll_external_changes(self) -> int:
+        """
+        Notify change listeners of product writes committed by other connections.
+        
+        Listeners otherwise only hear about writes made through this manager,
+        so caches and feeds in one worker process would miss the writes of
+        other workers and of a separate collector. Call periodically; while
+        no other connection commits this costs two single-row reads.
+        
+        Returns:
+            Number of changes notified.
+        """
+        changes = []
+        with self._write_lock:
+            latest = self.get_change_seq()  # Read before the data version, so a commit in between is seen next
+            version = self.data_version()
+            if version == self._seen_data_version:
+                self._change_cursor = latest  # Only this connection wrote, and listeners heard about it
+                return 0
+            
+            has_more = True
+            while has_more:
+                page = self.get_changes_since(self._change_cursor)
+                changes.extend(ProductChange(product.id, product) for product in page.products)
+                changes.extend(ProductChange(product_id, deleted=True) for product_id in page.deleted_ids)
+                self._change_cursor, has_more = page.cursor, page.has_more
+            self._seen_data_version = version
+        
+        for change in changes:
+            self._notify_change(change)
+        return len(changes)
+    
+    def _notify_change(self, change: ProductChange):
+        """Tell listeners about a committed product write."""
+        for listener in self._change_listeners:
+            try:
+                listener(change)
+            except Exception as e:
+                self.logger.error(f"Change listener failed for {change.product_id}: {e}")
     
-    def get_product_by_id(self, product_id: str) -> Optional[Product]:
-        """Get a single product by ID."""
+    def get_product_by_id(
+        self,
+        product_id: str,
+        fields: Optional[Sequence[str]] = None
+    ) -> Union[Product, Dict[str, Any], None]:
+        """
+        Get a single product by ID.
+        
+        Args:
+            product_id: Product identifier
+            fields: Return only these to_dict() fields as a dict, reading only their columns
+        """
         cursor = self.connection.cursor()
-        cursor.execute('SELECT * FROM products WHERE id = ?', (product_id,))
+        cursor.execute(f'SELECT {self._product_select(fields)} FROM products WHERE id = ?', (product_id,))
         row = cursor.fetchone()
         
         if row:
-            return self._row_to_product(row)
+            return self._row_to_product(row, fields)
         return None
     
+    def get_products_by_ids(self, product_ids: Sequence[str]) -> List[Product]:
+        """Get several products in one query, in the order of the given ids."""
+        if not product_ids:
+            return []
+        
+        cursor = self.connection.cursor()
+        placeholders = ', '.join('?' for _ in product_ids)
+        cursor.execute(f'SELECT * FROM products WHERE id IN ({placeholders})', list(product_ids))
+        
+        by_id = {row['id']: self._row_to_product(row) for row in cursor.fetchall()}
+        return [by_id[product_id] for product_id in product_ids if product_id in by_id]
+    
     def get_products(
         self,
         brand: Optional[BrandType] = None,
@@ -297,26 +825,19 @@ class DatabaseManager:
         search_term: Optional[str] = None,
         sort_by: str = 'name',
         page: int = 1,
-        per_page: int = 50
-    ) -> List[Product]:
-        """Search products with multiple filters and pagination."""
-        cursor = self.connection.cursor()
-        
-        query = 'SELECT * FROM products WHERE 1=1'
-        params = []
+        per_page: int = 50,
+        fields: Optional[Sequence[str]] = None
+    ) -> Union[List[Product], List[Dict[str, Any]]]:
+        """
+        Search products with multiple filters and pagination.
         
-        if brand:
-            query += ' AND brand = ?'
-            params.append(brand.value)
+        With fields, returns dicts of only those to_dict() fields and reads
+        only the columns they need.
+        """
+        cursor = self.connection.cursor()
         
-        if category:
-            query += ' AND category = ?'
-            params.append(category)
-        
-        if search_term:
-            query += ' AND (name LIKE ? OR description LIKE ?)'
-            search_pattern = f'%{search_term}%'
-            params.extend([search_pattern, search_pattern])
+        where, params = self._search_filters(brand, category, search_term)
+        query = f'SELECT {self._product_select(fields)} FROM products WHERE {where}'
         
         # Add sorting
         sort_mapping = {
@@ -337,7 +858,285 @@ class DatabaseManager:
         cursor.execute(query, params)
         rows = cursor.fetchall()
         
-        return [self._row_to_product(row) for row in rows]
+        return [self._row_to_product(row, fields) for row in rows]
+    
+    def export_products(
+        self,
+        brand: Optional[BrandType] = None,
+        category: Optional[str] = None,
+        search_term: Optional[str] = None,
+        batch_size: int = 1000
+    ) -> Iterator[Product]:
+        """
+        Iterate over every product matching the search_products filters.
+        
+        Rows are read from one snapshot in batches, so the result is
+        consistent under concurrent writes and memory use doesn't depend on
+        the number of rows. Close the iterator to release the snapshot early.
+        """
+        where, params = self._search_filters(brand, category, search_term)
+        with self.snapshot() as connection:
+            cursor = connection.execute(f'SELECT * FROM products WHERE {where} ORDER BY id', params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._row_to_product(row)
+    
+    def export_price_history(
+        self,
+        product_ids: Optional[Sequence[str]] = None,
+        since_date: Optional[datetime] = None,
+        batch_size: int = 1000
+    ) -> Iterator[PriceHistory]:
+        """Iterate over price history from one snapshot, by product and time."""
+        query = 'SELECT * FROM price_history WHERE 1=1'
+        params: List[Any] = []
+        if product_ids:
+            query += f" AND product_id IN ({', '.join('?' * len(product_ids))})"
+            params.extend(product_ids)
+        if since_date:
+            query += ' AND timestamp >= ?'
+            params.append(since_date.isoformat())
+        query += ' ORDER BY product_id, timestamp, id'
+        
+        with self.snapshot() as connection:
+            cursor = connection.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._row_to_price_history(row)
+    
+    @contextmanager
+    def snapshot(self) -> Iterator[sqlite3.Connection]:
+        """
+        Read-only connection that sees the database as of one moment.
+        
+        File databases get a second connection holding a read transaction;
+        in WAL mode writers carry on meanwhile. An in-memory database can't
+        be shared between connections, so it is copied with the backup API.
+        """
+        if self.db_path == ":memory:":
+            connection = sqlite3.connect(":memory:")
+            with self._write_lock:
+                self.connection.backup(connection)
+        else:
+            connection = sqlite3.connect(self.db_path)
+            connection.execute('BEGIN')
+            connection.execute('SELECT 1 FROM catalog_version').fetchone()  # Starts the read transaction
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+    
+    def _search_filters(
+        self,
+        brand: Optional[BrandType],
+        category: Optional[str],
+        search_term: Optional[str]
+    ) -> Tuple[str, List[Any]]:
+        """WHERE clause and parameters for the product search filters."""
+        conditions = ['1=1']
+        params: List[Any] = []
+        
+        if brand:
+            conditions.append('brand = ?')
+            params.append(brand.value)
+        
+        if category:
+            conditions.append('category = ?')
+            params.append(category)
+        
+        if search_term:
+            conditions.append('(name LIKE ? OR description LIKE ?)')
+            search_pattern = f'%{search_term}%'
+            params.extend([search_pattern, search_pattern])
+        
+        return ' AND '.join(conditions), params
+    
+    def get_featured_products(self, brand: BrandType, limit: int = 6) -> List[Product]:
+        """
+        Get the highest ranked in-stock products of a brand.
+        
+        Freshness adds at most FEATURED_FRESHNESS_POINTS to the stored score,
+        so a product more than that below the limit-th stored score can't
+        rank; the index narrows the candidates to the rest before their full
+        score is computed.
+        """
+        cursor = self.connection.cursor()
+        # The stock_status predicate matches idx_products_featured
+        cursor.execute('''
+            SELECT featured_score FROM products
+            WHERE brand = ? AND stock_status = 'in_stock'
+            ORDER BY featured_score DESC
+            LIMIT 1 OFFSET ?
+        ''', (brand.value, max(limit, 1) - 1))
+        row = cursor.fetchone()
+        floor = row['featured_score'] - FEATURED_FRESHNESS_POINTS if row else float('-inf')
+        cursor.execute(f'''
+            SELECT * FROM products
+            WHERE brand = ? AND stock_status = 'in_stock' AND featured_score >= ?
+            ORDER BY featured_score + {FEATURED_FRESHNESS_SQL} DESC
+            LIMIT ?
+        ''', (brand.value, floor, limit))
+        return [self._row_to_product(row) for row in cursor.fetchall()]
+    
+    def get_low_stock_products(
+        self,
+        threshold: int = 5,
+        brand: Optional[BrandType] = None,
+        page: int = 1,
+        per_page: int = 50,
+        fields: Optional[Sequence[str]] = None
+    ) -> Union[List[Product], List[Dict[str, Any]]]:
+        """Get available products at or below a stock threshold, scarcest first; fields as in search_products."""
+        cursor = self.connection.cursor()
+        
+        # The stock_status predicate matches idx_products_low_stock
+        query = f'''
+            SELECT {self._product_select(fields)} FROM products
+            WHERE stock_level <= ? AND stock_status != 'out_of_stock'
+        '''
+        params: List[Any] = [threshold]
+        
+        if brand:
+            query += ' AND brand = ?'
+            params.append(brand.value)
+        
+        query += ' ORDER BY stock_level ASC, id ASC LIMIT ? OFFSET ?'
+        params.extend([per_page, (page - 1) * per_page])
+        
+        cursor.execute(query, params)
+        return [self._row_to_product(row, fields) for row in cursor.fetchall()]
+    
+    def get_price_drop_products(
+        self,
+        since_date: datetime,
+        brand: Optional[BrandType] = None,
+        page: int = 1,
+        per_page: int = 50,
+        fields: Optional[Sequence[str]] = None
+    ) -> Union[List[Product], List[Dict[str, Any]]]:
+        """
+        Get products whose latest price is below their earliest price since a date.
+        
+        Compares first and last price points per product with window
+        functions over a single ordered pass of price_history, largest
+        relative drop first. fields works as in search_products.
+        """
+        cursor = self.connection.cursor()
+        
+        # The time index keeps the scan proportional to the window, not the table
+        query = f'''
+            WITH price_window AS (
+                SELECT
+                    product_id,
+                    FIRST_VALUE(price) OVER series AS first_price,
+                    LAST_VALUE(price) OVER series AS last_price,
+                    ROW_NUMBER() OVER series AS point_number
+                FROM price_history INDEXED BY idx_price_history_time
+                WHERE timestamp >= ?
+                WINDOW series AS (
+                    PARTITION BY product_id
+                    ORDER BY timestamp, id
+                    ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+                )
+            ),
+            drops AS (
+                SELECT product_id, (first_price - last_price) / first_price AS drop_ratio
+                FROM price_window
+                WHERE point_number = 1 AND last_price < first_price
+            )
+            SELECT {self._product_select(fields, 'p')} FROM drops d
+            JOIN products p ON p.id = d.product_id
+        '''
+        params: List[Any] = [since_date.isoformat()]
+        
+        if brand:
+            query += ' WHERE p.brand = ?'
+            params.append(brand.value)
+        
+        query += '''
+            ORDER BY d.drop_ratio DESC, d.product_id ASC
+            LIMIT ? OFFSET ?
+        '''
+        params.extend([per_page, (page - 1) * per_page])
+        
+        cursor.execute(query, params)
+        return [self._row_to_product(row, fields) for row in cursor.fetchall()]
+    
+    def get_catalog_stats(self, brand: Optional[BrandType] = None) -> List[Dict[str, Any]]:
+        """
+        Get maintained aggregates per (brand, stock_status, category).
+        
+        The table holds one row per combination rather than per product,
+        so reading it does not depend on catalog size.
+        """
+        cursor = self.connection.cursor()
+        
+        query = 'SELECT * FROM catalog_stats WHERE product_count > 0'
+        params = []
+        
+        if brand:
+            query += ' AND brand = ?'
+            params.append(brand.value)
+        
+        cursor.execute(query, params)
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def rebuild_catalog_stats(self):
+        """Recompute catalog_stats from the products table."""
+        with self._write_lock:
+            with self.connection:
+                self.connection.execute('DELETE FROM catalog_stats')
+                self.connection.execute(
+                    'INSERT INTO catalog_stats (brand, stock_status, category, product_count, priced_count, price_sum) '
+                    + self._CATALOG_STATS_SQL
+                )
+    
+    def check_catalog_stats(self) -> List[str]:
+        """
+        Compare catalog_stats against a fresh aggregation of products.
+        
+        Returns a description of every mismatching group; empty when consistent.
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(self._CATALOG_STATS_SQL)
+        expected = {
+            (row['brand'], row['stock_status'], row['category']): dict(row) for row in cursor.fetchall()
+        }
+        cursor.execute('SELECT * FROM catalog_stats WHERE product_count != 0 OR priced_count != 0')
+        actual = {
+            (row['brand'], row['stock_status'], row['category']): dict(row) for row in cursor.fetchall()
+        }
+        
+        mismatches = []
+        for key in sorted(set(expected) | set(actual)):
+            want, got = expected.get(key), actual.get(key)
+            if (
+                want is None or got is None
+                or want['product_count'] != got['product_count']
+                or want['priced_count'] != got['priced_count']
+                or abs(want['price_sum'] - got['price_sum']) > 0.005
+            ):
+                mismatches.append(f"{'/'.join(key)}: expected {want}, found {got}")
+        return mismatches
+    
+    _CATALOG_STATS_SQL = '''
+        SELECT
+            brand,
+            stock_status,
+            COALESCE(category, '') AS category,
+            COUNT(*) AS product_count,
+            SUM(price > 0) AS priced_count,
+            TOTAL(CASE WHEN price > 0 THEN price ELSE 0 END) AS price_sum
+        FROM products
+        GROUP BY brand, stock_status, COALESCE(category, '')
+    '''
     
     def get_categories(self, brand: Optional[BrandType] = None) -> List[str]:
         """Get available categories, optionally filtered by brand."""
@@ -356,23 +1155,121 @@ class DatabaseManager:
     
     def update_product(self, product: Product):
         """Update an existing product."""
-        self.save_product(product)  # INSERT OR REPLACE handles updates
+        self.save_product(product)  # Upsert handles updates
     
-    def save_price_history(self, price_history: PriceHistory):
-        """Save a price history entry."""
-        cursor = self.connection.cursor()
+    def delete_product(self, product_id: str) -> bool:
+        """
+        Delete a product with its price history, alerts and offer.
+        
+        The delete leaves a tombstone so get_changes_since reports it.
+        
+        Returns:
+            Whether the product existed.
+        """
+        with self._write_lock:
+            try:
+                for table in ('price_history', 'stock_alerts', 'offers'):
+                    self.connection.execute(f'DELETE FROM {table} WHERE product_id = ?', (product_id,))
+                deleted = self.connection.execute('DELETE FROM products WHERE id = ?', (product_id,)).rowcount > 0
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+        
+        if deleted:
+            self._notify_change(ProductChange(product_id, deleted=True))
+        return deleted
+    
+    def apply_product_updates(
+        self,
+        updates: Sequence[ProductUpdate],
+        updated_at: Optional[datetime] = None
+    ) -> List[str]:
+        """
+        Apply targeted stock and price updates in a single transaction.
+        
+        Only the given columns and last_updated are written. An update with
+        expected_last_updated is skipped as a conflict when the row changed
+        since that timestamp. Price changes are recorded in price_history.
+        
+        Args:
+            updates: Changes to apply, in order.
+            updated_at: New last_updated for every applied change (default now).
+        
+        Returns:
+            UPDATE_APPLIED, UPDATE_CONFLICT or UPDATE_NOT_FOUND per update.
+        """
+        timestamp = (updated_at or datetime.now()).isoformat()
+        results = []
+        
+        with self._write_lock:
+            cursor = self.connection.cursor()
+            try:
+                for update in updates:
+                    results.append(self._apply_product_update(cursor, update, timestamp))
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+        
+        for update, result in zip(updates, results):
+            if result == UPDATE_APPLIED:
+                self._notify_change(ProductChange(update.product_id))
+        return results
+    
+    def _apply_product_update(self, cursor: sqlite3.Cursor, update: ProductUpdate, timestamp: str) -> str:
+        """Apply one update inside an open transaction."""
+        cursor.execute('SELECT price, last_updated FROM products WHERE id = ?', (update.product_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return UPDATE_NOT_FOUND
+        
+        expected = row['last_updated']
+        if update.expected_last_updated is not None and update.expected_last_updated.isoformat() != expected:
+            return UPDATE_CONFLICT
         
+        # Re-check last_updated in the UPDATE so writers on other connections can't interleave
         cursor.execute('''
-            INSERT INTO price_history (product_id, price, timestamp, source)
-            VALUES (?, ?, ?, ?)
+            UPDATE products SET
+                stock_level = COALESCE(?, stock_level),
+                stock_status = COALESCE(?, stock_status),
+                price = COALESCE(?, price),
+                last_updated = ?
+            WHERE id = ? AND last_updated = ?
         ''', (
-            price_history.product_id,
-            price_history.price,
-            price_history.timestamp.isoformat(),
-            price_history.source
+            update.stock_level,
+            update.stock_status.value if update.stock_status else None,
+            update.price,
+            timestamp,
+            update.product_id,
+            expected
         ))
+        if cursor.rowcount == 0:
+            return UPDATE_CONFLICT
         
-        self.connection.commit()
+        if update.price is not None and update.price != row['price']:
+            cursor.execute('''
+                INSERT INTO price_history (product_id, price, timestamp, source)
+                VALUES (?, ?, ?, ?)
+            ''', (update.product_id, update.price, timestamp, update.source))
+        return UPDATE_APPLIED
+    
+    def save_price_history(self, price_history: PriceHistory):
+        """Save a price history entry."""
+        with self._write_lock:
+            cursor = self.connection.cursor()
+            
+            cursor.execute('''
+                INSERT INTO price_history (product_id, price, timestamp, source)
+                VALUES (?, ?, ?, ?)
+            ''', (
+                price_history.product_id,
+                price_history.price,
+                price_history.timestamp.isoformat(),
+                price_history.source
+            ))
+            
+            self.connection.commit()
     
     def get_price_history(
         self, 
@@ -396,27 +1293,259 @@ class DatabaseManager:
         
         return [self._row_to_price_history(row) for row in rows]
     
+    def get_price_histories(
+        self,
+        product_ids: Sequence[str],
+        since_date: Optional[datetime] = None,
+        resolution: Optional[str] = None
+    ) -> Dict[str, List[PriceHistory]]:
+        """
+        Get price history for several products in one query, newest first.
+        
+        Reads one index range per product. With a resolution, each product
+        keeps the last price point of every hour, day or week.
+        
+        Args:
+            product_ids: Products to fetch; every id gets a (possibly empty) list
+            since_date: Only points at or after this time
+            resolution: None for every point, or a key of HISTORY_RESOLUTIONS
+        """
+        histories: Dict[str, List[PriceHistory]] = {product_id: [] for product_id in product_ids}
+        if not histories:
+            return histories
+        if resolution is not None and resolution not in HISTORY_RESOLUTIONS:
+            raise ValueError(f"Unknown resolution {resolution!r}; use one of {', '.join(HISTORY_RESOLUTIONS)}")
+        
+        placeholders = ', '.join('?' for _ in histories)
+        params: List[Any] = list(histories)
+        where = f'product_id IN ({placeholders})'
+        if since_date:
+            where += ' AND timestamp >= ?'
+            params.append(since_date.isoformat())
+        
+        if resolution is None:
+            query = f'''
+                SELECT product_id, price, timestamp, source
+                FROM price_history INDEXED BY idx_price_history_product_time
+                WHERE {where}
+                ORDER BY product_id, timestamp DESC
+            '''
+        else:
+            # A bare column next to MAX() comes from the row holding the maximum
+            query = f'''
+                SELECT product_id, price, MAX(timestamp) AS timestamp, source
+                FROM price_history INDEXED BY idx_price_history_product_time
+                WHERE {where}
+                GROUP BY product_id, {HISTORY_RESOLUTIONS[resolution]}
+                ORDER BY product_id, timestamp DESC
+            '''
+        
+        cursor = self.connection.cursor()
+        cursor.execute(query, params)
+        for row in cursor.fetchall():
+            histories[row['product_id']].append(self._row_to_price_history(row))
+        return histories
+    
     def save_stock_alert(self, alert: StockAlert):
         """Save a stock alert."""
+        with self._write_lock:
+            cursor = self.connection.cursor()
+            
+            cursor.execute('''
+                INSERT INTO stock_alerts (
+                    product_id, alert_type, threshold, target_price, is_active, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            ''', (
+                alert.product_id,
+                alert.alert_type,
+                alert.threshold,
+                alert.target_price,
+                alert.is_active,
+                alert.created_at.isoformat()
+            ))
+            
+            self.connection.commit()
+        self._notify_change(ProductChange(alert.product_id))  # Triggers updated alert_count
+    
+    def get_canonical_products(self, brand: Optional[BrandType] = None) -> List[CanonicalProduct]:
+        """Get canonical products, optionally filtered by brand."""
         cursor = self.connection.cursor()
         
+        if brand:
+            cursor.execute('SELECT * FROM canonical_products WHERE brand = ?', (brand.value,))
+        else:
+            cursor.execute('SELECT * FROM canonical_products')
+        
+        return [self._row_to_canonical_product(row) for row in cursor.fetchall()]
+    
+    def save_canonical_product(self, canonical: CanonicalProduct):
+        """Save a canonical product."""
+        with self._write_lock:
+            cursor = self.connection.cursor()
+            
+            cursor.execute('''
+                INSERT OR REPLACE INTO canonical_products (id, brand, name, name_key, category, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (
+                canonical.id,
+                canonical.brand.value,
+                canonical.name,
+                canonical.name_key,
+                canonical.category,
+                canonical.created_at.isoformat()
+            ))
+            
+            self.connection.commit()
+    
+    def save_offer(self, product_id: str, canonical_id: str):
+        """Link a retailer listing to its canonical product."""
+        with self._write_lock:
+            cursor = self.connection.cursor()
+            
+            cursor.execute(
+                'INSERT OR REPLACE INTO offers (product_id, canonical_id) VALUES (?, ?)',
+                (product_id, canonical_id)
+            )
+            
+            self.connection.commit()
+    
+    def save_offers(self, links: Sequence[Tuple[str, str]], canonicals: Sequence[CanonicalProduct] = ()):
+        """
+        Link many (product_id, canonical_id) pairs in one transaction.
+        
+        Canonical products given are inserted in the same transaction unless
+        they already exist, so new ones don't each need a commit.
+        """
+        with self._write_lock:
+            cursor = self.connection.cursor()
+            try:
+                self._save_offers(cursor, canonicals, links)
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+    
+    def _save_offers(
+        self,
+        cursor: sqlite3.Cursor,
+        canonicals: Sequence[CanonicalProduct],
+        links: Sequence[Tuple[str, str]]
+    ):
+        """Insert canonical products and offers inside the caller's transaction."""
+        cursor.executemany('''
+            INSERT OR IGNORE INTO canonical_products (id, brand, name, name_key, category, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [
+            (c.id, c.brand.value, c.name, c.name_key, c.category, c.created_at.isoformat())
+            for c in canonicals
+        ])
+        cursor.executemany('INSERT OR REPLACE INTO offers (product_id, canonical_id) VALUES (?, ?)', links)
+    
+    def get_products_without_offers(self) -> List[Product]:
+        """Get products not yet linked to a canonical product."""
+        cursor = self.connection.cursor()
         cursor.execute('''
-            INSERT INTO stock_alerts (
-                product_id, alert_type, threshold, target_price, is_active, created_at
-            ) VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            alert.product_id,
-            alert.alert_type,
-            alert.threshold,
-            alert.target_price,
-            alert.is_active,
-            alert.created_at.isoformat()
-        ))
+            SELECT p.* FROM products p
+            LEFT JOIN offers o ON o.product_id = p.id
+            WHERE o.product_id IS NULL
+        ''')
         
-        self.connection.commit()
+        return [self._row_to_product(row) for row in cursor.fetchall()]
     
-    def _row_to_product(self, row: sqlite3.Row) -> Product:
-        """Convert database row to Product object."""
+    def get_offers(self, canonical_id: str) -> List[Product]:
+        """Get all retailer listings of a canonical product, cheapest first."""
+        cursor = self.connection.cursor()
+        cursor.execute('''
+            SELECT p.* FROM offers o
+            JOIN products p ON p.id = o.product_id
+            WHERE o.canonical_id = ?
+            ORDER BY p.price ASC
+        ''', (canonical_id,))
+        
+        return [self._row_to_product(row) for row in cursor.fetchall()]
+    
+    def get_best_offers(
+        self,
+        brand: Optional[BrandType] = None,
+        page: int = 1,
+        per_page: int = 50
+    ) -> List[CanonicalListing]:
+        """
+        Get the best current offer per canonical product in one query.
+        
+        Available offers (in or low stock) beat unavailable ones; among
+        those the lowest price wins.
+        """
+        cursor = self.connection.cursor()
+        
+        query = '''
+            SELECT * FROM (
+                SELECT
+                    p.*,
+                    c.id AS c_id,
+                    c.brand AS c_brand,
+                    c.name AS c_name,
+                    c.name_key AS c_name_key,
+                    c.category AS c_category,
+                    c.created_at AS c_created_at,
+                    COUNT(*) OVER (PARTITION BY o.canonical_id) AS offer_count,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY o.canonical_id
+                        ORDER BY
+                            CASE WHEN p.stock_status IN ('in_stock', 'low_stock') THEN 0 ELSE 1 END,
+                            p.price ASC
+                    ) AS offer_rank
+                FROM offers o
+                JOIN canonical_products c ON c.id = o.canonical_id
+                JOIN products p ON p.id = o.product_id
+        '''
+        params = []
+        
+        if brand:
+            query += ' WHERE c.brand = ?'
+            params.append(brand.value)
+        
+        query += '''
+            )
+            WHERE offer_rank = 1
+            ORDER BY c_name ASC
+            LIMIT ? OFFSET ?
+        '''
+        params.extend([per_page, (page - 1) * per_page])
+        
+        cursor.execute(query, params)
+        
+        return [
+            CanonicalListing(
+                canonical=CanonicalProduct(
+                    id=row['c_id'],
+                    brand=BrandType(row['c_brand']),
+                    name=row['c_name'],
+                    name_key=row['c_name_key'],
+                    category=row['c_category'],
+                    created_at=datetime.fromisoformat(row['c_created_at'])
+                ),
+                best_offer=self._row_to_product(row),
+                offer_count=row['offer_count']
+            )
+            for row in cursor.fetchall()
+        ]
+    
+    def _product_select(self, fields: Optional[Sequence[str]], table: Optional[str] = None) -> str:
+        """Select list for the columns behind fields; fields must be validated product fields."""
+        prefix = f'{table}.' if table else ''
+        if fields is None:
+            return f'{prefix}*'
+        return ', '.join(prefix + column for column in product_columns(fields))
+    
+    def _row_to_product(
+        self,
+        row: sqlite3.Row,
+        fields: Optional[Sequence[str]] = None
+    ) -> Union[Product, Dict[str, Any]]:
+        """Convert database row to Product object, or to the to_dict() fields selected for."""
+        if fields is not None:
+            return self._row_to_product_fields(row, fields)
         return Product(
             id=row['id'],
             name=row['name'],
@@ -436,6 +1565,29 @@ class DatabaseManager:
             metadata=json.loads(row['metadata']) if row['metadata'] else {}
         )
     
+    def _row_to_product_fields(self, row: sqlite3.Row, fields: Sequence[str]) -> Dict[str, Any]:
+        """
+        Convert a partial row to to_dict() fields without building a Product.
+        
+        Only requested JSON columns are decoded. brand, stock_status and
+        last_updated are stored in their serialized form and pass through.
+        """
+        data: Dict[str, Any] = {}
+        for name in fields:
+            if name == 'tags':
+                data[name] = json.loads(row['tags']) if row['tags'] else []
+            elif name == 'metadata':
+                data[name] = json.loads(row['metadata']) if row['metadata'] else {}
+            elif name == 'is_on_sale':
+                data[name] = Product.sale_for(row['price'], row['original_price'])
+            elif name == 'discount_percentage':
+                data[name] = Product.discount_for(row['price'], row['original_price'])
+            elif name == 'availability_text':
+                data[name] = Product.availability_text_for(StockStatus(row['stock_status']), row['stock_level'])
+            else:
+                data[name] = row[name]
+        return data
+    
     def _row_to_price_history(self, row: sqlite3.Row) -> PriceHistory:
         """Convert database row to PriceHistory object."""
         return PriceHistory(
@@ -445,6 +1597,43 @@ class DatabaseManager:
             source=row['source']
         )
     
+    def _row_to_canonical_product(self, row: sqlite3.Row) -> CanonicalProduct:
+        """Convert database row to CanonicalProduct object."""
+        return CanonicalProduct(
+            id=row['id'],
+            brand=BrandType(row['brand']),
+            name=row['name'],
+            name_key=row['name_key'],
+            category=row['category'],
+            created_at=datetime.fromisoformat(row['created_at'])
+        )
+    
+    def reconnect(self):
+        """
+        Replace the connection with a new one, e.g. in a forked worker process.
+        
+        SQLite connections must not be used across fork(). The inherited
+        connection is left open rather than closed, since closing it in the
+        child could release file locks the parent still holds. An in-memory
+        database lives in the connection, so it is kept as is.
+        """
+        if self.db_path == ":memory:":
+            return
+        with self._write_lock:
+            self.connection = self._connect()
+            # Data versions are per connection; the cursor is kept, so the next poll
+            # reports what other connections wrote since the last one
+            self._seen_data_version = None
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection shared by this manager's threads."""
+        connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row  # Enable dict-like access
+        if self.db_path != ":memory:":
+            # Readers such as exports then see a snapshot without blocking writers
+            connection.execute('PRAGMA journal_mode = WAL')
+        return connection
+    
     def close(self):
         """Close database connection."""
         if self.connection:
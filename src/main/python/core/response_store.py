@@ -0,0 +1,211 @@
+"""
+Content-addressed store for raw retailer responses.
+Keeps compressed response bodies on disk so collectors can replay them offline.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Any
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+
+@dataclass
+class StoredResponse:
+    """Index entry describing one stored response body."""
+
+    url: str
+    digest: str
+    timestamp: datetime
+    status_code: int = 200
+    source: Optional[str] = None
+    content_type: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to dictionary for the JSON index."""
+        return {
+            'url': self.url,
+            'digest': self.digest,
+            'timestamp': self.timestamp.isoformat(),
+            'status_code': self.status_code,
+            'source': self.source,
+            'content_type': self.content_type
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'StoredResponse':
+        """Create entry from an index line."""
+        return cls(
+            url=data['url'],
+            digest=data['digest'],
+            timestamp=datetime.fromisoformat(data['timestamp']),
+            status_code=data.get('status_code', 200),
+            source=data.get('source'),
+            content_type=data.get('content_type')
+        )
+
+
+class ResponseStore:
+    """
+    On-disk, content-addressed response body store.
+
+    Bodies are keyed by their SHA-256 digest, so identical responses are
+    stored once no matter how often they are fetched. Each fetch appends a
+    line to ``index.jsonl`` recording the URL, timestamp and digest.
+
+    Layout::
+
+        <root>/objects/ab/abcdef....zst   (or .gz when zstandard is missing)
+        <root>/index.jsonl
+    """
+
+    def __init__(self, root: str, compression: Optional[str] = None):
+        """
+        Initialize the store.
+
+        Args:
+            root: Directory holding objects and the index.
+            compression: 'zstd' or 'gzip'. Defaults to zstd when available.
+        """
+        if compression is None:
+            compression = 'zstd' if zstandard is not None else 'gzip'
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        if compression not in ('zstd', 'gzip'):
+            raise ValueError(f"Unsupported compression: {compression}")
+
+        self.root = Path(root)
+        self.compression = compression
+        self.objects_dir = self.root / 'objects'
+        self.index_path = self.root / 'index.jsonl'
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def put(
+        self,
+        url: str,
+        body: bytes,
+        status_code: int = 200,
+        source: Optional[str] = None,
+        content_type: Optional[str] = None,
+        timestamp: Optional[datetime] = None
+    ) -> StoredResponse:
+        """Store a response body and record it in the index."""
+        digest = hashlib.sha256(body).hexdigest()
+        entry = StoredResponse(
+            url=url,
+            digest=digest,
+            timestamp=timestamp or datetime.now(),
+            status_code=status_code,
+            source=source,
+            content_type=content_type
+        )
+
+        with self._lock:
+            if self._find_object(digest) is None:
+                path = self._object_path(digest, self.compression)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(path.suffix + '.tmp')
+                tmp_path.write_bytes(self._compress(body))
+                tmp_path.replace(path)  # Atomic so readers never see partial objects
+
+            with open(self.index_path, 'a', encoding='utf-8') as index_file:
+                index_file.write(json.dumps(entry.to_dict()) + '\n')
+
+        return entry
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """Load a response body by digest."""
+        path = self._find_object(digest)
+        if path is None:
+            return None
+
+        data = path.read_bytes()
+        if path.suffix == '.zst':
+            if zstandard is None:
+                raise RuntimeError(f"Object {digest} is zstd-compressed but 'zstandard' is not installed")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def entries(
+        self,
+        source: Optional[str] = None,
+        since: Optional[datetime] = None
+    ) -> Iterator[StoredResponse]:
+        """Iterate index entries in fetch order with optional filtering."""
+        if not self.index_path.exists():
+            return
+
+        with open(self.index_path, 'r', encoding='utf-8') as index_file:
+            for line in index_file:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = StoredResponse.from_dict(json.loads(line))
+                if source is not None and entry.source != source:
+                    continue
+                if since is not None and entry.timestamp < since:
+                    continue
+                yield entry
+
+    def latest_by_url(
+        self,
+        source: Optional[str] = None,
+        until: Optional[datetime] = None
+    ) -> Dict[str, StoredResponse]:
+        """Map each URL to its most recent entry, optionally as of a point in time, in one index pass."""
+        latest: Dict[str, StoredResponse] = {}
+        for entry in self.entries(source=source):
+            if until is not None and entry.timestamp > until:
+                continue
+            current = latest.get(entry.url)
+            if current is None or entry.timestamp >= current.timestamp:
+                latest[entry.url] = entry
+        return latest
+
+    def latest_entries(
+        self,
+        source: Optional[str] = None,
+        until: Optional[datetime] = None
+    ) -> List[StoredResponse]:
+        """Get the most recent entry per URL, optionally as of a point in time."""
+        return list(self.latest_by_url(source=source, until=until).values())
+
+    def latest(self, url: str) -> Optional[StoredResponse]:
+        """
+        Get the most recent entry for a URL.
+
+        Reads the whole index; to look up many URLs, use latest_by_url once.
+        """
+        result = None
+        for entry in self.entries():
+            if entry.url == url and (result is None or entry.timestamp >= result.timestamp):
+                result = entry
+        return result
+
+    def _compress(self, body: bytes) -> bytes:
+        """Compress a body with the configured codec."""
+        if self.compression == 'zstd':
+            return zstandard.ZstdCompressor(level=10).compress(body)
+        return gzip.compress(body, compresslevel=6)
+
+    def _object_path(self, digest: str, compression: str) -> Path:
+        """Get the object path for a digest and codec."""
+        suffix = '.zst' if compression == 'zstd' else '.gz'
+        return self.objects_dir / digest[:2] / f"{digest}{suffix}"
+
+    def _find_object(self, digest: str) -> Optional[Path]:
+        """Find an existing object regardless of the codec it was written with."""
+        for compression in ('zstd', 'gzip'):
+            path = self._object_path(digest, compression)
+            if path.exists():
+                return path
+        return None
@@ -3,11 +3,125 @@ Brand configuration models for frontend theming and customization.
 Handles Pop Mart and Pokémon card brand-specific settings.
 """
 
+import hashlib
 from dataclasses import dataclass, field
-from typing import Dict, List, Any, Optional
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, List, Any, Optional, Mapping
 from .product import BrandType
 
 
+# Brand-independent rules appended to every theme stylesheet; they read the
+# per-brand CSS variables declared in :root
+THEME_BASE_CSS = """
+.navbar-brand {
+    font-family: var(--font-family-secondary);
+    font-weight: bold;
+}
+
+.brand-primary {
+    color: var(--color-primary) !important;
+}
+
+.bg-brand-primary {
+    background-color: var(--color-primary) !important;
+}
+
+.btn-brand-primary {
+    background-color: var(--color-primary);
+    border-color: var(--color-primary);
+    color: white;
+}
+
+.btn-brand-primary:hover {
+    background-color: var(--color-secondary);
+    border-color: var(--color-secondary);
+    color: white;
+}
+
+.card {
+    border: none;
+    box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+    transition: transform 0.2s ease, box-shadow 0.2s ease;
+}
+
+.card:hover {
+    transform: translateY(-2px);
+    box-shadow: 0 4px 20px rgba(0,0,0,0.15);
+}
+
+.product-card {
+    height: 100%;
+}
+
+.product-image {
+    height: 200px;
+    object-fit: cover;
+    background-color: #f8f9fa;
+}
+
+.price {
+    font-weight: bold;
+    font-size: 1.1em;
+}
+
+.price-original {
+    text-decoration: line-through;
+    color: var(--color-text-secondary);
+    font-size: 0.9em;
+}
+
+.discount-badge {
+    background-color: var(--color-accent);
+    color: var(--color-text);
+}
+
+.stock-in {
+    color: var(--color-success);
+}
+
+.stock-low {
+    color: var(--color-warning);
+}
+
+.stock-out {
+    color: var(--color-error);
+}
+
+.hero-section {
+    background: linear-gradient(135deg, var(--color-primary), var(--color-secondary));
+    color: white;
+    padding: 4rem 0;
+}
+
+.footer {
+    background-color: var(--color-text);
+    color: var(--color-background);
+    margin-top: 3rem;
+}
+
+.search-bar {
+    border-radius: 25px;
+    border: 2px solid var(--color-primary);
+}
+
+.search-bar:focus {
+    border-color: var(--color-secondary);
+    box-shadow: 0 0 0 0.2rem rgba(var(--color-primary), 0.25);
+}
+
+@media (max-width: 768px) {
+    .hero-section {
+        padding: 2rem 0;
+    }
+    
+    .product-image {
+        height: 150px;
+    }
+}
+"""
+
+
 @dataclass
 class ColorScheme:
     """Color scheme configuration for brand theming."""
@@ -132,6 +246,24 @@ class BrandConfig:
             'meta_description': self.meta_description,
             'meta_keywords': self.meta_keywords
         }
+    
+    def to_css(self) -> str:
+        """Generate the brand stylesheet: CSS variables plus the shared rules."""
+        variables = {**self.colors.to_dict(), **self.typography.to_dict()}
+        lines = [':root {']
+        lines.extend(f"    {name}: {value};" for name, value in variables.items())
+        lines.append('}')
+        lines.append('')
+        lines.append('body {')
+        lines.append('    font-family: var(--font-family-primary);')
+        lines.append('    color: var(--color-text);')
+        lines.append('    background-color: var(--color-background);')
+        if self.assets.background_pattern:
+            lines.append(f"    background-image: url('{self.assets.background_pattern}');")
+            lines.append('    background-repeat: repeat;')
+            lines.append('    background-size: 200px;')
+        lines.append('}')
+        return '\n'.join(lines) + '\n' + THEME_BASE_CSS
 
 
 # Predefined brand configurations
@@ -210,4 +342,62 @@ def get_brand_config(brand_type: BrandType) -> BrandConfig:
         BrandType.POP_MART: POP_MART_CONFIG,
         BrandType.POKEMON: POKEMON_CONFIG
     }
-    return configs.get(brand_type, POP_MART_CONFIG)
\ No newline at end of file
+    return configs.get(brand_type, POP_MART_CONFIG)
+
+
+def freeze(value: Any) -> Any:
+    """Recursively convert dicts to read-only mappings and lists to tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+@dataclass(frozen=True)
+class CompiledTheme:
+    """Precomputed theme for one brand: frozen template dict and stylesheet file."""
+    
+    brand_type: BrandType
+    stylesheet: str  # Path relative to the static folder, e.g. themes/pop_mart.1a2b3c4d.css
+    theme: Mapping[str, Any]
+
+
+def compile_brand_themes(static_dir: str, subdir: str = 'themes') -> Dict[BrandType, CompiledTheme]:
+    """
+    Write a fingerprinted stylesheet per brand and precompute theme dicts.
+    
+    File names embed a hash of the CSS, so they can be cached indefinitely
+    and change whenever the theme does. Stale stylesheets of the same brand
+    are removed.
+    
+    Args:
+        static_dir: Static files directory served by the web app.
+        subdir: Subdirectory of static_dir for the generated stylesheets.
+    """
+    output_dir = Path(static_dir) / subdir
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    compiled = {}
+    for brand_type in BrandType:
+        config = get_brand_config(brand_type)
+        css = config.to_css()
+        digest = hashlib.sha256(css.encode('utf-8')).hexdigest()[:12]
+        filename = f"{brand_type.value}.{digest}.css"
+        
+        path = output_dir / filename
+        if not path.exists():
+            tmp_path = path.with_suffix('.tmp')
+            tmp_path.write_text(css, encoding='utf-8')
+            tmp_path.replace(path)  # Atomic so concurrent workers never serve partial files
+        for stale in output_dir.glob(f"{brand_type.value}.*.css"):
+            if stale.name != filename:
+                stale.unlink(missing_ok=True)
+        
+        stylesheet = f"{subdir}/{filename}"
+        compiled[brand_type] = CompiledTheme(
+            brand_type=brand_type,
+            stylesheet=stylesheet,
+            theme=freeze(dict(config.to_dict(), stylesheet=stylesheet))
+        )
+    return compiled
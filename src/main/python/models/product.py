@@ -4,7 +4,7 @@ Handles merchandise inventory tracking with unified backend structure.
 """
 
 from dataclasses import dataclass, field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Sequence, Tuple
 from datetime import datetime
 from enum import Enum
 
@@ -23,6 +23,46 @@ class StockStatus(Enum):
     DISCONTINUED = "discontinued"
 
 
+# Keys of Product.to_dict(), in order
+PRODUCT_FIELDS = (
+    'id', 'name', 'brand', 'source', 'purchase_link', 'price', 'original_price', 'stock_level',
+    'stock_status', 'image_url', 'video_url', 'description', 'category', 'tags', 'last_updated',
+    'metadata', 'is_on_sale', 'discount_percentage', 'availability_text'
+)
+
+# Computed to_dict() fields and the stored fields they are computed from
+DERIVED_PRODUCT_FIELDS = {
+    'is_on_sale': ('price', 'original_price'),
+    'discount_percentage': ('price', 'original_price'),
+    'availability_text': ('stock_level', 'stock_status'),
+}
+
+
+def parse_product_fields(value: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Parse a comma-separated sparse fieldset such as ``id,name,price``.
+    
+    Returns None, meaning every field, when value is empty. Raises
+    ValueError for unknown field names.
+    """
+    if not value:
+        return None
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in PRODUCT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown product fields: {', '.join(unknown)}")
+    return fields or None
+
+
+def product_columns(fields: Sequence[str]) -> List[str]:
+    """Stored columns needed to produce the given to_dict() fields."""
+    columns: Dict[str, None] = {}
+    for name in fields:
+        for column in DERIVED_PRODUCT_FIELDS.get(name, (name,)):
+            columns[column] = None
+    return list(columns)
+
+
 @dataclass
 class Product:
     """
@@ -69,31 +109,55 @@ class Product:
     @property
     def is_on_sale(self) -> bool:
         """Check if product is currently on sale."""
-        return (
-            self.original_price is not None 
-            and self.price < self.original_price
-        )
+        return self.sale_for(self.price, self.original_price)
     
     @property
     def discount_percentage(self) -> Optional[float]:
         """Calculate discount percentage if on sale."""
-        if not self.is_on_sale or not self.original_price:
-            return None
-        return round(((self.original_price - self.price) / self.original_price) * 100, 2)
+        return self.discount_for(self.price, self.original_price)
     
     @property
     def availability_text(self) -> str:
         """Get user-friendly availability text."""
+        return self.availability_text_for(self.stock_status, self.stock_level)
+    
+    @staticmethod
+    def sale_for(price: float, original_price: Optional[float]) -> bool:
+        """is_on_sale for the given prices, without building a Product."""
+        return (
+            original_price is not None 
+            and price < original_price
+        )
+    
+    @staticmethod
+    def discount_for(price: float, original_price: Optional[float]) -> Optional[float]:
+        """discount_percentage for the given prices, without building a Product."""
+        if not Product.sale_for(price, original_price) or not original_price:
+            return None
+        return round(((original_price - price) / original_price) * 100, 2)
+    
+    @staticmethod
+    def availability_text_for(stock_status: StockStatus, stock_level: int) -> str:
+        """availability_text for the given stock, without building a Product."""
         status_map = {
-            StockStatus.IN_STOCK: f"{self.stock_level} available",
-            StockStatus.LOW_STOCK: f"Only {self.stock_level} left",
+            StockStatus.IN_STOCK: f"{stock_level} available",
+            StockStatus.LOW_STOCK: f"Only {stock_level} left",
             StockStatus.OUT_OF_STOCK: "Out of stock",
             StockStatus.DISCONTINUED: "Discontinued"
         }
-        return status_map.get(self.stock_status, "Unknown")
+        return status_map.get(stock_status, "Unknown")
     
-    def to_dict(self) -> Dict[str, Any]:
-        """Convert product to dictionary for JSON serialization."""
+    def to_dict(self, fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        Convert product to dictionary for JSON serialization.
+        
+        Args:
+            fields: Only these keys, in this order (default: all of PRODUCT_FIELDS).
+        """
+        if fields is not None:
+            data = self.to_dict()
+            return {name: data[name] for name in fields}
+        
         return {
             'id': self.id,
             'name': self.name,
@@ -174,4 +238,42 @@ class StockAlert:
             'target_price': self.target_price,
             'is_active': self.is_active,
             'created_at': self.created_at.isoformat()
-        }
\ No newline at end of file
+        }
+
+
+@dataclass
+class CanonicalProduct:
+    """A real-world item that may be listed by several retailers."""
+    
+    id: str
+    brand: BrandType
+    name: str
+    name_key: str  # Normalized name tokens used for matching
+    category: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.now)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to dictionary for serialization."""
+        return {
+            'id': self.id,
+            'brand': self.brand.value,
+            'name': self.name,
+            'category': self.category,
+            'created_at': self.created_at.isoformat()
+        }
+
+
+@dataclass
+class CanonicalListing:
+    """Canonical product with its best current offer across retailers."""
+    
+    canonical: CanonicalProduct
+    best_offer: Product
+    offer_count: int
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to dictionary for serialization."""
+        data = self.canonical.to_dict()
+        data['offer_count'] = self.offer_count
+        data['best_offer'] = self.best_offer.to_dict()
+        return data
@@ -0,0 +1,165 @@
+"""
+Cross-retailer product canonicalization.
+Groups listings of the same item from different retailers under one canonical product.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from ..models.product import Product, BrandType, CanonicalProduct
+from ..core.database import DatabaseManager
+
+
+# Words that retailers add inconsistently and that don't identify an item
+STOP_WORDS = {
+    'a', 'an', 'and', 'the', 'of', 'for', 'with', 'new', 'official',
+    'pokemon', 'tcg', 'trading', 'card', 'game', 'pop', 'mart', 'series'
+}
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def normalize_name(name: str) -> List[str]:
+    """
+    Normalize a product name to sorted, de-duplicated match tokens.
+
+    Strips accents and punctuation, lowercases, spells out '&' and drops
+    stop words, so "Pokémon TCG: Scarlet & Violet Elite Trainer Box" and
+    "Scarlet and Violet Elite Trainer Box" produce the same tokens.
+    """
+    text = unicodedata.normalize('NFKD', name)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.lower().replace('&', ' and ')
+    tokens = {token for token in TOKEN_PATTERN.findall(text) if token not in STOP_WORDS}
+    return sorted(tokens)
+
+
+def canonical_id_for(brand: BrandType, name_key: str) -> str:
+    """Stable canonical id derived from the normalized name."""
+    digest = hashlib.sha1(f"{brand.value}:{name_key}".encode('utf-8')).hexdigest()
+    return f"cp_{digest[:16]}"
+
+
+class ProductCanonicalizer:
+    """
+    Assign retailer listings to canonical products.
+
+    Listings are matched first by normalized-name hash, then by Jaccard
+    similarity of name tokens against canonical products of the same brand,
+    using an in-memory inverted index from token to canonical ids so only
+    candidates sharing a token are scored.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, similarity_threshold: float = 0.75):
+        self.db = db_manager
+        self.similarity_threshold = similarity_threshold
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._by_key: Dict[Tuple[BrandType, str], CanonicalProduct] = {}
+        self._tokens: Dict[str, Set[str]] = {}
+        self._token_index: Dict[Tuple[BrandType, str], Set[str]] = {}
+        self._canonicals: Dict[str, CanonicalProduct] = {}
+
+    def assign(self, product: Product) -> CanonicalProduct:
+        """Link a product to its canonical product, creating one if needed."""
+        canonicals, links = self.link([product])
+        self.db.save_offers(links, canonicals)
+        return canonicals[0]
+
+    def assign_many(self, products: Sequence[Product]) -> int:
+        """Link several products to canonical products, saving new ones and the offers in one transaction."""
+        canonicals, links = self.link(products)
+        self.db.save_offers(links, canonicals)
+        return len(links)
+
+    def link(self, products: Sequence[Product]) -> Tuple[List[CanonicalProduct], List[Tuple[str, str]]]:
+        """
+        Match products to canonical products without saving anything.
+
+        Returns the canonical products linked to and the (product_id,
+        canonical_id) offers, for the caller to save in its own transaction,
+        e.g. through DatabaseManager.save_products. New canonical products
+        are indexed right away. Every linked canonical product is returned,
+        not only new ones, so an offer saved later never points to a
+        canonical product whose own transaction was rolled back.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            canonicals: Dict[str, CanonicalProduct] = {}
+            links = []
+            for product in products:
+                canonical = self._match(product) or self._create(product)
+                canonicals[canonical.id] = canonical
+                links.append((product.id, canonical.id))
+        return list(canonicals.values()), links
+
+    def backfill(self) -> int:
+        """Assign canonical products to every product without an offer."""
+        products = self.db.get_products_without_offers()
+        if products:
+            self.assign_many(products)
+            self.logger.info(f"Canonicalized {len(products)} products")
+        return len(products)
+
+    def _ensure_loaded(self):
+        """Load existing canonical products into the match index."""
+        if self._loaded:
+            return
+        for canonical in self.db.get_canonical_products():
+            self._index(canonical)
+        self._loaded = True
+
+    def _index(self, canonical: CanonicalProduct):
+        """Add a canonical product to the in-memory indexes."""
+        tokens = set(canonical.name_key.split())
+        self._canonicals[canonical.id] = canonical
+        self._by_key[(canonical.brand, canonical.name_key)] = canonical
+        self._tokens[canonical.id] = tokens
+        for token in tokens:
+            self._token_index.setdefault((canonical.brand, token), set()).add(canonical.id)
+
+    def _match(self, product: Product) -> Optional[CanonicalProduct]:
+        """Find the canonical product a listing belongs to, if any."""
+        tokens = normalize_name(product.name)
+        name_key = ' '.join(tokens)
+
+        exact = self._by_key.get((product.brand, name_key))
+        if exact is not None:
+            return exact
+        if not tokens:
+            return None
+
+        # Count shared tokens per candidate via the inverted index
+        overlaps = Counter()
+        for token in tokens:
+            overlaps.update(self._token_index.get((product.brand, token), ()))
+
+        best, best_score = None, 0.0
+        for canonical_id, shared in overlaps.items():
+            canonical = self._canonicals[canonical_id]
+            if product.category and canonical.category and product.category != canonical.category:
+                continue
+            score = shared / (len(tokens) + len(self._tokens[canonical_id]) - shared)
+            if score > best_score:
+                best, best_score = canonical, score
+
+        return best if best_score >= self.similarity_threshold else None
+
+    def _create(self, product: Product) -> CanonicalProduct:
+        """Index a new canonical product from its first listing; the caller saves it."""
+        name_key = ' '.join(normalize_name(product.name))
+        canonical = CanonicalProduct(
+            id=canonical_id_for(product.brand, name_key),
+            brand=product.brand,
+            name=product.name,
+            name_key=name_key,
+            category=product.category
+        )
+        self._index(canonical)
+        return canonical
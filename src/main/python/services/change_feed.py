@@ -0,0 +1,269 @@
+"""
+Change feed for live stock and price updates.
+Publishes product changes to Server-Sent Events subscribers from a shared ring buffer.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Callable, Collection, Dict, Iterator, List, Optional, Tuple
+
+from ..models.product import Product
+from ..core.database import ProductChange
+
+
+# Fields pushed to subscribers; other column changes don't produce an event
+FEED_FIELDS = ('price', 'original_price', 'stock_level', 'stock_status', 'availability_text')
+
+EVENT_PRODUCT = 'product'
+EVENT_DELETED = 'deleted'
+EVENT_RESET = 'reset'  # The client missed events and should refetch
+
+
+class StreamLimitReached(Exception):
+    """Raised when a broker already has its maximum number of open streams."""
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """One published change."""
+    
+    id: int
+    event: str
+    product_id: str
+    brand: Optional[str]
+    data: Dict[str, Any]
+    
+    def to_sse(self) -> str:
+        """Encode as a Server-Sent Events message."""
+        return f"id: {self.id}\nevent: {self.event}\ndata: {json.dumps(self.data)}\n\n"
+
+
+class ChangeBroker:
+    """
+    Pub/sub of product changes for streaming clients.
+    
+    Events go into a bounded ring buffer that every subscriber reads from,
+    so publishing costs the same however many clients are connected and an
+    idle client is just a thread waiting on a condition. Event ids increase
+    monotonically and start from the boot or reset time in milliseconds, so a client
+    resuming with Last-Event-ID after a restart, or after falling behind the
+    buffer, is told to refetch with a reset event.
+    
+    Under threaded workers that waiting thread is still a request thread,
+    so streams can't scale to thousands of idle clients per process;
+    max_subscribers keeps them to a few, and clients refused a stream poll
+    the database change cursor (get_changes_since) instead, which costs a
+    request per interval rather than a held thread.
+    
+    Register ``on_product_change`` as a database change listener.
+    """
+    
+    def __init__(
+        self,
+        load_product: Callable[[str], Optional[Product]],
+        buffer_size: int = 1024,
+        heartbeat: float = 15.0,
+        max_subscribers: Optional[int] = None,
+        max_states: int = 10000
+    ):
+        """
+        Initialize the broker.
+        
+        Args:
+            load_product: Reads a product after writes that only carry its id.
+            buffer_size: Number of recent events kept for resuming clients.
+            heartbeat: Seconds between keep-alive comments on idle streams.
+            max_subscribers: Open streams allowed at once; None for no limit.
+            max_states: Products whose last published state is remembered to
+                skip unchanged writes; the least recently changed are forgotten,
+                at the cost of possibly one repeated event each.
+        """
+        self.load_product = load_product
+        self.heartbeat = heartbeat
+        self.max_subscribers = max_subscribers
+        self.max_states = max_states
+        self._events: deque = deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        self._states: 'OrderedDict[str, Tuple[Any, ...]]' = OrderedDict()
+        self._subscribers = 0
+        self._closed = False
+        self.reset()
+    
+    @property
+    def last_event_id(self) -> int:
+        """Id of the latest event."""
+        return self._last_id
+    
+    @property
+    def subscriber_count(self) -> int:
+        """Number of open streams."""
+        return self._subscribers
+    
+    def publish(self, event: str, product_id: str, brand: Optional[str], data: Dict[str, Any]) -> ChangeEvent:
+        """Append an event and wake every subscriber."""
+        with self._condition:
+            self._last_id += 1
+            change = ChangeEvent(self._last_id, event, product_id, brand, data)
+            self._events.append(change)
+            self._condition.notify_all()
+        return change
+    
+    def on_product_change(self, change: ProductChange):
+        """Database change listener publishing visible stock and price changes."""
+        if change.deleted:
+            with self._condition:
+                self._states.pop(change.product_id, None)
+                self.publish(EVENT_DELETED, change.product_id, None, {'id': change.product_id})
+            return
+        
+        product = change.product or self.load_product(change.product_id)
+        if product is None:
+            return
+        data = {field: getattr(product, field) for field in FEED_FIELDS}
+        data['stock_status'] = product.stock_status.value
+        state = tuple(data.values())
+        data.update(id=product.id, brand=product.brand.value, last_updated=product.last_updated.isoformat())
+        
+        # Writes from request threads and the change poller can race; check and publish under one lock
+        with self._condition:
+            if self._states.get(product.id) == state:
+                return  # e.g. an alert subscription, which changes nothing clients show
+            self._states[product.id] = state
+            self._states.move_to_end(product.id)
+            while len(self._states) > self.max_states:
+                self._states.popitem(last=False)
+            self.publish(EVENT_PRODUCT, product.id, product.brand.value, data)
+    
+    def events_after(self, last_id: int) -> Tuple[List[ChangeEvent], bool]:
+        """
+        Buffered events newer than last_id.
+        
+        Returns the events and whether they are complete, i.e. no event
+        between last_id and the oldest buffered one was dropped.
+        """
+        with self._condition:
+            return self._events_after(last_id)
+    
+    def listen(
+        self,
+        last_event_id: Optional[int] = None,
+        brand: Optional[str] = None,
+        product_ids: Optional[Collection[str]] = None
+    ) -> Iterator[str]:
+        """
+        Stream matching events as Server-Sent Events text until close().
+        
+        Each open stream holds a server thread, so the subscriber slot is
+        taken here rather than when iteration starts, and is released when
+        the stream ends or is closed.
+        
+        Args:
+            last_event_id: Resume after this event; None starts from now.
+            brand: Only events for this brand value.
+            product_ids: Only events for these products.
+        
+        Raises:
+            StreamLimitReached: max_subscribers streams are already open.
+        """
+        def matches(change: ChangeEvent) -> bool:
+            if change.event == EVENT_RESET:
+                return True
+            if product_ids is not None and change.product_id not in product_ids:
+                return False
+            return brand is None or change.brand in (brand, None)
+        
+        with self._condition:
+            if self.max_subscribers is not None and self._subscribers >= self.max_subscribers:
+                raise StreamLimitReached(f"{self._subscribers} streams are already open")
+            self._subscribers += 1
+            cursor = self._last_id if last_event_id is None else last_event_id
+        return _Subscription(self._stream(cursor, matches), self._unsubscribe)
+    
+    def reset(self):
+        """
+        Start a new id sequence with an empty buffer, e.g. in a forked worker process.
+        
+        Workers forked from one app would otherwise number their events from
+        the same boot time, so a client resuming on another worker could be
+        sent that worker's unrelated events instead of a reset.
+        """
+        with self._condition:
+            self._events.clear()
+            self._states.clear()
+            self._last_id = int(time.time() * 1000)
+            self._first_id = self._last_id + 1  # Events before this were never buffered here
+    
+    def close(self):
+        """End every open stream."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+    
+    def _stream(self, cursor: int, matches: Callable[[ChangeEvent], bool]) -> Iterator[str]:
+        """Messages of one subscriber after cursor."""
+        yield "retry: 5000\n\n"
+        last_sent = time.monotonic()
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._closed or self._last_id != cursor, timeout=self.heartbeat)
+                if self._closed:
+                    return
+                events, complete = self._events_after(cursor)
+                latest = self._last_id
+            
+            if complete:
+                cursor = events[-1].id if events else cursor
+                message = ''.join(change.to_sse() for change in events if matches(change))
+            else:
+                cursor = latest
+                message = ChangeEvent(latest, EVENT_RESET, '', None, {}).to_sse()
+            
+            if message:
+                yield message
+            elif time.monotonic() - last_sent >= self.heartbeat:
+                yield ": keep-alive\n\n"
+            else:
+                continue
+            last_sent = time.monotonic()
+    
+    def _unsubscribe(self):
+        """Release a subscriber slot."""
+        with self._condition:
+            self._subscribers -= 1
+    
+    def _events_after(self, last_id: int) -> Tuple[List[ChangeEvent], bool]:
+        """events_after with the condition held."""
+        if last_id > self._last_id or last_id < self._first_id - 1:
+            return [], False  # From another process or before this one started
+        oldest = self._events[0].id if self._events else self._last_id + 1
+        if last_id + 1 < oldest:
+            return [], False  # Dropped from the buffer
+        return [change for change in self._events if change.id > last_id], True
+
+
+class _Subscription:
+    """Iterator over a subscriber's messages that releases its slot once, when exhausted or closed."""
+    
+    def __init__(self, messages: Iterator[str], release: Callable[[], None]):
+        self._messages = messages
+        self._release: Optional[Callable[[], None]] = release
+    
+    def __iter__(self) -> '_Subscription':
+        return self
+    
+    def __next__(self) -> str:
+        try:
+            return next(self._messages)
+        except StopIteration:
+            self.close()
+            raise
+    
+    def close(self):
+        """End the stream; WSGI servers call this when the client goes away."""
+        self._messages.close()
+        release, self._release = self._release, None
+        if release is not None:
+            release()
@@ -5,14 +5,35 @@ Handles Pop Mart and Pokémon card data collection with rate limiting and error
 
 import requests
 import time
+import json
+import re
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 from datetime import datetime
 from dataclasses import asdict
+from urllib.parse import urlparse
 import random
 
 from ..models.product import Product, BrandType, StockStatus
 from ..core.database import DatabaseManager
+from ..core.response_store import ResponseStore, StoredResponse
+from .canonicalizer import ProductCanonicalizer
+
+SITEMAP_LOC_PATTERN = re.compile(r'<loc>\s*(.*?)\s*</loc>', re.IGNORECASE)
+
+# Embedded schema.org data, which retailers publish for search engines
+JSON_LD_PATTERN = re.compile(
+    r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+    re.IGNORECASE | re.DOTALL
+)
+
+SCHEMA_AVAILABILITY = {
+    'instock': StockStatus.IN_STOCK,
+    'limitedavailability': StockStatus.LOW_STOCK,
+    'outofstock': StockStatus.OUT_OF_STOCK,
+    'soldout': StockStatus.OUT_OF_STOCK,
+    'discontinued': StockStatus.DISCONTINUED
+}
 
 
 class DataCollector:
@@ -25,29 +46,312 @@ class DataCollector:
             'User-Agent': 'aistocktrack/1.0 (Educational Project)'
         })
         self.rate_limit_delay = 2.0  # Seconds between requests
+        self.rate_limit_jitter = 1.0  # Random extra delay on top of rate_limit_delay
+        self.max_retries = 3  # Retries for 429 responses
+        self.max_retry_after = 60.0  # Cap on honored Retry-After values
         self.logger = logging.getLogger(__name__)
+        
+        # Crawl a retailer sitemap instead of the built-in sample data
+        self.base_url: Optional[str] = None
+        
+        # ETags of previously fetched pages for conditional requests
+        self._etags: Dict[str, str] = {}
+        self._sitemap_urls: List[str] = []
+        
+        # Called after every fetch with (url, status_code or None, elapsed seconds)
+        self.fetch_hooks: List[Callable[[str, Optional[int], float], None]] = []
+        
+        # Raw response archiving and offline replay
+        self.response_store: Optional[ResponseStore] = None
+        self.replay = False
+        self._replay_index: Optional[Dict[str, StoredResponse]] = None  # Latest entry per URL, read once
+        
+        # Groups listings of the same item across retailers
+        self.canonicalizer = ProductCanonicalizer(db_manager)
     
     def collect_data(self) -> List[Product]:
         """Override in subclasses to implement specific collection logic."""
         raise NotImplementedError
     
+    def attach_response_store(self, store: ResponseStore, replay: bool = False):
+        """
+        Archive raw response bodies to a store, or serve them from it.
+        
+        Args:
+            store: Content-addressed store for response bodies
+            replay: If True, requests are answered from the store and
+                never touch the network
+        """
+        self.response_store = store
+        self.replay = replay
+        self._replay_index = None
+    
     def _rate_limit(self):
         """Apply rate limiting between requests."""
-        time.sleep(self.rate_limit_delay + random.uniform(0, 1))
+        delay = self.rate_limit_delay + random.uniform(0, self.rate_limit_jitter)
+        if delay > 0:
+            time.sleep(delay)
     
     def _make_request(self, url: str, **kwargs) -> Optional[requests.Response]:
-        """Make HTTP request with error handling and rate limiting."""
+        """
+        Make HTTP request with error handling and rate limiting.
+        
+        Sends If-None-Match for pages fetched before, so unchanged pages
+        come back as 304 responses without a body. Honors Retry-After on
+        429 responses up to max_retries times.
+        """
+        if self.replay:
+            return self._replay_request(url)
+        
+        headers = dict(kwargs.pop('headers', None) or {})
+        etag = self._etags.get(url)
+        if etag:
+            headers['If-None-Match'] = etag
+        
         try:
-            self._rate_limit()
-            response = self.session.get(url, timeout=30, **kwargs)
+            for attempt in range(self.max_retries + 1):
+                self._rate_limit()
+                started = time.perf_counter()
+                try:
+                    response = self.session.get(url, timeout=30, headers=headers, **kwargs)
+                except requests.RequestException:
+                    self._run_fetch_hooks(url, None, time.perf_counter() - started)
+                    raise
+                self._run_fetch_hooks(url, response.status_code, time.perf_counter() - started)
+                
+                if response.status_code != 429 or attempt == self.max_retries:
+                    break
+                
+                retry_after = self._retry_after_seconds(response)
+                self.logger.warning(f"Rate limited by {url}, retrying in {retry_after:.1f}s")
+                time.sleep(retry_after)
+            
             response.raise_for_status()
+            if response.status_code == 304:
+                return response
+            
+            if response.headers.get('ETag'):
+                self._etags[url] = response.headers['ETag']
+            
+            if self.response_store is not None:
+                self.response_store.put(
+                    url,
+                    response.content,
+                    status_code=response.status_code,
+                    source=self.brand.value,
+                    content_type=response.headers.get('Content-Type')
+                )
             return response
         except requests.RequestException as e:
             self.logger.error(f"Request failed for {url}: {e}")
             return None
     
-    def update_database(self, products: List[Product]):
-        """Update database with collected products."""
+    def _retry_after_seconds(self, response: requests.Response) -> float:
+        """Get the delay requested by a 429 response."""
+        try:
+            retry_after = float(response.headers.get('Retry-After', self.rate_limit_delay))
+        except ValueError:
+            retry_after = self.rate_limit_delay
+        return min(max(retry_after, 0.0), self.max_retry_after)
+    
+    def _run_fetch_hooks(self, url: str, status_code: Optional[int], elapsed: float):
+        """Report a completed fetch to registered hooks."""
+        for hook in self.fetch_hooks:
+            try:
+                hook(url, status_code, elapsed)
+            except Exception as e:
+                self.logger.error(f"Fetch hook failed: {e}")
+    
+    def _crawl_sitemap(self) -> List[Product]:
+        """
+        Collect products by crawling the retailer sitemap at base_url.
+        
+        Pages that are unchanged since the last crawl (304) are skipped.
+        """
+        sitemap_url = f"{self.base_url.rstrip('/')}/sitemap/{self.brand.value}.xml"
+        response = self._make_request(sitemap_url)
+        if not response:
+            return []
+        if response.status_code != 304:
+            self._sitemap_urls = SITEMAP_LOC_PATTERN.findall(response.text)
+        
+        products = []
+        for page_url in self._sitemap_urls:
+            product_data = self._scrape_product_page(page_url)
+            if product_data:
+                products.append(self._build_product(product_data))
+        
+        self.logger.info(f"Crawled {len(products)} changed {self.brand.value} products from {self.base_url}")
+        return products
+    
+    def _replay_request(self, url: str) -> Optional[requests.Response]:
+        """Build a response from the latest stored body for a URL."""
+        if self.response_store is None:
+            self.logger.error(f"Replay requested for {url} without a response store")
+            return None
+        
+        if self._replay_index is None:
+            # One pass over the index instead of one per replayed URL
+            self._replay_index = self.response_store.latest_by_url()
+        entry = self._replay_index.get(url)
+        body = self.response_store.get(entry.digest) if entry else None
+        if body is None:
+            self.logger.warning(f"No stored response for {url}")
+            return None
+        
+        response = requests.Response()
+        response._content = body
+        response.status_code = entry.status_code
+        response.url = url
+        if entry.content_type:
+            response.headers['Content-Type'] = entry.content_type
+        return response
+    
+    def replay_stored_responses(self, until: Optional[datetime] = None) -> List[Product]:
+        """
+        Re-run page parsing over stored response bodies.
+        
+        Uses the latest stored body per URL for this collector's brand,
+        without any network access.
+        
+        Args:
+            until: Only consider bodies fetched at or before this time
+        """
+        if self.response_store is None:
+            raise ValueError("Replay requires a response store")
+        
+        products = []
+        for entry in self.response_store.latest_entries(source=self.brand.value, until=until):
+            body = self.response_store.get(entry.digest)
+            if body is None:
+                self.logger.warning(f"Missing stored object {entry.digest} for {entry.url}")
+                continue
+            
+            product_data = self._parse_product_page(entry.url, body.decode('utf-8', errors='replace'))
+            if product_data:
+                product_data.setdefault('last_updated', entry.timestamp)
+                products.append(self._build_product(product_data))
+        
+        self.logger.info(f"Replayed {len(products)} {self.brand.value} products from stored responses")
+        return products
+    
+    def _scrape_product_page(self, url: str) -> Optional[Dict[str, Any]]:
+        """Fetch and parse an individual product page."""
+        response = self._make_request(url)
+        if not response or response.status_code == 304:
+            return None
+        return self._parse_product_page(url, response.text)
+    
+    def _parse_product_page(self, url: str, body: str) -> Optional[Dict[str, Any]]:
+        """
+        Parse product data from a product page.
+        
+        Reads the schema.org Product object that retailers embed as JSON-LD.
+        Returns a dict in the shape accepted by _build_product, or None when
+        the page has no product data.
+        """
+        for match in JSON_LD_PATTERN.finditer(body):
+            try:
+                data = json.loads(match.group(1))
+            except ValueError:
+                continue
+            
+            candidates = data if isinstance(data, list) else data.get('@graph', [data])
+            for item in candidates:
+                if isinstance(item, dict) and item.get('@type') == 'Product':
+                    return self._product_data_from_schema(url, item)
+        
+        return None
+    
+    def _product_data_from_schema(self, url: str, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Map a schema.org Product object to collector product data."""
+        offers = item.get('offers') or {}
+        if isinstance(offers, list):
+            offers = offers[0] if offers else {}
+        
+        product_id = item.get('sku') or item.get('productID')
+        if not product_id or 'price' not in offers:
+            return None
+        
+        availability = str(offers.get('availability', '')).rsplit('/', 1)[-1].lower()
+        stock_status = SCHEMA_AVAILABILITY.get(availability)
+        
+        inventory = offers.get('inventoryLevel')
+        if isinstance(inventory, dict):
+            inventory = inventory.get('value')
+        if inventory is None:
+            stock_level = 0 if stock_status in (StockStatus.OUT_OF_STOCK, StockStatus.DISCONTINUED) else 1
+        else:
+            stock_level = int(inventory)
+        
+        original_price = None
+        specs = offers.get('priceSpecification') or []
+        if isinstance(specs, dict):
+            specs = [specs]
+        for spec in specs:
+            if str(spec.get('priceType', '')).endswith('ListPrice'):
+                original_price = float(spec['price'])
+        
+        image = item.get('image') or ''
+        if isinstance(image, list):
+            image = image[0] if image else ''
+        
+        keywords = item.get('keywords') or []
+        if isinstance(keywords, str):
+            keywords = [k.strip() for k in keywords.split(',') if k.strip()]
+        
+        seller = offers.get('seller') or {}
+        
+        product_data = {
+            'id': str(product_id),
+            'name': item.get('name', ''),
+            'source': seller.get('name') or urlparse(url).netloc,
+            'purchase_link': offers.get('url') or item.get('url') or url,
+            'price': float(offers['price']),
+            'original_price': original_price,
+            'stock_level': stock_level,
+            'image_url': image,
+            'description': item.get('description'),
+            'category': item.get('category'),
+            'tags': keywords
+        }
+        if stock_status == StockStatus.DISCONTINUED:
+            product_data['stock_status'] = stock_status
+        return product_data
+    
+    def _build_product(self, product_data: Dict[str, Any]) -> Product:
+        """Create a Product for this collector's brand from collected data."""
+        # Determine stock status
+        stock_level = product_data['stock_level']
+        stock_status = product_data.get('stock_status')
+        if stock_status is None:
+            if stock_level == 0:
+                stock_status = StockStatus.OUT_OF_STOCK
+            elif stock_level <= 5:
+                stock_status = StockStatus.LOW_STOCK
+            else:
+                stock_status = StockStatus.IN_STOCK
+        
+        return Product(
+            id=product_data['id'],
+            name=product_data['name'],
+            brand=self.brand,
+            source=product_data['source'],
+            purchase_link=product_data['purchase_link'],
+            price=product_data['price'],
+            original_price=product_data.get('original_price'),
+            stock_level=stock_level,
+            stock_status=stock_status,
+            image_url=product_data['image_url'],
+            description=product_data.get('description'),
+            category=product_data.get('category'),
+            tags=product_data.get('tags', []),
+            last_updated=product_data.get('last_updated') or datetime.now()
+        )
+    
+    def update_database(self, products: List[Product]) -> int:
+        """Update database with collected products. Returns the number written."""
+        written = 0
         for product in products:
             try:
                 # Check if product exists and update price history
@@ -64,10 +368,15 @@ class DataCollector:
                 
                 # Save/update product
                 self.db.save_product(product)
-                self.logger.info(f"Updated product: {product.name}")
+                self.canonicalizer.assign(product)
+                written += 1
+                self.logger.debug(f"Updated product: {product.name}")
                 
             except Exception as e:
                 self.logger.error(f"Failed to update product {product.id}: {e}")
+        
+        self.logger.info(f"Updated {written} {self.brand.value} products")
+        return written
 
 
 class PopMartCollector(DataCollector):
@@ -81,8 +390,12 @@ class PopMartCollector(DataCollector):
         """
         Collect Pop Mart product data.
         In a real implementation, this would scrape the Pop Mart website.
-        For now, this simulates data collection with sample updates.
+        For now, this simulates data collection with sample updates
+        unless base_url points at a retailer sitemap to crawl.
         """
+        if self.base_url:
+            return self._crawl_sitemap()
+        
         products = []
         
         # Simulate Pop Mart API or scraping
@@ -127,53 +440,10 @@ class PopMartCollector(DataCollector):
         ]
         
         for product_data in sample_products:
-            # Determine stock status
-            stock_level = product_data['stock_level']
-            if stock_level == 0:
-                stock_status = StockStatus.OUT_OF_STOCK
-            elif stock_level <= 5:
-                stock_status = StockStatus.LOW_STOCK
-            else:
-                stock_status = StockStatus.IN_STOCK
-            
-            product = Product(
-                id=product_data['id'],
-                name=product_data['name'],
-                brand=self.brand,
-                source=product_data['source'],
-                purchase_link=product_data['purchase_link'],
-                price=product_data['price'],
-                original_price=product_data.get('original_price'),
-                stock_level=stock_level,
-                stock_status=stock_status,
-                image_url=product_data['image_url'],
-                description=product_data['description'],
-                category=product_data['category'],
-                tags=product_data['tags'],
-                last_updated=datetime.now()
-            )
-            products.append(product)
+            products.append(self._build_product(product_data))
         
         self.logger.info(f"Collected {len(products)} Pop Mart products")
         return products
-    
-    def _scrape_product_page(self, url: str) -> Optional[Dict[str, Any]]:
-        """
-        Scrape individual product page.
-        In a real implementation, this would parse HTML/JSON responses.
-        """
-        response = self._make_request(url)
-        if not response:
-            return None
-        
-        # Simulated parsing logic
-        # In reality, you'd use BeautifulSoup or similar
-        return {
-            'name': 'Sample Product',
-            'price': 12.99,
-            'stock_level': 10,
-            'image_url': '/static/images/sample.jpg'
-        }
 
 
 class PokemonCollector(DataCollector):
@@ -186,8 +456,12 @@ class PokemonCollector(DataCollector):
     def collect_data(self) -> List[Product]:
         """
         Collect Pokémon card product data.
-        Simulates data collection from multiple sources.
+        Simulates data collection from multiple sources unless base_url
+        points at a retailer sitemap to crawl.
         """
+        if self.base_url:
+            return self._crawl_sitemap()
+        
         products = []
         
         # Simulate multiple retailer data
@@ -232,32 +506,7 @@ class PokemonCollector(DataCollector):
         ]
         
         for product_data in sample_products:
-            # Determine stock status
-            stock_level = product_data['stock_level']
-            if stock_level == 0:
-                stock_status = StockStatus.OUT_OF_STOCK
-            elif stock_level <= 5:
-                stock_status = StockStatus.LOW_STOCK
-            else:
-                stock_status = StockStatus.IN_STOCK
-            
-            product = Product(
-                id=product_data['id'],
-                name=product_data['name'],
-                brand=self.brand,
-                source=product_data['source'],
-                purchase_link=product_data['purchase_link'],
-                price=product_data['price'],
-                original_price=product_data.get('original_price'),
-                stock_level=stock_level,
-                stock_status=stock_status,
-                image_url=product_data['image_url'],
-                description=product_data['description'],
-                category=product_data['category'],
-                tags=product_data['tags'],
-                last_updated=datetime.now()
-            )
-            products.append(product)
+            products.append(self._build_product(product_data))
         
         self.logger.info(f"Collected {len(products)} Pokémon products")
         return products
@@ -266,18 +515,44 @@ class PokemonCollector(DataCollector):
 class DataCollectionManager:
     """Manages data collection from all sources."""
     
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        response_store: Optional[ResponseStore] = None,
+        replay: bool = False
+    ):
+        """
+        Initialize collection manager.
+        
+        Args:
+            db_manager: Database to update
+            response_store: Optional store that archives raw response bodies
+            replay: Re-parse stored bodies instead of collecting from retailers
+        """
         self.db = db_manager
         self.collectors = [
             PopMartCollector(db_manager),
             PokemonCollector(db_manager)
         ]
+        self.replay = replay
         self.logger = logging.getLogger(__name__)
+        
+        # Share one canonical index so listings match across collectors
+        self.canonicalizer = ProductCanonicalizer(db_manager)
+        for collector in self.collectors:
+            collector.canonicalizer = self.canonicalizer
+        
+        if replay and response_store is None:
+            raise ValueError("Replay mode requires a response store")
+        if response_store is not None:
+            for collector in self.collectors:
+                collector.attach_response_store(response_store, replay=replay)
     
     def run_collection(self) -> Dict[str, Any]:
         """Run data collection from all sources."""
         results = {
             'timestamp': datetime.now().isoformat(),
+            'mode': 'replay' if self.replay else 'live',
             'collections': {},
             'total_products': 0,
             'errors': []
@@ -286,12 +561,20 @@ class DataCollectionManager:
         for collector in self.collectors:
             try:
                 self.logger.info(f"Starting collection for {collector.brand.value}")
-                products = collector.collect_data()
-                collector.update_database(products)
+                if self.replay:
+                    products = collector.replay_stored_responses()
+                else:
+                    products = collector.collect_data()
+                
+                write_started = time.perf_counter()
+                written = collector.update_database(products)
+                write_seconds = time.perf_counter() - write_started
                 
                 results['collections'][collector.brand.value] = {
                     'success': True,
                     'products_collected': len(products),
+                    'products_written': written,
+                    'write_seconds': round(write_seconds, 6),
                     'timestamp': datetime.now().isoformat()
                 }
                 results['total_products'] += len(products)
@@ -328,10 +611,15 @@ class DataCollectionManager:
 
 
 # Utility functions for manual data collection
-def collect_all_data(db_path: Optional[str] = None) -> Dict[str, Any]:
-    """Manually trigger data collection."""
+def collect_all_data(
+    db_path: Optional[str] = None,
+    response_store_path: Optional[str] = None,
+    replay: bool = False
+) -> Dict[str, Any]:
+    """Manually trigger data collection, optionally archiving or replaying responses."""
     db_manager = DatabaseManager(db_path)
-    collection_manager = DataCollectionManager(db_manager)
+    store = ResponseStore(response_store_path) if response_store_path else None
+    collection_manager = DataCollectionManager(db_manager, response_store=store, replay=replay)
     return collection_manager.run_collection()
 
 
@@ -3,29 +3,88 @@ Product service layer for business logic and data operations.
 Handles product retrieval, filtering, and stock management.
 """
 
-from typing import List, Optional, Dict, Any
+import json
+import math
+from typing import List, Optional, Dict, Any, Callable, Iterable, Iterator, Sequence, Tuple, Union
 from datetime import datetime, timedelta
 
-from ..models.product import Product, BrandType, StockStatus, PriceHistory, StockAlert
-from ..core.database import DatabaseManager
+from ..models.product import (
+    Product, BrandType, StockStatus, PriceHistory, StockAlert, CanonicalListing, PRODUCT_FIELDS
+)
+from ..core.database import DatabaseManager, ProductChangeSet, ProductUpdate, UPDATE_APPLIED
+from ..core.cache import ProductCache
+from ..utils.downsampling import downsample_history
+from .canonicalizer import ProductCanonicalizer
+from .related_products import RelatedProductsIndex
+
+
+# Largest batch accepted by bulk_update_products
+MAX_BULK_UPDATES = 10000
+
+# Products saved per transaction by ingest_products
+INGEST_CHUNK_SIZE = 2000
+
+# Line errors listed in an ingest summary; later ones are only counted
+MAX_INGEST_ERRORS = 1000
+
+# Longest line ingest_products parses; pass it to iter_lines so longer lines aren't buffered whole
+MAX_INGEST_LINE_BYTES = 256 * 1024
+
+# Product fields an ingested line must give as strings, and those that may also be null
+INGEST_TEXT_FIELDS = ('name', 'source', 'purchase_link', 'image_url')
+INGEST_OPTIONAL_TEXT_FIELDS = ('video_url', 'description', 'category')
+
+# Most products accepted by get_price_histories
+MAX_HISTORY_IDS = 100
+
+# Column order of CSV exports
+PRODUCT_EXPORT_COLUMNS = PRODUCT_FIELDS
+PRICE_HISTORY_EXPORT_COLUMNS = ('product_id', 'price', 'timestamp', 'source')
+
+# Largest page returned by get_changes_since
+MAX_CHANGES_PAGE = 5000
+
+
+def _window_start(days: int) -> datetime:
+    """Start of a history window: midnight days ago, so windows move once a day."""
+    return datetime.combine(datetime.now().date() - timedelta(days=days), datetime.min.time())
+
+
+def _is_price(value: Any) -> bool:
+    """Whether value is a finite, non-negative number; JSON bools and NaN aren't prices."""
+    return not isinstance(value, bool) and isinstance(value, (int, float)) and math.isfinite(value) and value >= 0
 
 
 class ProductService:
     """Service class for product-related operations."""
     
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        related_index: Optional[RelatedProductsIndex] = None,
+        cache: Optional[ProductCache] = None,
+        canonicalizer: Optional[ProductCanonicalizer] = None
+    ):
         self.db = db_manager
+        self.related_index = related_index
+        self.cache = cache
+        self.canonicalizer = canonicalizer or ProductCanonicalizer(db_manager)
     
     def get_all_products(self, limit: Optional[int] = None) -> List[Product]:
         """Get all products with optional limit."""
-        return self.db.get_products(limit=limit)
+        return self._cached_list(('all', None, limit), lambda: self.db.get_products(limit=limit))
     
     def get_products_by_brand(self, brand: BrandType, limit: Optional[int] = None) -> List[Product]:
         """Get products filtered by brand."""
-        return self.db.get_products(brand=brand, limit=limit)
+        return self._cached_list(
+            ('brand', brand.value, limit),
+            lambda: self.db.get_products(brand=brand, limit=limit)
+        )
     
     def get_product_by_id(self, product_id: str) -> Optional[Product]:
         """Get single product by ID."""
+        if self.cache is not None:
+            return self.cache.get_product(product_id)
         return self.db.get_product_by_id(product_id)
     
     def search_products(
@@ -35,8 +94,9 @@ class ProductService:
         search_term: Optional[str] = None,
         sort_by: str = 'name',
         page: int = 1,
-        per_page: int = 50
-    ) -> List[Product]:
+        per_page: int = 50,
+        fields: Optional[Sequence[str]] = None
+    ) -> Union[List[Product], List[Dict[str, Any]]]:
         """
         Search products with multiple filters.
         
@@ -47,52 +107,55 @@ class ProductService:
             sort_by: Sort field ('name', 'price', 'stock_level', 'last_updated')
             page: Page number for pagination
             per_page: Items per page
+            fields: Return dicts of only these to_dict() fields
         """
-        return self.db.search_products(
+        search_term = search_term.strip() if search_term else None
+        key = (
+            'search', brand.value if brand else None, category,
+            search_term.lower() if search_term else None, sort_by, page, per_page,
+            tuple(fields) if fields else None
+        )
+        return self._cached_list(key, lambda: self.db.search_products(
             brand=brand,
             category=category,
             search_term=search_term,
             sort_by=sort_by,
             page=page,
-            per_page=per_page
-        )
+            per_page=per_page,
+            fields=fields
+        ))
     
     def get_categories_by_brand(self, brand: BrandType) -> List[str]:
         """Get available categories for a specific brand."""
-        return self.db.get_categories(brand=brand)
+        return self._cached_list(('categories', brand.value), lambda: self.db.get_categories(brand=brand))
     
     def get_all_categories(self) -> List[str]:
         """Get all available categories across all brands."""
-        return self.db.get_categories()
+        return self._cached_list(('categories', None), self.db.get_categories)
     
     def get_featured_products(self, brand: BrandType, limit: int = 6) -> List[Product]:
         """
         Get featured products for homepage display.
-        Returns products that are in stock and have good availability.
+        Returns in-stock products ranked by the stored featured score, which
+        favours deep stock, discounts, alert subscribers and recent updates.
         """
-        products = self.db.get_products(
-            brand=brand,
-            stock_status=StockStatus.IN_STOCK,
-            limit=limit * 2  # Get more to filter from
+        return self._cached_list(
+            ('featured', brand.value, limit),
+            lambda: self.db.get_featured_products(brand, limit=limit)
         )
-        
-        # Prioritize products with good stock levels
-        featured = []
-        for product in products:
-            if len(featured) >= limit:
-                break
-            if product.stock_level > 10 or product.is_on_sale:
-                featured.append(product)
-        
-        # Fill remaining slots with any in-stock products
-        if len(featured) < limit:
-            for product in products:
-                if len(featured) >= limit:
-                    break
-                if product not in featured:
-                    featured.append(product)
-        
-        return featured[:limit]
+    
+    def get_canonical_listings(
+        self,
+        brand: Optional[BrandType] = None,
+        page: int = 1,
+        per_page: int = 50
+    ) -> List[CanonicalListing]:
+        """Get one listing per canonical product with its best current offer."""
+        return self.db.get_best_offers(brand=brand, page=page, per_page=per_page)
+    
+    def get_canonical_offers(self, canonical_id: str) -> List[Product]:
+        """Get every retailer offer for a canonical product, cheapest first."""
+        return self.db.get_offers(canonical_id)
     
     def get_related_products(
         self, 
@@ -100,40 +163,109 @@ class ProductService:
         brand: BrandType, 
         limit: int = 4
     ) -> List[Product]:
-        """Get products related to the given product."""
-        current_product = self.get_product_by_id(product_id)
-        if not current_product:
-            return []
-        
-        # Get products from same category first
-        related = self.db.search_products(
-            brand=brand,
-            category=current_product.category,
-            limit=limit * 2
-        )
+        """
+        Get products related to the given product.
         
-        # Remove current product from results
-        related = [p for p in related if p.id != product_id]
+        Uses the precomputed related-products index when available, filling
+        any remaining slots with other products of the same brand.
+        """
+        if self.related_index is not None:
+            related = self._products_by_ids(self.related_index.related_ids(product_id, limit))
+        else:
+            current_product = self.get_product_by_id(product_id)
+            if not current_product:
+                return []
+            
+            # Get products from same category first
+            related = self.db.search_products(
+                brand=brand,
+                category=current_product.category,
+                per_page=limit + 1
+            )
+            related = [p for p in related if p.id != product_id]
         
         # If not enough from same category, fill with brand products
         if len(related) < limit:
-            additional = self.db.get_products(brand=brand, limit=limit * 2)
-            for product in additional:
+            seen = {p.id for p in related}
+            seen.add(product_id)
+            for product in self.db.get_products(brand=brand, limit=limit + len(seen)):
                 if len(related) >= limit:
                     break
-                if product.id != product_id and product not in related:
+                if product.id not in seen:
                     related.append(product)
+                    seen.add(product.id)
         
         return related[:limit]
     
     def get_price_history(
         self, 
         product_id: str, 
-        days: int = 30
+        days: int = 30,
+        max_points: Optional[int] = None
     ) -> List[PriceHistory]:
-        """Get price history for a product over specified days."""
-        since_date = datetime.now() - timedelta(days=days)
-        return self.db.get_price_history(product_id, since_date)
+        """
+        Get price history for a product over specified days.
+        
+        Args:
+            product_id: Product to read
+            days: Window length in whole days, before today
+            max_points: Downsample longer series to this many points with LTTB
+        """
+        since_date = _window_start(days)
+        history = self.db.get_price_history(product_id, since_date)
+        return downsample_history(history, max_points) if max_points is not None else history
+    
+    def get_price_histories(
+        self,
+        product_ids: Sequence[str],
+        days: int = 30,
+        resolution: Optional[str] = None,
+        max_points: Optional[int] = None
+    ) -> Dict[str, List[PriceHistory]]:
+        """
+        Get price history of several products over specified days, in one query.
+        
+        Args:
+            product_ids: Up to MAX_HISTORY_IDS products; duplicates are ignored
+            days: Window length in whole days, before today
+            resolution: None for every point, or 'hour', 'day' or 'week'
+                for the last point of each period
+            max_points: Downsample longer series to this many points with LTTB
+        """
+        product_ids = list(dict.fromkeys(product_ids))
+        if not product_ids:
+            raise ValueError("At least one product id is required")
+        if len(product_ids) > MAX_HISTORY_IDS:
+            raise ValueError(f"At most {MAX_HISTORY_IDS} product ids per request")
+        if days < 1:
+            raise ValueError("days must be at least 1")
+        
+        since_date = _window_start(days)
+        histories = self.db.get_price_histories(product_ids, since_date, resolution)
+        if max_points is not None:
+            histories = {
+                product_id: downsample_history(history, max_points)
+                for product_id, history in histories.items()
+            }
+        return histories
+    
+    def export_products(
+        self,
+        brand: Optional[BrandType] = None,
+        category: Optional[str] = None,
+        search_term: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Every product matching the search filters, as dicts, from one snapshot."""
+        return (product.to_dict() for product in self.db.export_products(brand, category, search_term))
+    
+    def export_price_history(
+        self,
+        product_ids: Optional[List[str]] = None,
+        days: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Price history of some or all products, as dicts, from one snapshot."""
+        since_date = datetime.now() - timedelta(days=days) if days is not None else None
+        return (point.to_dict() for point in self.db.export_price_history(product_ids, since_date))
     
     def add_price_point(
         self, 
@@ -167,84 +299,304 @@ class ProductService:
         self.db.save_stock_alert(alert)
         return alert
     
-    def get_low_stock_products(self, threshold: int = 5) -> List[Product]:
-        """Get products with low stock levels."""
-        all_products = self.db.get_products()
-        return [
-            p for p in all_products 
-            if p.stock_level <= threshold and p.stock_status != StockStatus.OUT_OF_STOCK
-        ]
+    def get_low_stock_products(
+        self,
+        threshold: int = 5,
+        brand: Optional[BrandType] = None,
+        page: int = 1,
+        per_page: int = 50,
+        fields: Optional[Sequence[str]] = None
+    ) -> Union[List[Product], List[Dict[str, Any]]]:
+        """Get products with low stock levels, as dicts of only fields if given."""
+        return self.db.get_low_stock_products(
+            threshold=threshold, brand=brand, page=page, per_page=per_page, fields=fields
+        )
     
-    def get_price_drop_products(self, days: int = 7) -> List[Product]:
-        """Get products that have had recent price drops."""
-        price_drops = []
-        products = self.db.get_products(limit=100)  # Check recent products
-        
-        for product in products:
-            history = self.get_price_history(product.id, days)
-            if len(history) >= 2:
-                # Check if price has decreased from earliest to latest
-                earliest_price = history[-1].price  # Oldest entry
-                latest_price = history[0].price     # Newest entry
-                
-                if latest_price < earliest_price:
-                    price_drops.append(product)
-        
-        return price_drops
+    def get_price_drop_products(
+        self,
+        days: int = 7,
+        brand: Optional[BrandType] = None,
+        page: int = 1,
+        per_page: int = 50,
+        fields: Optional[Sequence[str]] = None
+    ) -> Union[List[Product], List[Dict[str, Any]]]:
+        """Get products that have had recent price drops, as dicts of only fields if given."""
+        since_date = datetime.now() - timedelta(days=days)
+        return self.db.get_price_drop_products(
+            since_date, brand=brand, page=page, per_page=per_page, fields=fields
+        )
     
     def update_product_stock(
         self, 
         product_id: str, 
         stock_level: int,
-        stock_status: Optional[StockStatus] = None
+        stock_status: Optional[StockStatus] = None,
+        expected_last_updated: Optional[datetime] = None
     ) -> Optional[Product]:
-        """Update product stock information."""
-        product = self.get_product_by_id(product_id)
-        if not product:
-            return None
-        
-        # Auto-determine stock status if not provided
-        if stock_status is None:
-            if stock_level == 0:
-                stock_status = StockStatus.OUT_OF_STOCK
-            elif stock_level <= 5:
-                stock_status = StockStatus.LOW_STOCK
-            else:
-                stock_status = StockStatus.IN_STOCK
-        
-        product.stock_level = stock_level
-        product.stock_status = stock_status
-        product.last_updated = datetime.now()
+        """
+        Update product stock information.
         
-        self.db.update_product(product)
-        return product
+        Returns the updated product, or None if it doesn't exist or was
+        modified after expected_last_updated.
+        """
+        update = ProductUpdate(
+            product_id,
+            stock_level=stock_level,
+            stock_status=stock_status or self.stock_status_for(stock_level),
+            expected_last_updated=expected_last_updated
+        )
+        return self._apply_single_update(update)
     
     def update_product_price(
         self, 
         product_id: str, 
         new_price: float,
-        source: Optional[str] = None
+        source: Optional[str] = None,
+        expected_last_updated: Optional[datetime] = None
     ) -> Optional[Product]:
-        """Update product price and record in history."""
-        product = self.get_product_by_id(product_id)
-        if not product:
+        """Update product price; changed prices are recorded in history."""
+        update = ProductUpdate(
+            product_id,
+            price=new_price,
+            source=source,
+            expected_last_updated=expected_last_updated
+        )
+        return self._apply_single_update(update)
+    
+    def bulk_update_products(self, updates: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """
+        Apply many stock and price changes in one transaction.
+        
+        Args:
+            updates: Dicts with product_id and any of stock_level, stock_status,
+                price, source and expected_last_updated (ISO timestamp).
+        
+        Returns:
+            One {'product_id', 'status'} result per update, in order.
+        """
+        if len(updates) > MAX_BULK_UPDATES:
+            raise ValueError(f"At most {MAX_BULK_UPDATES} updates per request")
+        
+        parsed = [self._parse_update(data) for data in updates]
+        results = self.db.apply_product_updates(parsed)
+        return [
+            {'product_id': update.product_id, 'status': status}
+            for update, status in zip(parsed, results)
+        ]
+    
+    def ingest_products(
+        self,
+        lines: Iterable[bytes],
+        source: Optional[str] = None,
+        chunk_size: int = INGEST_CHUNK_SIZE
+    ) -> Dict[str, Any]:
+        """
+        Validate and upsert products from NDJSON lines.
+        
+        Lines are consumed lazily and saved chunk_size products per
+        transaction, so memory doesn't grow with the input. Invalid lines
+        and lines over MAX_INGEST_LINE_BYTES are reported and skipped; the
+        rest of the input is still saved.
+        
+        Args:
+            lines: One JSON product per line, in Product.from_dict shape.
+            source: Recorded with price history entries.
+            chunk_size: Products saved per transaction.
+        
+        Returns:
+            Counts of received, created, updated, unchanged and failed lines,
+            with up to MAX_INGEST_ERRORS {'line', 'error'} entries.
+        """
+        summary: Dict[str, Any] = {
+            'received': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'failed': 0, 'errors': []
+        }
+        chunk: List[Tuple[int, Product]] = []
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            summary['received'] += 1
+            if len(line) > MAX_INGEST_LINE_BYTES:
+                self._ingest_error(summary, line_number, f"Line longer than {MAX_INGEST_LINE_BYTES} bytes")
+                continue
+            try:
+                chunk.append((line_number, self._parse_product(line)))
+            except (ValueError, KeyError, TypeError) as e:
+                self._ingest_error(summary, line_number, f"Missing field {e}" if isinstance(e, KeyError) else str(e))
+                continue
+            
+            if len(chunk) >= chunk_size:
+                self._save_chunk(chunk, source, summary)
+                chunk = []
+        if chunk:
+            self._save_chunk(chunk, source, summary)
+        return summary
+    
+    def delete_product(self, product_id: str) -> bool:
+        """Delete a product; clients syncing changes see it as deleted."""
+        return self.db.delete_product(product_id)
+    
+    def get_changes_since(self, since: int, limit: int = 500) -> ProductChangeSet:
+        """
+        Get products changed and deleted after a change cursor.
+        
+        Args:
+            since: Cursor returned by the previous call, or 0 for everything.
+            limit: Page size, capped at MAX_CHANGES_PAGE; 0 returns only the
+                latest cursor, to follow changes from now on.
+        """
+        if since < 0 or limit < 0:
+            raise ValueError("since and limit must be >= 0")
+        return self.db.get_changes_since(since, min(limit, MAX_CHANGES_PAGE))
+    
+    def get_catalog_version(self) -> Tuple[int, float]:
+        """Catalog write counter and Unix time of the last write."""
+        if self.cache is not None:
+            return self.cache.get_catalog_version()
+        return self.db.get_catalog_version()
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Hit, miss and eviction counters of the product cache."""
+        return self.cache.stats() if self.cache is not None else {}
+    
+    def _cached_list(self, key: tuple, loader: Callable[[], List[Any]]) -> List[Any]:
+        """Read a list through the cache when one is configured."""
+        if self.cache is None:
+            return loader()
+        return self.cache.get_list(key, loader)
+    
+    def _products_by_ids(self, product_ids: List[str]) -> List[Product]:
+        """Get products by id through the cache when one is configured."""
+        if self.cache is None:
+            return self.db.get_products_by_ids(product_ids)
+        return self.cache.get_products_by_ids(product_ids)
+    
+    @staticmethod
+    def stock_status_for(stock_level: int) -> StockStatus:
+        """Derive the stock status for a stock level."""
+        if stock_level == 0:
+            return StockStatus.OUT_OF_STOCK
+        if stock_level <= 5:
+            return StockStatus.LOW_STOCK
+        return StockStatus.IN_STOCK
+    
+    def _apply_single_update(self, update: ProductUpdate) -> Optional[Product]:
+        """Apply one targeted update and return the product if it was written."""
+        result, = self.db.apply_product_updates([update])
+        if result != UPDATE_APPLIED:
             return None
+        return self.get_product_by_id(update.product_id)
+    
+    def _parse_update(self, data: Any) -> ProductUpdate:
+        """Validate one bulk update entry."""
+        if not isinstance(data, dict):
+            raise ValueError("Each update must be a JSON object")
+        product_id = data.get('product_id')
+        if not product_id or not isinstance(product_id, str):
+            raise ValueError("Each update requires a product_id")
+        
+        stock_level = data.get('stock_level')
+        price = data.get('price')
+        if stock_level is None and price is None:
+            raise ValueError(f"Update for {product_id} has neither stock_level nor price")
+        # bool is an int subclass; reject it so true/false aren't written as 1/0
+        if stock_level is not None and (
+            isinstance(stock_level, bool) or not isinstance(stock_level, int) or stock_level < 0
+        ):
+            raise ValueError(f"Invalid stock_level for {product_id}")
+        if price is not None and not _is_price(price):
+            raise ValueError(f"Invalid price for {product_id}")
+        
+        stock_status = data.get('stock_status')
+        if stock_status is not None:
+            stock_status = StockStatus(stock_status)
+        elif stock_level is not None:
+            stock_status = self.stock_status_for(stock_level)
         
-        # Record price change in history if different
-        if product.price != new_price:
-            self.add_price_point(product_id, new_price, source)
+        expected = data.get('expected_last_updated')
+        return ProductUpdate(
+            product_id,
+            stock_level=stock_level,
+            stock_status=stock_status,
+            price=float(price) if price is not None else None,
+            source=data.get('source'),
+            expected_last_updated=datetime.fromisoformat(expected) if expected else None
+        )
+    
+    def _parse_product(self, line: bytes) -> Product:
+        """
+        Validate one ingested product line.
         
-        product.price = new_price
-        product.last_updated = datetime.now()
+        Every stored column is checked for presence and type here, so a bad
+        line is reported on its own instead of failing its chunk's
+        transaction, and nothing is stored that pages can't render.
+        """
+        data = json.loads(line)
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object")
+        if not data.get('id') or not isinstance(data['id'], str):
+            raise ValueError("Each product requires a string id")
         
-        self.db.update_product(product)
+        product = Product.from_dict(data)
+        for name in INGEST_TEXT_FIELDS:
+            if not isinstance(getattr(product, name), str):
+                raise ValueError(f"Invalid {name} for {product.id}: expected a string")
+        for name in INGEST_OPTIONAL_TEXT_FIELDS:
+            if getattr(product, name) is not None and not isinstance(getattr(product, name), str):
+                raise ValueError(f"Invalid {name} for {product.id}: expected a string or null")
+        if not _is_price(product.price):
+            raise ValueError(f"Invalid price for {product.id}")
+        if product.original_price is not None and not _is_price(product.original_price):
+            raise ValueError(f"Invalid original_price for {product.id}")
+        if isinstance(product.stock_level, bool) or not isinstance(product.stock_level, int) or product.stock_level < 0:
+            raise ValueError(f"Invalid stock_level for {product.id}")
+        if not isinstance(product.tags, list) or not all(isinstance(tag, str) for tag in product.tags):
+            raise ValueError(f"Invalid tags for {product.id}: expected a list of strings")
+        if not isinstance(product.metadata, dict):
+            raise ValueError(f"Invalid metadata for {product.id}: expected an object")
+        if not isinstance(product.last_updated, datetime):
+            raise ValueError(f"Invalid last_updated for {product.id}: expected an ISO timestamp")
         return product
     
+    def _save_chunk(self, chunk: List[Tuple[int, Product]], source: Optional[str], summary: Dict[str, Any]):
+        """
+        Save one chunk of ingested products, canonicalize the written ones and count the outcomes.
+        
+        Written products are linked to canonical products in the chunk's
+        transaction, so a renamed product may move to another one; unchanged
+        products keep theirs. If the transaction fails, its lines are saved
+        one at a time so only the lines that fail on their own are reported.
+        """
+        products = [product for _, product in chunk]
+        try:
+            results = self.db.save_products(products, source=source, canonicalize=self.canonicalizer.link)
+        except Exception as e:
+            if len(chunk) == 1:
+                self._ingest_error(summary, chunk[0][0], f"Could not save {products[0].id}: {e}")
+                return
+            for item in chunk:
+                self._save_chunk([item], source, summary)
+            return
+        
+        for status in results.values():
+            summary[status] += 1
+    
+    @staticmethod
+    def _ingest_error(summary: Dict[str, Any], line_number: int, error: str):
+        """Count a failed ingest line, listing it while there is room."""
+        summary['failed'] += 1
+        if len(summary['errors']) < MAX_INGEST_ERRORS:
+            summary['errors'].append({'line': line_number, 'error': error})
+    
     def get_statistics(self, brand: Optional[BrandType] = None) -> Dict[str, Any]:
-        """Get general statistics about products."""
-        products = self.db.get_products(brand=brand)
+        """
+        Get general statistics about products.
         
-        if not products:
+        Reads the catalog_stats aggregates that the database maintains on
+        every product write, instead of scanning products.
+        """
+        rows = self.db.get_catalog_stats(brand=brand)
+        
+        if not rows:
             return {
                 'total_products': 0,
                 'in_stock': 0,
@@ -254,26 +606,43 @@ class ProductService:
                 'categories': []
             }
         
-        # Count by status
-        status_counts = {}
-        for status in StockStatus:
-            status_counts[status.value] = len([
-                p for p in products if p.stock_status == status
-            ])
+        status_counts = {status.value: 0 for status in StockStatus}
+        category_counts: Dict[str, int] = {}
+        total = priced = 0
+        price_sum = 0.0
         
-        # Calculate average price
-        prices = [p.price for p in products if p.price > 0]
-        avg_price = sum(prices) / len(prices) if prices else 0
+        for row in rows:
+            total += row['product_count']
+            priced += row['priced_count']
+            price_sum += row['price_sum']
+            status_counts[row['stock_status']] = status_counts.get(row['stock_status'], 0) + row['product_count']
+            if row['category']:
+                category_counts[row['category']] = category_counts.get(row['category'], 0) + row['product_count']
         
-        # Get categories
-        categories = list(set(p.category for p in products if p.category))
+        avg_price = price_sum / priced if priced else 0
         
         return {
-            'total_products': len(products),
+            'total_products': total,
             'in_stock': status_counts.get('in_stock', 0),
             'low_stock': status_counts.get('low_stock', 0),
             'out_of_stock': status_counts.get('out_of_stock', 0),
             'discontinued': status_counts.get('discontinued', 0),
             'average_price': round(avg_price, 2),
-            'categories': sorted(categories)
-        }
\ No newline at end of file
+            'categories': sorted(category_counts),
+            'category_counts': dict(sorted(category_counts.items()))
+        }
+    
+    def check_statistics(self, repair: bool = False) -> List[str]:
+        """
+        Verify maintained statistics against a full recount.
+        
+        Args:
+            repair: Rebuild the aggregates from scratch if they disagree
+        
+        Returns:
+            Descriptions of mismatching groups found before any repair
+        """
+        mismatches = self.db.check_catalog_stats()
+        if mismatches and repair:
+            self.db.rebuild_catalog_stats()
+        return mismatches
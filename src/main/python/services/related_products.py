@@ -0,0 +1,252 @@
+"""
+Precomputed related-products index.
+Keeps the top-K most similar products per product so detail pages can look them up directly.
+"""
+
+import heapq
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from ..models.product import Product, BrandType
+from ..core.database import DatabaseManager, ProductChange
+from .canonicalizer import normalize_name
+
+
+# Feature weights: sharing a category says more than sharing a name word
+FEATURE_WEIGHTS = {
+    'cat': 2.0,
+    'tag': 1.5,
+    'name': 1.0
+}
+
+
+def product_features(product: Product) -> Dict[str, float]:
+    """Weighted similarity features of a product."""
+    features = {f"name:{token}": FEATURE_WEIGHTS['name'] for token in normalize_name(product.name)}
+    for tag in product.tags:
+        features[f"tag:{tag.lower()}"] = FEATURE_WEIGHTS['tag']
+    if product.category:
+        features[f"cat:{product.category}"] = FEATURE_WEIGHTS['cat']
+    return features
+
+
+class RelatedProductsIndex:
+    """
+    Top-K related products per product by weighted Jaccard similarity.
+    
+    Similarity is the weight of shared tag, category and name-token features
+    over the weight of their union. An inverted index from feature to
+    product ids limits scoring to products sharing at least one feature.
+    Neighbour lists are refreshed incrementally as products change, so
+    lookups are a dictionary read.
+    
+    Features held by more than max_feature_products products of a brand,
+    such as a category covering most of the catalog, are too common to
+    relate two products and are left out of the overlap. This also keeps
+    the cost of an update independent of catalog size.
+    
+    With background=True, changes are queued and applied by a worker
+    thread, coalesced per product, so bulk writes don't wait for neighbour
+    lists; lookups may briefly return the previous neighbours.
+    """
+    
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        k: int = 8,
+        max_feature_products: int = 250,
+        background: bool = False
+    ):
+        self.db = db_manager
+        self.k = k
+        self.max_feature_products = max_feature_products
+        self.background = background
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._queue = threading.Condition()
+        self._pending: Dict[str, ProductChange] = {}
+        self._applying = False
+        self._worker: Optional[threading.Thread] = None
+        self._features: Dict[str, Dict[str, float]] = {}
+        self._weights: Dict[str, float] = {}
+        self._brands: Dict[str, BrandType] = {}
+        self._postings: Dict[Tuple[BrandType, str], Set[str]] = defaultdict(set)
+        self._neighbours: Dict[str, List[Tuple[float, str]]] = {}
+    
+    def build(self) -> 'RelatedProductsIndex':
+        """Build the index from every product in the database."""
+        products = self.db.get_products()
+        with self._lock:
+            self._features.clear()
+            self._weights.clear()
+            self._brands.clear()
+            self._postings.clear()
+            self._neighbours.clear()
+            
+            for product in products:
+                self._add(product)
+            for product in products:
+                self._neighbours[product.id] = self._top_k(product.id)
+        
+        self.logger.info(f"Built related-products index for {len(products)} products")
+        return self
+    
+    def related_ids(self, product_id: str, limit: int = 4) -> List[str]:
+        """Get ids of the most related products, best first."""
+        return [other_id for _, other_id in self._neighbours.get(product_id, [])[:limit]]
+    
+    def on_product_change(self, change: ProductChange):
+        """Database change listener keeping the index current."""
+        if not change.deleted and change.product is None:
+            return  # Stock and price updates carry no features
+        if not self.background:
+            self._apply(change)
+            return
+        
+        with self._queue:
+            self._pending[change.product_id] = change
+            self._queue.notify_all()
+            if self._worker is None or not self._worker.is_alive():  # Threads don't survive fork()
+                self._worker = threading.Thread(target=self._drain, name='related-products', daemon=True)
+                self._worker.start()
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until queued changes are applied; False on timeout."""
+        with self._queue:
+            return self._queue.wait_for(lambda: not self._pending and not self._applying, timeout)
+    
+    def update(self, product: Product):
+        """Add or refresh a product and the neighbour lists it affects."""
+        with self._lock:
+            features = product_features(product)
+            if self._features.get(product.id) == features and self._brands.get(product.id) == product.brand:
+                return  # Stock and price changes don't affect similarity
+            
+            affected = self._candidates(product.id) if product.id in self._features else set()
+            self._discard(product.id)
+            self._add(product)
+            scores = self._scores(product.id)  # Similarity is symmetric, so this serves both sides
+            affected |= scores.keys()
+            
+            self._neighbours[product.id] = self._best(scores)
+            for other_id in affected:
+                self._refresh_neighbour(other_id, product.id, scores.get(other_id, 0.0))
+    
+    def remove(self, product_id: str):
+        """Drop a product from the index."""
+        with self._lock:
+            if product_id not in self._features:
+                return
+            affected = self._candidates(product_id)
+            self._discard(product_id)
+            self._neighbours.pop(product_id, None)
+            for other_id in affected:
+                self._refresh_neighbour(other_id, product_id, 0.0)
+    
+    def _apply(self, change: ProductChange):
+        """Apply one change to the index."""
+        if change.deleted:
+            self.remove(change.product_id)
+        else:
+            self.update(change.product)
+    
+    def _drain(self):
+        """Worker loop applying queued changes in batches."""
+        while True:
+            with self._queue:
+                self._queue.wait_for(lambda: self._pending)
+                batch, self._pending = self._pending, {}
+                self._applying = True
+            for change in batch.values():
+                try:
+                    self._apply(change)
+                except Exception as e:
+                    self.logger.error(f"Related-products update failed for {change.product_id}: {e}")
+            with self._queue:
+                self._applying = False
+                self._queue.notify_all()
+    
+    def _add(self, product: Product):
+        """Register a product's features in the inverted index."""
+        features = product_features(product)
+        self._features[product.id] = features
+        self._weights[product.id] = sum(features.values())
+        self._brands[product.id] = product.brand
+        for feature in features:
+            self._postings[(product.brand, feature)].add(product.id)
+    
+    def _discard(self, product_id: str):
+        """Remove a product's features from the inverted index."""
+        features = self._features.pop(product_id, None)
+        brand = self._brands.pop(product_id, None)
+        self._weights.pop(product_id, None)
+        for feature in features or ():
+            postings = self._postings.get((brand, feature))
+            if postings is not None:
+                postings.discard(product_id)
+                if not postings:
+                    del self._postings[(brand, feature)]
+    
+    def _distinctive_postings(self, product_id: str) -> List[Tuple[float, Set[str]]]:
+        """Weight and postings of each of a product's features that isn't too common."""
+        brand = self._brands[product_id]
+        postings = []
+        for feature, weight in self._features[product_id].items():
+            products = self._postings.get((brand, feature))
+            if products and len(products) <= self.max_feature_products:
+                postings.append((weight, products))
+        return postings
+    
+    def _candidates(self, product_id: str) -> Set[str]:
+        """Products of the same brand sharing at least one distinctive feature."""
+        candidates = set()
+        for _, products in self._distinctive_postings(product_id):
+            candidates |= products
+        candidates.discard(product_id)
+        return candidates
+    
+    def _scores(self, product_id: str) -> Dict[str, float]:
+        """Weighted Jaccard similarity to every candidate."""
+        shared: Dict[str, float] = defaultdict(float)
+        for weight, products in self._distinctive_postings(product_id):
+            for other_id in products:
+                if other_id != product_id:
+                    shared[other_id] += weight
+        
+        own_weight = self._weights[product_id]
+        return {
+            other_id: overlap / (own_weight + self._weights[other_id] - overlap)
+            for other_id, overlap in shared.items()
+        }
+    
+    def _top_k(self, product_id: str) -> List[Tuple[float, str]]:
+        """Best K neighbours of a product, ties broken by id for stability."""
+        return self._best(self._scores(product_id))
+    
+    def _best(self, scores: Dict[str, float]) -> List[Tuple[float, str]]:
+        """Best K of a product's candidate scores."""
+        best = heapq.nsmallest(self.k, ((-score, other_id) for other_id, score in scores.items()))
+        return [(-negative, other_id) for negative, other_id in best]
+    
+    def _refresh_neighbour(self, product_id: str, changed_id: str, score: float):
+        """Update one product's list after changed_id was added, moved or removed."""
+        if product_id not in self._features:
+            return
+        neighbours = self._neighbours.get(product_id, [])
+        entry = (score, changed_id)
+        rank = lambda item: (-item[0], item[1])
+        
+        if not any(other_id == changed_id for _, other_id in neighbours):
+            # A product that wasn't a neighbour can only push the last one out
+            if score > 0 and (len(neighbours) < self.k or rank(entry) < rank(neighbours[-1])):
+                self._neighbours[product_id] = sorted(neighbours + [entry], key=rank)[:self.k]
+            return
+        
+        others = [item for item in neighbours if item[1] != changed_id]
+        if score > 0 and (len(neighbours) < self.k or rank(entry) <= rank(neighbours[-1])):
+            self._neighbours[product_id] = sorted(others + [entry], key=rank)
+        else:
+            # It may now rank below products that weren't in the list
+            self._neighbours[product_id] = self._top_k(product_id)
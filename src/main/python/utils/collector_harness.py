@@ -0,0 +1,124 @@
+"""
+Load harness measuring collector throughput against the local stub retailer.
+Runs fully offline so results are comparable between machines and CI runs.
+"""
+
+import time
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Any
+
+from ..core.database import DatabaseManager
+from ..services.data_collector import DataCollectionManager
+from .stub_retailer import StubRetailerServer, StubConfig
+
+
+@dataclass
+class HarnessReport:
+    """Throughput and latency figures from a harness run."""
+
+    rounds: int
+    pages_fetched: int
+    elapsed_seconds: float
+    pages_per_second: float
+    fetch_latency_p50_ms: float
+    fetch_latency_p99_ms: float
+    products_written: int
+    write_seconds: float
+    db_writes_per_second: float
+    status_counts: Dict[str, int] = field(default_factory=dict)
+    errors: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert report to dictionary for JSON output."""
+        return {
+            'rounds': self.rounds,
+            'pages_fetched': self.pages_fetched,
+            'elapsed_seconds': round(self.elapsed_seconds, 3),
+            'pages_per_second': round(self.pages_per_second, 1),
+            'fetch_latency_p50_ms': round(self.fetch_latency_p50_ms, 2),
+            'fetch_latency_p99_ms': round(self.fetch_latency_p99_ms, 2),
+            'products_written': self.products_written,
+            'write_seconds': round(self.write_seconds, 3),
+            'db_writes_per_second': round(self.db_writes_per_second, 1),
+            'status_counts': self.status_counts,
+            'errors': self.errors
+        }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def run_collector_harness(
+    config: Optional[StubConfig] = None,
+    rounds: int = 1,
+    mutate_fraction: float = 0.1,
+    db_path: Optional[str] = None
+) -> HarnessReport:
+    """
+    Drive DataCollectionManager against a local stub retailer.
+
+    Args:
+        config: Stub behavior (catalog size, latency, error and 429 rates)
+        rounds: Collection rounds to run. Rounds after the first exercise
+            conditional requests, since unchanged pages return 304
+        mutate_fraction: Fraction of products changed between rounds
+        db_path: SQLite file to write to. Defaults to in-memory
+    """
+    latencies: List[float] = []
+    status_counts: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def record_fetch(url: str, status_code: Optional[int], elapsed: float):
+        with lock:
+            latencies.append(elapsed)
+            key = str(status_code) if status_code is not None else 'error'
+            status_counts[key] = status_counts.get(key, 0) + 1
+
+    db_manager = DatabaseManager(db_path)
+    products_written = 0
+    write_seconds = 0.0
+    errors: List[str] = []
+
+    with StubRetailerServer(config) as stub:
+        manager = DataCollectionManager(db_manager)
+        for collector in manager.collectors:
+            collector.base_url = stub.base_url
+            collector.rate_limit_delay = 0.0
+            collector.rate_limit_jitter = 0.0
+            collector.fetch_hooks.append(record_fetch)
+
+        started = time.perf_counter()
+        for round_number in range(rounds):
+            if round_number > 0 and mutate_fraction > 0:
+                stub.mutate(mutate_fraction)
+
+            results = manager.run_collection()
+            errors.extend(results['errors'])
+            for collection in results['collections'].values():
+                if collection.get('success'):
+                    products_written += collection['products_written']
+                    write_seconds += collection['write_seconds']
+        elapsed = time.perf_counter() - started
+
+    db_manager.close()
+
+    return HarnessReport(
+        rounds=rounds,
+        pages_fetched=len(latencies),
+        elapsed_seconds=elapsed,
+        pages_per_second=len(latencies) / elapsed if elapsed > 0 else 0.0,
+        fetch_latency_p50_ms=percentile(latencies, 50) * 1000,
+        fetch_latency_p99_ms=percentile(latencies, 99) * 1000,
+        products_written=products_written,
+        write_seconds=write_seconds,
+        db_writes_per_second=products_written / write_seconds if write_seconds > 0 else 0.0,
+        status_counts=status_counts,
+        errors=errors
+    )
@@ -0,0 +1,137 @@
+"""
+HTTP response compression for the Flask app.
+Negotiates brotli or gzip from Accept-Encoding and compresses buffered and streamed responses.
+"""
+
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from flask import Flask, Response, request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/msgpack',
+    'application/x-ndjson',
+    'application/javascript',
+    'image/svg+xml',
+    'text/css',
+    'text/csv',
+    'text/html',
+    'text/javascript',
+    'text/plain',
+}
+
+# Small bodies gain little and cost a round of compressor setup
+DEFAULT_MIN_SIZE = 1024
+
+
+def supported_encodings() -> tuple:
+    """Encodings this process can produce, most preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick a content coding from an Accept-Encoding header.
+    
+    Honours q-values (q=0 refuses a coding) and '*'. Ties go to the
+    server's preference, brotli before gzip.
+    """
+    if not accept_encoding:
+        return None
+    
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            weights[coding] = quality
+    
+    best, best_quality = None, 0.0
+    for coding in supported_encodings():
+        quality = weights.get(coding, weights.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """Compress a complete body."""
+    if encoding == 'br':
+        return brotli.compress(body, quality=5 if level is None else level)
+    return zlib.compress(body, 6 if level is None else level, wbits=31)  # wbits=31 writes a gzip container
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str, level: Optional[int] = None) -> Iterator[bytes]:
+    """Compress a body chunk by chunk, flushing after each chunk so clients see progress."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=5 if level is None else level)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+    
+    compressor = zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def init_compression(app: Flask, min_size: int = DEFAULT_MIN_SIZE):
+    """
+    Compress eligible responses of a Flask app.
+    
+    Buffered bodies below min_size are sent as is. Streamed responses are
+    always compressed since their size isn't known up front.
+    """
+    @app.after_request
+    def compress_response(response: Response) -> Response:
+        if response.status_code == 304:
+            # A 304 carries the Vary its 200 would have, so caches revalidate the right variant
+            response.vary.add('Accept-Encoding')
+            return response
+        if (
+            response.status_code != 200
+            or request.method == 'HEAD'
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'Content-Encoding' in response.headers
+        ):
+            return response
+        
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+        
+        if response.is_streamed or response.direct_passthrough:
+            response.direct_passthrough = False
+            response.response = compress_stream(response.iter_encoded(), encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < min_size:
+                return response
+            response.set_data(compress(body, encoding))
+        
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)  # The bytes now differ from the uncompressed entity
+        return response
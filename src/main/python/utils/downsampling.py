@@ -0,0 +1,110 @@
+"""
+Downsampling of price history series for charts.
+Largest-Triangle-Three-Buckets keeps a series' visible shape, including
+short price spikes, in a fixed number of points.
+"""
+
+from typing import List, Sequence
+
+from ..models.product import PriceHistory
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; the pure-Python path picks the same points, more slowly
+    np = None
+
+# LTTB always keeps the first and last points and one point per bucket between them
+MIN_POINTS = 3
+
+
+def lttb_indices(x: Sequence[float], y: Sequence[float], max_points: int) -> List[int]:
+    """
+    Indices of the points Largest-Triangle-Three-Buckets keeps, in order.
+    
+    The points between the first and last are split into max_points - 2
+    buckets of equal count. From each bucket the point forming the largest
+    triangle with the point kept from the previous bucket and the average of
+    the next bucket is kept, so spikes win over points on a trend.
+    
+    Args:
+        x: Point positions, monotonic, e.g. Unix timestamps.
+        y: Point values.
+        max_points: Number of points to keep, at least MIN_POINTS.
+    """
+    if max_points < MIN_POINTS:
+        raise ValueError(f"max_points must be at least {MIN_POINTS}")
+    count = len(x)
+    if count <= max_points:
+        return list(range(count))
+    
+    # Bucket b spans [bounds[b], bounds[b + 1]); the final bound is the last point alone
+    every = (count - 2) / (max_points - 2)
+    bounds = [int(b * every) + 1 for b in range(max_points - 2)] + [count - 1]
+    if np is not None:
+        return _lttb_numpy(np.asarray(x, dtype=float), np.asarray(y, dtype=float), bounds)
+    return _lttb_python(x, y, bounds)
+
+
+def _lttb_numpy(x: 'np.ndarray', y: 'np.ndarray', bounds: List[int]) -> List[int]:
+    """LTTB with the averages computed up front and each bucket's areas as one array operation."""
+    starts = np.asarray(bounds + [len(x)])
+    sizes = np.diff(starts)
+    # Bucket averages, the last being the final point; as floats since numpy scalar arithmetic is slow
+    average_x = (np.add.reduceat(x, starts[:-1]) / sizes).tolist()
+    average_y = (np.add.reduceat(y, starts[:-1]) / sizes).tolist()
+    
+    kept = [0]
+    a = 0
+    for b in range(len(bounds) - 1):
+        start, end = bounds[b], bounds[b + 1]
+        ax, ay = float(x[a]), float(y[a])
+        cx, cy = average_x[b + 1], average_y[b + 1]
+        # Twice the triangle area; the constant factor doesn't change the argmax
+        areas = np.abs((ax - cx) * (y[start:end] - ay) - (ax - x[start:end]) * (cy - ay))
+        a = start + int(areas.argmax())
+        kept.append(a)
+    kept.append(len(x) - 1)
+    return kept
+
+
+def _lttb_python(x: Sequence[float], y: Sequence[float], bounds: List[int]) -> List[int]:
+    """LTTB without numpy."""
+    kept = [0]
+    a = 0
+    for b in range(len(bounds) - 1):
+        start, end = bounds[b], bounds[b + 1]
+        next_end = bounds[b + 2] if b + 2 < len(bounds) else len(x)
+        cx = sum(x[bounds[b + 1]:next_end]) / (next_end - bounds[b + 1])
+        cy = sum(y[bounds[b + 1]:next_end]) / (next_end - bounds[b + 1])
+        ax, ay = x[a], y[a]
+        best, best_area = start, -1.0
+        for i in range(start, end):
+            area = abs((ax - cx) * (y[i] - ay) - (ax - x[i]) * (cy - ay))
+            if area > best_area:
+                best, best_area = i, area
+        a = best
+        kept.append(a)
+    kept.append(len(x) - 1)
+    return kept
+
+
+def downsample_history(points: Sequence[PriceHistory], max_points: int) -> List[PriceHistory]:
+    """
+    Reduce a price history to at most max_points points with LTTB.
+    
+    Args:
+        points: History in timestamp order, either direction.
+        max_points: Number of points to keep, at least MIN_POINTS.
+    """
+    if max_points < MIN_POINTS:
+        raise ValueError(f"max_points must be at least {MIN_POINTS}")
+    if len(points) <= max_points:
+        return list(points)
+    
+    if np is not None:
+        x = np.fromiter((point.timestamp.timestamp() for point in points), dtype=float, count=len(points))
+        y = np.fromiter((point.price for point in points), dtype=float, count=len(points))
+    else:
+        x = [point.timestamp.timestamp() for point in points]
+        y = [point.price for point in points]
+    return [points[i] for i in lttb_indices(x, y, max_points)]
@@ -0,0 +1,86 @@
+"""
+Streaming NDJSON and CSV encoding for bulk exports.
+Encodes records as they are read so an export never holds the full result.
+"""
+
+import csv
+import io
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Sequence
+
+from flask import Response
+
+from .json_stream import DEFAULT_CHUNK_SIZE
+
+EXPORT_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def iter_ndjson(records: Iterable[Dict[str, Any]], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Encode records as newline-delimited JSON in chunks of about chunk_size bytes."""
+    buffer = bytearray()
+    for record in records:
+        buffer += json.dumps(record).encode('utf-8')
+        buffer += b'\n'
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def iter_csv(
+    records: Iterable[Dict[str, Any]],
+    columns: Sequence[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Encode records as CSV with a header row, in chunks of about chunk_size bytes.
+    
+    Lists and dicts are written as JSON and None as an empty field.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for record in records:
+        writer.writerow([_csv_value(record.get(column)) for column in columns])
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def export_response(
+    records: Iterable[Dict[str, Any]],
+    export_format: str,
+    columns: Sequence[str],
+    filename: str
+) -> Response:
+    """
+    Streamed download of records as NDJSON or CSV.
+    
+    Args:
+        records: Records to export; consumed lazily.
+        export_format: 'ndjson' or 'csv'.
+        columns: CSV columns, in order.
+        filename: Download name without extension.
+    """
+    if export_format not in EXPORT_MIMETYPES:
+        raise ValueError(f"Unsupported format {export_format!r}; use one of {', '.join(EXPORT_MIMETYPES)}")
+    
+    chunks = iter_csv(records, columns) if export_format == 'csv' else iter_ndjson(records)
+    response = Response(chunks, mimetype=EXPORT_MIMETYPES[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
+
+
+def _csv_value(value: Any) -> Any:
+    """Format one CSV field."""
+    if value is None:
+        return ''
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
@@ -0,0 +1,104 @@
+"""
+Streaming JSON encoding for large API payloads.
+Yields a response envelope in chunks instead of building one large string,
+and splits streamed request bodies into lines.
+"""
+
+import json
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, Optional, Union
+
+from flask import Response
+
+# Chunks are flushed to the client once they reach roughly this size
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(
+    items: Iterable[Any],
+    encode: Optional[Callable[[Any], Union[bytes, str]]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Encode items as a JSON array, yielding chunks of about chunk_size bytes.
+    
+    Args:
+        items: Items to encode; consumed lazily.
+        encode: Encodes one item to JSON text or bytes (default json.dumps).
+        chunk_size: Approximate size of each yielded chunk.
+    """
+    encode = encode or json.dumps
+    buffer = bytearray(b'[')
+    first = True
+    for item in items:
+        if not first:
+            buffer += b','
+        first = False
+        encoded = encode(item)
+        buffer += encoded.encode('utf-8') if isinstance(encoded, str) else encoded
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b']'
+    yield bytes(buffer)
+
+
+def iter_json_envelope(
+    items: Iterable[Any],
+    fields: Optional[Dict[str, Any]] = None,
+    encode: Optional[Callable[[Any], Union[bytes, str]]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Encode the standard API envelope with a streamed data array.
+    
+    Produces ``{"success": true, <fields>..., "data": [...]}``; data comes
+    last so the other fields can be written before the items are consumed.
+    """
+    head = dict({'success': True}, **(fields or {}))
+    yield (json.dumps(head)[:-1] + ', "data": ').encode('utf-8')
+    yield from iter_json_array(items, encode=encode, chunk_size=chunk_size)
+    yield b'}'
+
+
+def stream_json_response(
+    items: Iterable[Any],
+    fields: Optional[Dict[str, Any]] = None,
+    encode: Optional[Callable[[Any], Union[bytes, str]]] = None,
+    status: int = 200
+) -> Response:
+    """Flask response streaming the API envelope around items."""
+    return Response(
+        iter_json_envelope(items, fields=fields, encode=encode),
+        status=status,
+        mimetype='application/json'
+    )
+
+
+def iter_lines(
+    stream: BinaryIO,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_line_bytes: Optional[int] = None
+) -> Iterator[bytes]:
+    """
+    Split a binary stream into lines without reading it all.
+    
+    Reads fixed-size chunks; readline() on a WSGI input stream reads a
+    byte at a time. Line endings are stripped. With max_line_bytes, the
+    rest of a longer line is dropped as it is read, so input without
+    newlines can't grow memory; the line is yielded cut to just over
+    max_line_bytes, for the caller to report as too long.
+    """
+    limit = None if max_line_bytes is None else max_line_bytes + 1
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip(b'\r')[:limit]
+        if limit is not None and len(pending) > limit:
+            pending = pending[:limit]
+    if pending:
+        yield pending.rstrip(b'\r')
@@ -0,0 +1,513 @@
+"""
+Metrics exposed in the Prometheus text format.
+Times Flask requests, DatabaseManager queries and collector fetches, and
+reports the counters caches already keep. Worker processes of one server
+can share a snapshot directory so any of them reports the total.
+"""
+
+import inspect
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from flask import Flask, Response, g, request
+
+from ..core.database import DatabaseManager
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; snapshot directories are for forking servers anyway
+    fcntl = None
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds in seconds; a fetch or slow page lands in the top buckets, a cached read in the bottom ones
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# DatabaseManager methods left out of query metrics: setup, and the version
+# and change-cursor reads behind ETags and change polling, which would make
+# every request and poller tick look like database work
+UNTIMED_DB_METHODS = (
+    'add_change_listener', 'close', 'reconnect', 'snapshot',
+    'data_version', 'get_catalog_version', 'get_change_seq', 'poll_external_changes',
+)
+
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Time spent in Flask views, by endpoint'),
+    'http_request_db_queries': ('histogram', 'Database queries made per request, by endpoint'),
+    'http_request_errors_total': ('counter', 'Responses with a 4xx or 5xx status'),
+    'db_query_duration_seconds': ('histogram', 'Time spent in DatabaseManager methods'),
+    'db_query_errors_total': ('counter', 'DatabaseManager methods that raised'),
+    'collector_fetch_duration_seconds': ('histogram', 'Time spent fetching retailer pages'),
+    'collector_fetch_errors_total': ('counter', 'Retailer fetches that failed or returned an error status'),
+    'cache_hits_total': ('counter', 'Cache lookups answered from the cache'),
+    'cache_misses_total': ('counter', 'Cache lookups that had to load'),
+    'cache_evictions_total': ('counter', 'Entries dropped for size or age'),
+    'cache_invalidations_total': ('counter', 'Entries dropped because their data changed'),
+    'cache_entries': ('gauge', 'Entries held'),
+    'cache_bytes': ('gauge', 'Approximate bytes held'),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Mapping[str, str], float]
+# Counter, gauge and histogram series by metric name; a histogram is (buckets, counts, sum)
+Snapshot = Dict[str, Dict[str, Dict[LabelKey, Any]]]
+
+SNAPSHOT_PREFIX = 'metrics-'
+DEAD_SNAPSHOT = 'metrics-dead.json'  # Counters and histograms of exited processes
+
+
+class Histogram:
+    """Cumulative-bucket histogram of observed values."""
+    
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float):
+        """Record one value."""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+    
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(le, count) pairs as Prometheus reports them."""
+        with self._lock:
+            counts = list(self.counts)
+        return _cumulative(self.buckets, counts)
+    
+    def state(self) -> Tuple[Tuple[float, ...], List[int], float]:
+        """Buckets, per-bucket counts and sum, read together."""
+        with self._lock:
+            return self.buckets, list(self.counts), self.sum
+    
+    def reset(self):
+        """Forget every observation."""
+        with self._lock:
+            self.counts = [0] * len(self.counts)
+            self.sum = 0.0
+            self.count = 0
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms keyed by name and labels.
+    
+    Recording takes one short lock, and hot paths hold on to their
+    Histogram from ``get_histogram`` to skip the label lookup, so it is
+    cheap enough to leave on.
+    
+    Values are per process. With several workers, give every worker's
+    registry the same ``multiprocess_dir``: each one writes its snapshot
+    there, and ``render`` reports the sum over all of them, including
+    workers that have exited, whichever worker is scraped. Gauges, which
+    can't be summed, are labelled by pid.
+    """
+    
+    def __init__(self, multiprocess_dir: Optional[str] = None):
+        self.multiprocess_dir = multiprocess_dir
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+    
+    def inc(self, name: str, value: float = 1.0, **labels: str):
+        """Add to a counter."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+    
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels: str):
+        """Record a value in a histogram."""
+        self.get_histogram(name, buckets, **labels).observe(value)
+    
+    def get_histogram(self, name: str, buckets: Sequence[float] = LATENCY_BUCKETS, **labels: str) -> Histogram:
+        """One histogram series, created on first use."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(buckets)
+            return histogram
+    
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]):
+        """Register a callable returning (name, labels, value) samples at render time."""
+        self._collectors.append(collector)
+    
+    def counter_value(self, name: str, **labels: str) -> float:
+        """Current value of one counter series."""
+        with self._lock:
+            return self._counters.get(name, {}).get(tuple(sorted(labels.items())), 0.0)
+    
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        """One histogram series, if anything was observed."""
+        with self._lock:
+            return self._histograms.get(name, {}).get(tuple(sorted(labels.items())))
+    
+    def reset(self):
+        """
+        Forget every recorded value, e.g. in a worker forked from a process that recorded some.
+        
+        Histograms are zeroed in place, since hot paths hold on to them.
+        """
+        with self._lock:
+            self._counters.clear()
+            histograms = [h for series in self._histograms.values() for h in series.values()]
+        for histogram in histograms:
+            histogram.reset()
+    
+    def snapshot(self) -> Snapshot:
+        """Current values of this process, with collectors run."""
+        counters: Dict[str, Dict[LabelKey, float]] = {}
+        gauges: Dict[str, Dict[LabelKey, float]] = {}
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                target = gauges if METRICS.get(name, ('counter',))[0] == 'gauge' else counters
+                target.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+        
+        with self._lock:
+            for name, series in self._counters.items():
+                counters.setdefault(name, {}).update(series)
+            histograms = {name: dict(series) for name, series in self._histograms.items()}
+        states = {
+            name: {key: h.state() for key, h in series.items() if h.count}  # Skip series created up front
+            for name, series in histograms.items()
+        }
+        return {'counters': counters, 'gauges': gauges, 'histograms': states}
+    
+    def write_snapshot(self):
+        """Write this process's snapshot to the multiprocess directory, if there is one."""
+        if self.multiprocess_dir is not None:
+            self._write(self.snapshot())
+    
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        if self.multiprocess_dir is None:
+            return render_snapshot(snapshot)
+        self._write(snapshot)
+        return render_snapshot(read_multiprocess_dir(self.multiprocess_dir))
+    
+    def _write(self, snapshot: Snapshot):
+        """Replace this process's snapshot file."""
+        path = os.path.join(self.multiprocess_dir, f"{SNAPSHOT_PREFIX}{os.getpid()}.json")
+        _write_json(path, dict(_encode_snapshot(snapshot), pid=os.getpid()))
+
+
+def render_snapshot(snapshot: Snapshot) -> str:
+    """A snapshot in the Prometheus text exposition format."""
+    lines: List[str] = []
+    scalars = [(name, series, 'counter') for name, series in snapshot['counters'].items()]
+    scalars += [(name, series, 'gauge') for name, series in snapshot['gauges'].items()]
+    for name, series, metric_type in sorted(scalars, key=lambda item: item[0]):
+        lines.extend(_header(name, metric_type))
+        for key, value in sorted(series.items()):
+            lines.append(f"{name}{_format_labels(key)} {_format_number(value)}")
+    
+    for name, series in sorted(snapshot['histograms'].items()):
+        if series:
+            lines.extend(_header(name, 'histogram'))
+        for key, (buckets, counts, total) in sorted(series.items()):
+            for le, count in _cumulative(buckets, counts):
+                lines.append(f"{name}_bucket{_format_labels(key + (('le', le),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(key)} {_format_number(total)}")
+            lines.append(f"{name}_count{_format_labels(key)} {sum(counts)}")
+    return '\n'.join(lines) + '\n'
+
+
+def read_multiprocess_dir(directory: str) -> Snapshot:
+    """
+    Sum the snapshots of every process in a multiprocess directory.
+    
+    Counters and histograms are added up; gauges get a ``pid`` label. Held
+    under a shared lock so ``mark_process_dead`` can't move a snapshot into
+    the dead processes' file while it is being read.
+    """
+    with _directory_lock(directory, shared=True):
+        snapshots = []
+        for name in sorted(os.listdir(directory)):
+            if name.startswith(SNAPSHOT_PREFIX) and name.endswith('.json'):
+                try:
+                    snapshots.append(_read_json(os.path.join(directory, name)))
+                except (OSError, ValueError):
+                    continue  # Being replaced, or left half-written by a killed process
+    
+    merged: Snapshot = {'counters': {}, 'gauges': {}, 'histograms': {}}
+    for data in snapshots:
+        snapshot = _decode_snapshot(data)
+        _add_snapshot(merged, snapshot)
+        for name, series in snapshot['gauges'].items():
+            pid = (('pid', str(data['pid'])),)
+            merged['gauges'].setdefault(name, {}).update(
+                (tuple(sorted(key + pid)), value) for key, value in series.items()
+            )
+    return merged
+
+
+def mark_process_dead(directory: str, pid: int):
+    """
+    Fold an exited process's counters and histograms into the dead processes' file.
+    
+    Its totals keep counting towards the sums, so counters don't go down
+    when a worker is replaced, and its gauges are dropped. Call from the
+    server's master process, e.g. gunicorn's ``child_exit`` hook.
+    """
+    path = os.path.join(directory, f"{SNAPSHOT_PREFIX}{pid}.json")
+    dead_path = os.path.join(directory, DEAD_SNAPSHOT)
+    with _directory_lock(directory, shared=False):
+        try:
+            snapshot = _decode_snapshot(_read_json(path))
+        except (OSError, ValueError):
+            return  # Exited before writing one
+        dead: Snapshot = {'counters': {}, 'gauges': {}, 'histograms': {}}
+        if os.path.exists(dead_path):
+            _add_snapshot(dead, _decode_snapshot(_read_json(dead_path)))
+        _add_snapshot(dead, snapshot)
+        _write_json(dead_path, dict(_encode_snapshot(dead), pid=None))
+        os.remove(path)
+
+
+def clear_multiprocess_dir(directory: str):
+    """Create a multiprocess directory, or empty one left by an earlier server run."""
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.startswith(SNAPSHOT_PREFIX) and name.endswith('.json'):
+            os.remove(os.path.join(directory, name))
+
+
+# Per-thread state of the request being served, read by the database wrappers
+_local = threading.local()
+
+
+def instrument_database(
+    db_manager: DatabaseManager,
+    metrics: MetricsRegistry,
+    exclude: Iterable[str] = UNTIMED_DB_METHODS
+):
+    """
+    Time every public query method of a DatabaseManager instance.
+    
+    Only the outermost call on a thread is recorded, so a method built on
+    other public methods counts once. Generators such as the exports are
+    left alone since their time is spent while the caller iterates.
+    
+    Args:
+        db_manager: Database to instrument; its class is not modified.
+        metrics: Registry to record into.
+        exclude: Public methods not to time or count.
+    """
+    for name, function in inspect.getmembers(type(db_manager), inspect.isfunction):
+        if name.startswith('_') or name in exclude or inspect.isgeneratorfunction(function):
+            continue
+        setattr(db_manager, name, _timed_query(getattr(db_manager, name), name, metrics))
+
+
+def _timed_query(method: Callable, name: str, metrics: MetricsRegistry) -> Callable:
+    """Wrap one bound database method."""
+    histogram = metrics.get_histogram('db_query_duration_seconds', query=name)
+    
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        if getattr(_local, 'depth', 0):
+            return method(*args, **kwargs)
+        
+        _local.depth = 1
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            metrics.inc('db_query_errors_total', query=name)
+            raise
+        finally:
+            _local.depth = 0
+            histogram.observe(time.perf_counter() - started)
+            if getattr(_local, 'queries', None) is not None:
+                _local.queries += 1
+    return wrapper
+
+
+def fetch_hook(metrics: MetricsRegistry, collector: str) -> Callable[[str, Optional[int], float], None]:
+    """DataCollector fetch hook recording fetch latency and failures."""
+    def record_fetch(url: str, status_code: Optional[int], elapsed: float):
+        metrics.observe('collector_fetch_duration_seconds', elapsed, collector=collector)
+        if status_code is None or status_code >= 400:
+            metrics.inc('collector_fetch_errors_total', collector=collector, status=str(status_code or 'error'))
+    return record_fetch
+
+
+def cache_collector(caches: Mapping[str, Callable[[], Dict[str, Any]]]) -> Callable[[], Iterator[Sample]]:
+    """
+    Collector reporting the counters caches already keep.
+    
+    Lookups are counted by the caches themselves, so they cost nothing
+    extra; the counts are only read when metrics are rendered.
+    
+    Args:
+        caches: Cache name to its ``stats()`` method. Stats made of one
+            dict per part, such as ProductCache's, are labelled by part.
+    """
+    def collect() -> Iterator[Sample]:
+        for name, stats in caches.items():
+            values = stats()
+            parts = values.items() if all(isinstance(v, dict) for v in values.values()) else [(None, values)]
+            for part, counts in parts:
+                labels = {'cache': part or name}
+                for field in ('hits', 'misses', 'evictions', 'invalidations'):
+                    yield f'cache_{field}_total', labels, counts[field]
+                yield 'cache_entries', labels, counts['entries']
+                yield 'cache_bytes', labels, counts['bytes']
+    return collect
+
+
+def init_metrics(app: Flask, metrics: MetricsRegistry, snapshot_interval: float = 5.0):
+    """
+    Record latency, query counts and errors of every request of a Flask app.
+    
+    With a multiprocess directory, a daemon thread started by the first
+    request writes the process's snapshot every snapshot_interval seconds,
+    so other workers' scrapes see its values at most that old. It isn't
+    started before the first request because threads don't survive fork().
+    """
+    lock = threading.Lock()
+    writer: Optional[threading.Thread] = None
+    
+    def write_snapshots():
+        while True:
+            time.sleep(snapshot_interval)
+            try:
+                metrics.write_snapshot()
+            except Exception as e:
+                app.logger.error(f"Writing the metrics snapshot failed: {e}")
+    
+    @app.before_request
+    def start_request_timer():
+        nonlocal writer
+        if metrics.multiprocess_dir is not None and (writer is None or not writer.is_alive()):
+            with lock:
+                if writer is None or not writer.is_alive():
+                    writer = threading.Thread(target=write_snapshots, name='metrics-snapshot', daemon=True)
+                    writer.start()
+        g.metrics_started = time.perf_counter()
+        _local.queries = 0
+    
+    @app.after_request
+    def record_request(response: Response) -> Response:
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - started,
+                        endpoint=endpoint, method=request.method)
+        metrics.observe('http_request_db_queries', _local.queries, buckets=QUERY_COUNT_BUCKETS, endpoint=endpoint)
+        if response.status_code >= 400:
+            metrics.inc('http_request_errors_total', endpoint=endpoint, status=str(response.status_code))
+        _local.queries = None
+        return response
+
+
+def _cumulative(buckets: Sequence[float], counts: Sequence[int]) -> List[Tuple[str, int]]:
+    """(le, count) pairs of per-bucket counts, the last count being +Inf."""
+    pairs, total = [], 0
+    for bound, count in zip(tuple(buckets) + (float('inf'),), counts):
+        total += count
+        pairs.append(('+Inf' if bound == float('inf') else _format_number(bound), total))
+    return pairs
+
+
+def _add_snapshot(total: Snapshot, snapshot: Snapshot):
+    """Add a snapshot's counters and histograms to total in place."""
+    for name, series in snapshot['counters'].items():
+        target = total['counters'].setdefault(name, {})
+        for key, value in series.items():
+            target[key] = target.get(key, 0.0) + value
+    for name, series in snapshot['histograms'].items():
+        target = total['histograms'].setdefault(name, {})
+        for key, (buckets, counts, value_sum) in series.items():
+            previous = target.get(key)
+            if previous is not None and previous[0] == buckets:
+                counts = [a + b for a, b in zip(previous[1], counts)]
+                value_sum += previous[2]
+            target[key] = (buckets, counts, value_sum)
+
+
+def _encode_snapshot(snapshot: Snapshot) -> Dict[str, Any]:
+    """A snapshot as JSON-compatible lists."""
+    return {
+        kind: {name: [[list(map(list, key)), value] for key, value in series.items()] for name, series in metrics.items()}
+        for kind, metrics in snapshot.items()
+    }
+
+
+def _decode_snapshot(data: Dict[str, Any]) -> Snapshot:
+    """Inverse of _encode_snapshot."""
+    def key(pairs: List[List[str]]) -> LabelKey:
+        return tuple((label, value) for label, value in pairs)
+    
+    return {
+        'counters': {name: {key(k): v for k, v in series} for name, series in data['counters'].items()},
+        'gauges': {name: {key(k): v for k, v in series} for name, series in data['gauges'].items()},
+        'histograms': {
+            name: {key(k): (tuple(v[0]), v[1], v[2]) for k, v in series}
+            for name, series in data['histograms'].items()
+        },
+    }
+
+
+def _read_json(path: str) -> Dict[str, Any]:
+    """Load a JSON file."""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_json(path: str, data: Dict[str, Any]):
+    """Replace a JSON file atomically, so readers never see it half-written."""
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+@contextmanager
+def _directory_lock(directory: str, shared: bool) -> Iterator[None]:
+    """flock on a multiprocess directory's lock file; does nothing without fcntl."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, '.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield  # Closing the file releases the lock
+
+
+def _header(name: str, default_type: str) -> List[str]:
+    """HELP and TYPE lines of a metric."""
+    metric_type, help_text = METRICS.get(name, (default_type, name))
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+
+
+def _format_labels(key: LabelKey) -> str:
+    """Label set in exposition syntax."""
+    if not key:
+        return ''
+    escaped = (
+        f'{label}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for label, value in key
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_number(value: float) -> str:
+    """Number in exposition syntax, without a trailing .0 on integers."""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,137 @@
+"""
+MessagePack responses negotiated from the Accept header.
+JSON stays the default; clients sending ``Accept: application/msgpack`` get
+the same envelopes in MessagePack, with price history as parallel columns.
+"""
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from flask import Flask, Response, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+from ..models.product import PriceHistory
+from .json_stream import DEFAULT_CHUNK_SIZE, stream_json_response
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; without it every client gets JSON
+    msgpack = None
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/x-msgpack')
+
+
+def wants_msgpack() -> bool:
+    """
+    Whether the current request prefers MessagePack to JSON.
+    
+    A missing Accept header or a tie, such as ``*/*``, goes to JSON.
+    """
+    if msgpack is None or not has_request_context():
+        return False
+    return request.accept_mimetypes.best_match(('application/json',) + MSGPACK_MIMETYPES) in MSGPACK_MIMETYPES
+
+
+def packb(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """Encode obj as MessagePack, with str as str and bytes as bin."""
+    return msgpack.packb(obj, default=default, use_bin_type=True)
+
+
+def msgpack_response(data: Any, status: int = 200) -> Response:
+    """Flask response with data encoded as MessagePack."""
+    return Response(packb(data), status=status, mimetype=MSGPACK_MIMETYPE)
+
+
+def history_columns(points: Iterable[PriceHistory]) -> Dict[str, List[Any]]:
+    """
+    Price history as parallel arrays instead of one object per point.
+    
+    Timestamps are Unix seconds, so a point costs a few bytes per column
+    and clients can hand the arrays straight to a chart.
+    """
+    timestamps, prices, sources = [], [], []
+    for point in points:
+        timestamps.append(int(point.timestamp.timestamp()))
+        prices.append(point.price)
+        sources.append(point.source)
+    return {'timestamps': timestamps, 'prices': prices, 'sources': sources}
+
+
+def iter_msgpack_envelope(
+    items: Iterable[Any],
+    fields: Optional[Dict[str, Any]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Encode the standard API envelope as MessagePack, packing items as they go.
+    
+    MessagePack arrays are prefixed with their length, so an iterator that
+    isn't a list is collected first. Items with ``to_dict()`` are packed as
+    their dict.
+    """
+    items = items if isinstance(items, list) else list(items)
+    head = dict({'success': True}, **(fields or {}))
+    packer = msgpack.Packer(use_bin_type=True)
+    
+    buffer = bytearray(packer.pack_map_header(len(head) + 1))
+    for key, value in head.items():
+        buffer += packer.pack(key)
+        buffer += packer.pack(value)
+    buffer += packer.pack('data')
+    buffer += packer.pack_array_header(len(items))
+    for item in items:
+        buffer += packer.pack(item.to_dict() if hasattr(item, 'to_dict') else item)
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    yield bytes(buffer)
+
+
+def stream_api_response(
+    items: Iterable[Any],
+    fields: Optional[Dict[str, Any]] = None,
+    encode: Optional[Callable[[Any], Union[bytes, str]]] = None,
+    status: int = 200
+) -> Response:
+    """
+    Streamed API envelope in the negotiated format.
+    
+    Args:
+        items: Items of the data array; consumed lazily.
+        fields: Envelope fields written before data.
+        encode: JSON encoder for one item; MessagePack packs ``to_dict()``.
+        status: HTTP status code.
+    """
+    if wants_msgpack():
+        return Response(iter_msgpack_envelope(items, fields=fields), status=status, mimetype=MSGPACK_MIMETYPE)
+    return stream_json_response(items, fields=fields, encode=encode, status=status)
+
+
+class NegotiatingJSONProvider(DefaultJSONProvider):
+    """JSON provider whose ``jsonify`` answers in MessagePack when the client asks for it."""
+    
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        if not wants_msgpack():
+            return super().response(*args, **kwargs)
+        data = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(packb(data, default=self.default), mimetype=MSGPACK_MIMETYPE)
+
+
+def init_msgpack(app: Flask):
+    """
+    Let API clients ask for MessagePack with ``Accept: application/msgpack``.
+    
+    Every ``jsonify`` response is negotiated, and API responses carry
+    ``Vary: Accept`` so shared caches keep the formats apart. Does nothing
+    when msgpack isn't installed.
+    """
+    if msgpack is None:
+        return
+    
+    app.json = NegotiatingJSONProvider(app)
+    
+    @app.after_request
+    def vary_on_accept(response: Response) -> Response:
+        if request.path.startswith('/api/'):
+            response.vary.add('Accept')
+        return response
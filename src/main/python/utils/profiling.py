@@ -0,0 +1,168 @@
+"""
+Opt-in per-request profiling for the Flask app.
+Profiles requests that present a secret, plus an optional random sample,
+and writes pstats or collapsed-stack files for flamegraph tools.
+"""
+
+import cProfile
+import hmac
+import itertools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+from flask import Flask, Response, g, request
+
+PROFILE_HEADER = 'X-Profile'
+
+MODE_CPROFILE = 'cprofile'  # Deterministic; every call counted, writes .pstats
+MODE_SAMPLE = 'sample'  # Stack sampling; low overhead, writes .collapsed for flamegraph.pl or speedscope
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack at a fixed interval.
+    
+    Runs in its own thread and reads the target's frames with
+    ``sys._current_frames()``, so the profiled code isn't traced at all.
+    """
+    
+    def __init__(self, thread_id: int, interval: float = 0.001):
+        """
+        Initialize the sampler.
+        
+        Args:
+            thread_id: Ident of the thread to sample.
+            interval: Seconds between samples.
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+    
+    def start(self):
+        """Start sampling."""
+        self._thread.start()
+    
+    def stop(self):
+        """Stop sampling and wait for the sampler thread."""
+        self._stop.set()
+        self._thread.join()
+    
+    def write_collapsed(self, path: Path):
+        """Write samples as ``frame;frame;frame count`` lines, outermost frame first."""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+    
+    def _run(self):
+        """Sampler loop."""
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+
+def init_profiling(
+    app: Flask,
+    profile_dir: str,
+    secret: Optional[str] = None,
+    sample_rate: float = 0.0,
+    mode: str = MODE_CPROFILE
+):
+    """
+    Profile selected requests of a Flask app.
+    
+    A request is profiled when its ``X-Profile`` header equals the secret, or
+    at random with probability sample_rate. The secret is never read from the
+    query string, which ends up in access logs and cache keys.
+    One request is profiled at a time per process; others run normally.
+    The profile's file name is returned in the ``X-Profile-File`` header.
+    Streamed response bodies are produced after the view returns and are
+    not included.
+    
+    Args:
+        app: Flask app to instrument.
+        profile_dir: Directory for profile files; created on first use.
+        secret: Token enabling on-demand profiling; None disables it.
+        sample_rate: Fraction of all requests to profile, e.g. 0.001.
+        mode: ``cprofile`` for pstats files or ``sample`` for collapsed stacks.
+    """
+    if mode not in (MODE_CPROFILE, MODE_SAMPLE):
+        raise ValueError(f"Unknown profiling mode {mode!r}")
+    if not secret and sample_rate <= 0:
+        return
+    
+    logger = logging.getLogger(__name__)
+    directory = Path(profile_dir)
+    active = threading.Lock()  # cProfile can't run in two threads at once
+    sequence = itertools.count()
+    
+    def requested() -> bool:
+        token = request.headers.get(PROFILE_HEADER)
+        return bool(secret and token and hmac.compare_digest(token.encode('utf-8'), secret.encode('utf-8')))
+    
+    @app.before_request
+    def start_profile():
+        if not (requested() or random.random() < sample_rate):
+            return
+        if not active.acquire(blocking=False):
+            return
+        if mode == MODE_CPROFILE:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = StackSampler(threading.get_ident())
+            profiler.start()
+        g.profiler = profiler
+        g.profile_started = time.perf_counter()
+    
+    @app.after_request
+    def save_profile(response: Response) -> Response:
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        try:
+            elapsed_ms = (time.perf_counter() - g.pop('profile_started')) * 1000
+            if mode == MODE_CPROFILE:
+                profiler.disable()
+            else:
+                profiler.stop()
+            
+            endpoint = (request.endpoint or 'unmatched').replace('.', '_')
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(sequence)}-{endpoint}-{elapsed_ms:.0f}ms"
+            directory.mkdir(parents=True, exist_ok=True)
+            if mode == MODE_CPROFILE:
+                path = directory / f"{name}.pstats"
+                profiler.dump_stats(str(path))
+            else:
+                path = directory / f"{name}.collapsed"
+                profiler.write_collapsed(path)
+            response.headers['X-Profile-File'] = path.name
+            logger.info(f"Profiled {request.path} in {elapsed_ms:.0f} ms: {path}")
+        finally:
+            active.release()
+        return response
+    
+    @app.teardown_request
+    def stop_profile(error: Optional[BaseException]):
+        profiler = g.pop('profiler', None)  # Still set only if the request failed before after_request
+        if profiler is None:
+            return
+        if mode == MODE_CPROFILE:
+            profiler.disable()
+        else:
+            profiler.stop()
+        active.release()
@@ -0,0 +1,262 @@
+"""
+Local stub retailer HTTP server for offline collector testing and benchmarks.
+Serves synthetic Pop Mart and Pokémon product pages with schema.org JSON-LD.
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Any
+
+from ..models.product import BrandType
+
+
+POP_MART_SERIES = ["SKULLPANDA", "Molly", "HIRONO", "DIMOO", "LABUBU", "CRYBABY", "Hacipupu", "PUCKY"]
+POP_MART_THEMES = ["City of Night", "Space Travel", "Underwater", "Chess Club", "Sound", "Winter", "Circus", "Garden"]
+POKEMON_SETS = ["Scarlet & Violet", "Paldea Evolved", "Obsidian Flames", "Paradox Rift", "Temporal Forces", "151"]
+POKEMON_FORMATS = [
+    ("Booster Pack", "booster"), ("Booster Box", "box"), ("Elite Trainer Box", "box"),
+    ("Collector Tin", "tin"), ("Theme Deck", "deck")
+]
+
+
+@dataclass
+class StubConfig:
+    """Behavior of the stub retailer."""
+
+    products_per_brand: int = 100
+    latency: float = 0.0  # Base seconds added to every response
+    latency_jitter: float = 0.0  # Random extra seconds up to this value
+    error_rate: float = 0.0  # Fraction of requests answered with 500
+    rate_limit_rate: float = 0.0  # Fraction of requests answered with 429
+    retry_after: int = 0  # Retry-After value sent with 429 responses
+    enable_etags: bool = True
+    seed: int = 0
+
+
+@dataclass
+class StubStats:
+    """Counters for requests served by the stub."""
+
+    requests: int = 0
+    status_counts: Dict[int, int] = field(default_factory=dict)
+
+    def record(self, status: int):
+        self.requests += 1
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+
+class StubRetailerServer:
+    """
+    Threaded local HTTP server imitating a retailer website.
+
+    Routes:
+        /sitemap/<brand>.xml            Sitemap listing product page URLs
+        /<brand>/product/<product_id>   Product page with embedded JSON-LD
+
+    Example:
+        with StubRetailerServer(StubConfig(products_per_brand=50)) as stub:
+            collector.base_url = stub.base_url
+    """
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = '127.0.0.1', port: int = 0):
+        self.config = config or StubConfig()
+        self.stats = StubStats()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._products: Dict[str, Dict[str, Dict[str, Any]]] = {
+            brand.value: self._generate_products(brand) for brand in BrandType
+        }
+        self._pages: Dict[str, bytes] = {}
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """Base URL collectors should crawl."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'StubRetailerServer':
+        """Start serving in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server and release the port."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> 'StubRetailerServer':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def mutate(self, fraction: float = 0.1) -> List[str]:
+        """
+        Change price and stock of a random fraction of products.
+
+        Returns the changed product ids. Changed pages get new ETags.
+        """
+        changed = []
+        with self._lock:
+            for brand_products in self._products.values():
+                for product_id, product in brand_products.items():
+                    if self._rng.random() < fraction:
+                        product['price'] = round(max(0.99, product['price'] * self._rng.uniform(0.85, 1.1)), 2)
+                        product['stock_level'] = self._rng.randint(0, 60)
+                        self._pages.pop(product_id, None)
+                        changed.append(product_id)
+        return changed
+
+    def _generate_products(self, brand: BrandType) -> Dict[str, Dict[str, Any]]:
+        """Create deterministic synthetic products for a brand."""
+        products = {}
+        prefix = 'stub_pm' if brand == BrandType.POP_MART else 'stub_pk'
+        for i in range(self.config.products_per_brand):
+            if brand == BrandType.POP_MART:
+                name = f"{self._rng.choice(POP_MART_SERIES)} {self._rng.choice(POP_MART_THEMES)} Series"
+                category = self._rng.choice(["blind_box", "blind_box", "mega", "plush"])
+                price = round(self._rng.uniform(9.99, 19.99), 2)
+            else:
+                product_format, category = self._rng.choice(POKEMON_FORMATS)
+                name = f"Pokémon TCG {self._rng.choice(POKEMON_SETS)} {product_format}"
+                price = round(self._rng.uniform(4.99, 159.99), 2)
+
+            product_id = f"{prefix}_{i:05d}"
+            products[product_id] = {
+                'id': product_id,
+                'name': name,
+                'category': category,
+                'price': price,
+                'list_price': round(price * 1.15, 2) if self._rng.random() < 0.3 else None,
+                'stock_level': self._rng.randint(0, 60),
+                'tags': name.lower().split()[:3]
+            }
+        return products
+
+    def _render_sitemap(self, brand: str) -> bytes:
+        """Render a sitemap for one brand."""
+        locs = ''.join(
+            f"<url><loc>{self.base_url}/{brand}/product/{product_id}</loc></url>"
+            for product_id in self._products[brand]
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{locs}</urlset>'
+        ).encode('utf-8')
+
+    def _render_product_page(self, brand: str, product: Dict[str, Any]) -> bytes:
+        """Render a product page with schema.org JSON-LD."""
+        stock_level = product['stock_level']
+        offer = {
+            '@type': 'Offer',
+            'price': f"{product['price']:.2f}",
+            'priceCurrency': 'USD',
+            'availability': 'https://schema.org/' + ('InStock' if stock_level else 'OutOfStock'),
+            'inventoryLevel': {'@type': 'QuantitativeValue', 'value': stock_level},
+            'seller': {'@type': 'Organization', 'name': 'Stub Retailer'},
+            'url': f"{self.base_url}/{brand}/product/{product['id']}"
+        }
+        if product['list_price']:
+            offer['priceSpecification'] = {
+                '@type': 'UnitPriceSpecification',
+                'priceType': 'https://schema.org/ListPrice',
+                'price': f"{product['list_price']:.2f}"
+            }
+        schema = {
+            '@context': 'https://schema.org',
+            '@type': 'Product',
+            'sku': product['id'],
+            'name': product['name'],
+            'image': [f"/static/images/{product['id']}.jpg"],
+            'description': f"Synthetic {product['name']} for collector testing",
+            'category': product['category'],
+            'keywords': ', '.join(product['tags']),
+            'offers': offer
+        }
+        return (
+            '<!DOCTYPE html><html><head>'
+            f"<title>{product['name']}</title>"
+            f'<script type="application/ld+json">{json.dumps(schema)}</script>'
+            f"</head><body><h1>{product['name']}</h1></body></html>"
+        ).encode('utf-8')
+
+    def _resolve(self, path: str) -> Optional[bytes]:
+        """Get the body for a request path, or None for unknown paths."""
+        parts = path.strip('/').split('/')
+        if len(parts) == 2 and parts[0] == 'sitemap' and parts[1].endswith('.xml'):
+            brand = parts[1][:-4]
+            if brand in self._products:
+                return self._render_sitemap(brand)
+        elif len(parts) == 3 and parts[1] == 'product' and parts[0] in self._products:
+            brand, product_id = parts[0], parts[2]
+            with self._lock:
+                product = self._products[brand].get(product_id)
+                if product is None:
+                    return None
+                page = self._pages.get(product_id)
+                if page is None:
+                    page = self._pages[product_id] = self._render_product_page(brand, product)
+            return page
+        return None
+
+    def _make_handler(self):
+        """Create the request handler class bound to this server."""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like real retailers
+            disable_nagle_algorithm = True
+            wbufsize = -1  # Send headers and body in one write
+
+            def do_GET(self):
+                config = stub.config
+                delay = config.latency + (stub._rng.uniform(0, config.latency_jitter) if config.latency_jitter else 0)
+                if delay > 0:
+                    time.sleep(delay)
+
+                with stub._lock:
+                    roll = stub._rng.random()
+                if roll < config.error_rate:
+                    return self._send(500, b'stub error')
+                if roll < config.error_rate + config.rate_limit_rate:
+                    return self._send(429, b'slow down', {'Retry-After': str(config.retry_after)})
+
+                body = stub._resolve(self.path.split('?', 1)[0])
+                if body is None:
+                    return self._send(404, b'not found')
+
+                content_type = 'application/xml' if self.path.endswith('.xml') else 'text/html; charset=utf-8'
+                if not config.enable_etags:
+                    return self._send(200, body, {'Content-Type': content_type})
+
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    return self._send(304, b'', {'ETag': etag})
+                return self._send(200, body, {'Content-Type': content_type, 'ETag': etag})
+
+            def _send(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None):
+                with stub._lock:
+                    stub.stats.record(status)
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep benchmark output clean
+
+        return Handler
@@ -0,0 +1,609 @@
+"""
+Unit tests for API endpoints.
+"""
+
+import csv
+import gzip
+import io
+import json
+import os
+import pstats
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+from flask import Flask
+from werkzeug.http import http_date
+
+from src.main.python.api.app import create_app, reset_after_fork
+from src.main.python.utils.compression import negotiate_encoding
+from src.main.python.utils.json_stream import iter_json_envelope, iter_lines
+from src.main.python.utils.msgpack_format import msgpack
+from src.main.python.utils.metrics import (
+    MetricsRegistry, clear_multiprocess_dir, fetch_hook, instrument_database, mark_process_dead
+)
+from src.main.python.utils.profiling import init_profiling
+from src.main.python.core.database import DatabaseManager, ProductUpdate
+from src.main.python.models.product import PriceHistory, StockStatus
+
+
+class TestApiEndpoints(unittest.TestCase):
+    """Test API routes against the sample catalog."""
+    
+    def setUp(self):
+        """Create an app with the in-memory sample database."""
+        self.app = create_app()
+        self.app.testing = True
+        self.client = self.app.test_client()
+    
+    def test_health(self):
+        """Test health check responds."""
+        response = self.client.get('/api/health')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_json()['success'])
+    
+    def test_stats(self):
+        """Test brand statistics come from maintained aggregates."""
+        data = self.client.get('/api/stats?brand=pokemon').get_json()['data']
+        
+        self.assertEqual(data['total_products'], 3)
+        self.assertEqual(data['in_stock'], 2)
+        self.assertEqual(data['categories'], ['booster', 'box', 'deck'])
+    
+    def test_canonical_products(self):
+        """Test one best offer is listed per canonical product."""
+        response = self.client.get('/api/canonical-products?brand=pokemon')
+        data = response.get_json()
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['data']), 3)
+        listing = data['data'][0]
+        self.assertIn('best_offer', listing)
+        self.assertEqual(listing['offer_count'], 1)
+        
+        offers = self.client.get(f"/api/canonical-products/{listing['id']}/offers").get_json()
+        self.assertEqual(offers['data'][0]['id'], listing['best_offer']['id'])
+    
+    def test_bulk_update(self):
+        """Test bulk updates apply in one call and report per-item status."""
+        response = self.client.post('/api/products/bulk-update', json={'updates': [
+            {'product_id': 'pk_001', 'stock_level': 0},
+            {'product_id': 'pk_002', 'price': 70.0},
+            {'product_id': 'nope', 'stock_level': 1},
+        ]})
+        data = response.get_json()['data']
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['updated'], 2)
+        self.assertEqual([r['status'] for r in data['results']], ['updated', 'updated', 'not_found'])
+        product = self.client.get('/api/products/pk_001').get_json()['data']
+        self.assertEqual(product['stock_status'], 'out_of_stock')
+        
+        bad = self.client.post('/api/products/bulk-update', json={'updates': [{'product_id': 'pk_001'}]})
+        self.assertEqual(bad.status_code, 400)
+    
+    
+    def test_conditional_requests(self):
+        """Test unchanged polls get 304 until the catalog changes."""
+        first = self.client.get('/api/products?brand=pop_mart')
+        etag = first.headers['ETag']
+        
+        self.assertEqual(first.headers['Cache-Control'], 'public, no-cache')
+        cached = self.client.get('/api/products?brand=pop_mart', headers={'If-None-Match': etag})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.data, b'')
+        self.assertIn('Accept-Encoding', cached.headers['Vary'])
+        
+        # Last-Modified and If-Modified-Since are only used once the second of the last write is over
+        db = self.app.extensions['database']
+        for offset, expected in ((-5, 304), (60, 200)):
+            db.connection.execute('UPDATE catalog_version SET modified_at = ?', (time.time() + offset,))
+            db.connection.commit()
+            self.app.extensions['product_cache'].clear()
+            response = self.client.get('/api/products/pm_001')
+            self.assertEqual('Last-Modified' in response.headers, expected == 304)
+            since = self.client.get('/api/products/pm_001', headers={'If-Modified-Since': http_date(time.time() + 3600)})
+            self.assertEqual(since.status_code, expected)
+        
+        self.client.post('/api/products/bulk-update', json={'updates': [{'product_id': 'pm_001', 'stock_level': 4}]})
+        changed = self.client.get('/api/products?brand=pop_mart', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+    
+    
+    def test_history_validators_change_daily(self):
+        """Test history windows get new validators at midnight without a catalog write."""
+        class Tomorrow(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.now(tz) + timedelta(days=1)
+        
+        for url in ('/api/products/pm_001/history', '/api/history?ids=pm_001', '/pop_mart/product/pm_001'):
+            etag = self.client.get(url).headers['ETag']
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304, url)
+            with mock.patch('src.main.python.api.app.datetime', Tomorrow):
+                later = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(later.status_code, 200, url)
+            self.assertNotEqual(later.headers['ETag'], etag, url)
+    
+    def test_brand_pages_render(self):
+        """Test brand pages render for both brands."""
+        for url in ('/pop_mart', '/pokemon/products', '/pop_mart/product/pm_001'):
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+    
+    def test_page_and_fragment_cache(self):
+        """Test pages are reused and a stock change re-renders one card."""
+        page_cache = self.app.extensions['page_cache']
+        first = self.client.get('/pop_mart/products').data
+        cards = page_cache.fragments.stats.misses
+        
+        self.assertEqual(self.client.get('/pop_mart/products').data, first)
+        self.assertEqual(page_cache.pages.stats.hits, 1)
+        
+        self.client.post('/api/products/bulk-update', json={'updates': [{'product_id': 'pm_001', 'stock_level': 0}]})
+        updated = self.client.get('/pop_mart/products').data
+        
+        self.assertNotEqual(updated, first)
+        self.assertEqual(page_cache.fragments.stats.misses, cards + 1)
+    
+    
+    def test_gzip_negotiation(self):
+        """Test large responses are compressed and small ones are not."""
+        response = self.client.get('/pop_mart', headers={'Accept-Encoding': 'gzip'})
+        
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertIn(b'<html', gzip.decompress(response.data))
+        
+        small = self.client.get('/api/health', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', small.headers)
+        plain = self.client.get('/pop_mart', headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', plain.headers)
+    
+    def test_streamed_json_is_compressed(self):
+        """Test streamed collections decode to the standard envelope."""
+        response = self.client.get('/api/products?per_page=100', headers={'Accept-Encoding': 'gzip'})
+        data = json.loads(gzip.decompress(response.data))
+        
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['data']), data['pagination']['total'])
+    
+    
+    def test_change_stream(self):
+        """Test the event stream endpoint validates filters and streams events."""
+        response = self.client.get('/api/stream?brand=pokemon&ids=pk_001')
+        
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+        response.close()
+        self.assertEqual(self.client.get('/api/stream?brand=lego').status_code, 400)
+        self.assertEqual(self.client.get('/api/stream', headers={'Last-Event-ID': 'x'}).status_code, 400)
+    
+    def test_change_stream_limit(self):
+        """Test streams beyond the limit are refused so they can't take every worker thread."""
+        self.app.extensions['change_broker'].max_subscribers = 2
+        streams = [self.client.get('/api/stream') for _ in range(2)]
+        
+        refused = self.client.get('/api/stream')
+        self.assertEqual(refused.status_code, 503)
+        self.assertEqual(refused.headers['Retry-After'], '30')
+        cursor = self.client.get('/api/products/changes?limit=0').get_json()
+        self.assertEqual((cursor['data'], cursor['has_more']), ([], False))
+        self.assertEqual(refused.get_json()['changes'], f"/api/products/changes?since={cursor['cursor']}")
+        
+        streams.pop().close()
+        self.assertEqual(self.client.get('/api/stream').status_code, 200)
+    
+    def test_product_changes(self):
+        """Test the change cursor pages through the catalog and then goes quiet."""
+        response = self.client.get('/api/products/changes?since=0&limit=2')
+        page = response.get_json()
+        
+        self.assertEqual(len(page['data']), 2)
+        self.assertTrue(page['has_more'])
+        self.assertEqual(page['deleted'], [])
+        
+        rest = self.client.get(f"/api/products/changes?since={page['cursor']}&limit=100").get_json()
+        self.assertFalse(rest['has_more'])
+        
+        quiet = self.client.get(f"/api/products/changes?since={rest['cursor']}").get_json()
+        self.assertEqual(quiet['data'], [])
+        self.assertEqual(quiet['cursor'], rest['cursor'])
+        self.assertEqual(self.client.get('/api/products/changes?since=-1').status_code, 400)
+    
+    def test_bulk_ingest(self):
+        """Test NDJSON products are upserted with per-line errors."""
+        lines = [
+            json.dumps({
+                "id": "partner_1", "name": "Partner Figure", "brand": "pokemon", "source": "Partner",
+                "purchase_link": "https://example.com", "price": 20.0, "stock_level": 8,
+                "stock_status": "in_stock", "image_url": "/i.jpg"
+            }),
+            '{"id": "partner_2"}',
+            json.dumps({
+                "id": "partner_3", "name": "Tagged Figure", "brand": "pokemon", "source": "Partner",
+                "purchase_link": "https://example.com", "price": 20.0, "stock_level": 8,
+                "stock_status": "in_stock", "image_url": "/i.jpg", "tags": {"a": 1}
+            }),
+        ]
+        response = self.client.post(
+            '/api/products/bulk?source=Partner', data='\n'.join(lines), content_type='application/x-ndjson'
+        )
+        data = response.get_json()['data']
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((data['created'], data['failed']), (1, 2))
+        self.assertEqual([error['line'] for error in data['errors']], [2, 3])
+        self.assertEqual(self.client.get('/pokemon/products').status_code, 200)
+        self.assertEqual(self.client.get('/api/products/partner_1').get_json()['data']['price'], 20.0)
+        
+        listings = self.client.get('/api/canonical-products?brand=pokemon').get_json()['data']
+        self.assertIn('partner_1', [listing['best_offer']['id'] for listing in listings])
+    
+    def test_export(self):
+        """Test catalog exports stream NDJSON and CSV downloads."""
+        ndjson = self.client.get('/api/export/products?brand=pokemon')
+        rows = [json.loads(line) for line in ndjson.data.splitlines()]
+        
+        self.assertEqual(ndjson.mimetype, 'application/x-ndjson')
+        self.assertIn('attachment', ndjson.headers['Content-Disposition'])
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(all(row['brand'] == 'pokemon' for row in rows))
+        
+        text = self.client.get('/api/export/products?format=csv').get_data(as_text=True)
+        csv_rows = list(csv.DictReader(io.StringIO(text)))
+        self.assertEqual(len(csv_rows), self.client.get('/api/stats').get_json()['data']['total_products'])
+        self.assertIsInstance(json.loads(csv_rows[0]['tags']), list)
+        
+        history = self.client.get('/api/export/price-history?format=csv&ids=pk_001&days=30').get_data(as_text=True)
+        self.assertTrue(history.startswith('product_id,price,timestamp,source'))
+        self.assertEqual(self.client.get('/api/export/products?format=xml').status_code, 400)
+    
+    def test_pagination_bounds(self):
+        """Test page and per_page below 1 are rejected and per_page is capped."""
+        for query in ('per_page=-1', 'per_page=0', 'page=0', 'page=-2'):
+            for path in ('/api/products', '/api/products/low-stock', '/api/products/price-drops',
+                         '/api/canonical-products'):
+                self.assertEqual(self.client.get(f'{path}?{query}').status_code, 400, f'{path}?{query}')
+        
+        pagination = self.client.get('/api/products?per_page=1000').get_json()['pagination']
+        self.assertEqual(pagination['per_page'], 100)
+    
+    def test_sparse_fields(self):
+        """Test fields= limits product responses to the requested keys."""
+        listing = self.client.get('/api/products?brand=pokemon&fields=id,name,price').get_json()
+        detail = self.client.get('/api/products/pk_001?fields=stock_status').get_json()
+        
+        self.assertEqual([list(p) for p in listing['data']], [['id', 'name', 'price']] * 3)
+        self.assertEqual(list(detail['data']), ['stock_status'])
+        self.assertEqual(self.client.get('/api/products?fields=id,secret').status_code, 400)
+    
+    def test_batch_history(self):
+        """Test several price histories come back in one response."""
+        data = self.client.get('/api/history?ids=pm_001,pk_001,pm_001&days=30').get_json()['data']
+        
+        self.assertEqual(sorted(data), ['pk_001', 'pm_001'])
+        self.assertEqual(data['pm_001'], self.client.get('/api/products/pm_001/history').get_json()['data'])
+        self.assertEqual(self.client.get('/api/history?ids=pm_001&resolution=day').status_code, 200)
+        
+        too_many = ','.join(f'id_{i}' for i in range(101))
+        self.assertEqual(self.client.get(f'/api/history?ids={too_many}').status_code, 400)
+        self.assertEqual(self.client.get('/api/history?ids=pm_001&resolution=minute').status_code, 400)
+        self.assertEqual(self.client.get('/api/history').status_code, 400)
+    
+    def test_history_max_points(self):
+        """Test max_points caps the number of history points."""
+        db = self.app.extensions['database']
+        for hours in range(1, 20):
+            db.save_price_history(PriceHistory("pm_001", 12.0 + hours % 3, datetime.now() - timedelta(hours=hours)))
+        full = self.client.get('/api/products/pm_001/history').get_json()['data']
+        reduced = self.client.get('/api/products/pm_001/history?max_points=3').get_json()['data']
+        
+        self.assertGreater(len(full), 3)
+        self.assertEqual(len(reduced), 3)
+        self.assertEqual([reduced[0], reduced[-1]], [full[0], full[-1]])
+        self.assertEqual(len(self.client.get('/api/history?ids=pm_001&max_points=3').get_json()['data']['pm_001']), 3)
+        self.assertEqual(self.client.get('/api/products/pm_001/history?max_points=1').status_code, 400)
+    
+    @unittest.skipIf(msgpack is None, "msgpack not installed")
+    def test_msgpack_negotiation(self):
+        """Test Accept: application/msgpack returns the same data with columnar history."""
+        accept = {'Accept': 'application/msgpack'}
+        listing = self.client.get('/api/products?brand=pokemon', headers=accept)
+        detail = self.client.get('/api/products/pk_001', headers=accept)
+        history = self.client.get('/api/products/pm_001/history', headers=accept)
+        
+        self.assertEqual(listing.mimetype, 'application/msgpack')
+        self.assertIn('Accept', listing.headers['Vary'])
+        self.assertEqual(msgpack.unpackb(listing.data), self.client.get('/api/products?brand=pokemon').get_json())
+        self.assertEqual(msgpack.unpackb(detail.data), self.client.get('/api/products/pk_001').get_json())
+        
+        points = self.client.get('/api/products/pm_001/history').get_json()['data']
+        columns = msgpack.unpackb(history.data)['data']
+        self.assertEqual(columns['prices'], [point['price'] for point in points])
+        self.assertEqual(len(columns['timestamps']), len(points))
+        self.assertEqual(msgpack.unpackb(self.client.get('/api/history?ids=pm_001', headers=accept).data)['data'],
+                         {'pm_001': columns})
+        
+        self.assertNotEqual(history.headers['ETag'], self.client.get('/api/products/pm_001/history').headers['ETag'])
+        self.assertEqual(self.client.get('/api/products', headers={'Accept': '*/*'}).mimetype, 'application/json')
+        self.assertEqual(msgpack.unpackb(self.client.get('/api/products/missing', headers=accept).data)['success'], False)
+    
+    def test_metrics(self):
+        """Test request, query and cache metrics are exposed for Prometheus."""
+        self.client.get('/api/products?brand=pokemon')
+        self.client.get('/api/products/missing')
+        response = self.client.get('/api/metrics')
+        text = response.get_data(as_text=True)
+        
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn('http_request_duration_seconds_count{endpoint="api_products",method="GET"} 1', text)
+        self.assertIn('http_request_errors_total{endpoint="api_product_detail",status="404"} 1', text)
+        self.assertIn('db_query_duration_seconds_count{query="search_products"}', text)
+        self.assertIn('cache_misses_total{cache="products"}', text)
+
+
+class TestHttpHelpers(unittest.TestCase):
+    """Test encoding negotiation and streamed JSON."""
+    
+    def test_negotiate_encoding(self):
+        """Test q-values and wildcards select a supported coding."""
+        self.assertEqual(negotiate_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(negotiate_encoding('*'), negotiate_encoding('br, gzip'))
+        self.assertIsNone(negotiate_encoding('identity'))
+        self.assertIsNone(negotiate_encoding('gzip;q=0, *;q=0'))
+        self.assertIsNone(negotiate_encoding(None))
+    
+    def test_json_envelope_chunks(self):
+        """Test the envelope is valid JSON however it is chunked."""
+        items = ({'id': i} for i in range(100))
+        chunks = list(iter_json_envelope(items, fields={'pagination': {'page': 1}}, chunk_size=64))
+        
+        self.assertGreater(len(chunks), 3)
+        data = json.loads(b''.join(chunks))
+        self.assertEqual(data['pagination'], {'page': 1})
+        self.assertEqual([item['id'] for item in data['data']], list(range(100)))
+        self.assertEqual(json.loads(b''.join(iter_json_envelope([]))), {'success': True, 'data': []})
+    
+    def test_iter_lines_across_chunks(self):
+        """Test lines split across read chunks are rejoined."""
+        stream = io.BytesIO(b'{"a": 1}\r\n{"b": 2}\n\nlast')
+        
+        self.assertEqual(list(iter_lines(stream, chunk_size=3)), [b'{"a": 1}', b'{"b": 2}', b'', b'last'])
+    
+    def test_iter_lines_caps_line_length(self):
+        """Test an over-long line is cut just past the cap instead of buffered whole."""
+        stream = io.BytesIO(b'x' * 1000 + b'\nok\n' + b'y' * 1000)
+        
+        self.assertEqual(list(iter_lines(stream, chunk_size=7, max_line_bytes=10)), [b'x' * 11, b'ok', b'y' * 11])
+
+
+
+class TestMetrics(unittest.TestCase):
+    """Test the metrics registry and its hooks."""
+    
+    def test_render_histogram(self):
+        """Test buckets are cumulative and labels escaped."""
+        metrics = MetricsRegistry()
+        for value in (0.002, 0.002, 3.0, 30.0):
+            metrics.observe('db_query_duration_seconds', value, query='a"b')
+        text = metrics.render()
+        
+        self.assertIn('db_query_duration_seconds_bucket{query="a\\"b",le="0.0025"} 2', text)
+        self.assertIn('db_query_duration_seconds_bucket{query="a\\"b",le="5"} 3', text)
+        self.assertIn('db_query_duration_seconds_bucket{query="a\\"b",le="+Inf"} 4', text)
+        self.assertIn('db_query_duration_seconds_count{query="a\\"b"} 4', text)
+    
+    def test_database_calls_counted_once(self):
+        """Test nested public calls and failures are recorded on the outer method."""
+        metrics = MetricsRegistry()
+        db = DatabaseManager()
+        self.addCleanup(db.close)
+        instrument_database(db, metrics)
+        db.add_change_listener(lambda change: db.get_product_by_id(change.product_id))
+        
+        db.save_product(db.get_product_by_id("pm_001"))
+        with self.assertRaises(Exception):
+            db.get_changes_since("not a number")
+        
+        self.assertEqual(metrics.histogram('db_query_duration_seconds', query='save_product').count, 1)
+        self.assertEqual(metrics.histogram('db_query_duration_seconds', query='get_product_by_id').count, 1)
+        self.assertEqual(metrics.counter_value('db_query_errors_total', query='get_changes_since'), 1)
+    
+    def test_bookkeeping_calls_not_counted(self):
+        """Test version and change-cursor reads aren't recorded as queries."""
+        metrics = MetricsRegistry()
+        db = DatabaseManager()
+        self.addCleanup(db.close)
+        instrument_database(db, metrics)
+        
+        db.data_version()
+        db.get_catalog_version()
+        db.get_change_seq()
+        db.poll_external_changes()
+        
+        for name in ('data_version', 'get_catalog_version', 'get_change_seq', 'poll_external_changes'):
+            self.assertIsNone(metrics.histogram('db_query_duration_seconds', query=name))
+        self.assertIsNotNone(metrics.histogram('db_query_duration_seconds', query='get_product_by_id'))
+    
+    def test_fetch_hook(self):
+        """Test collector fetches record latency and failed statuses."""
+        metrics = MetricsRegistry()
+        hook = fetch_hook(metrics, 'pokemon')
+        hook('https://example.com/a', 200, 0.2)
+        hook('https://example.com/b', None, 30.0)
+        
+        self.assertEqual(metrics.histogram('collector_fetch_duration_seconds', collector='pokemon').count, 2)
+        self.assertEqual(metrics.counter_value('collector_fetch_errors_total', collector='pokemon', status='error'), 1)
+    
+    def test_multiprocess_dir_sums_workers(self):
+        """Test every worker reports the sum over workers, including exited ones."""
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        clear_multiprocess_dir(tempdir.name)
+        workers = []
+        for pid, hits in ((101, 1), (102, 2)):
+            metrics = MetricsRegistry(multiprocess_dir=tempdir.name)
+            metrics.inc('http_request_errors_total', endpoint='index', status='500')
+            metrics.observe('db_query_duration_seconds', 0.002 * hits, query='get_products')
+            metrics.add_collector(lambda hits=hits: [('cache_entries', {'cache': 'pages'}, hits)])
+            with mock.patch('src.main.python.utils.metrics.os.getpid', return_value=pid):
+                metrics.write_snapshot()
+            workers.append(metrics)
+        
+        with mock.patch('src.main.python.utils.metrics.os.getpid', return_value=101):
+            text = workers[0].render()  # Rewrites worker 101's snapshot first
+        self.assertIn('http_request_errors_total{endpoint="index",status="500"} 2', text)
+        self.assertIn('db_query_duration_seconds_bucket{query="get_products",le="0.0025"} 1', text)
+        self.assertIn('db_query_duration_seconds_count{query="get_products"} 2', text)
+        self.assertIn('cache_entries{cache="pages",pid="102"} 2', text)
+        
+        mark_process_dead(tempdir.name, 102)
+        with mock.patch('src.main.python.utils.metrics.os.getpid', return_value=101):
+            text = workers[0].render()
+        self.assertIn('http_request_errors_total{endpoint="index",status="500"} 2', text)
+        self.assertIn('db_query_duration_seconds_count{query="get_products"} 2', text)
+        self.assertNotIn('pid="102"', text)
+    
+    def test_reset_zeroes_held_histograms(self):
+        """Test reset clears values a forked worker inherited, including histograms hot paths hold."""
+        metrics = MetricsRegistry()
+        histogram = metrics.get_histogram('db_query_duration_seconds', query='get_products')
+        histogram.observe(0.1)
+        metrics.inc('db_query_errors_total', query='get_products')
+        
+        metrics.reset()
+        histogram.observe(0.2)
+        
+        self.assertEqual(metrics.counter_value('db_query_errors_total', query='get_products'), 0)
+        self.assertIn('db_query_duration_seconds_count{query="get_products"} 1', metrics.render())
+
+
+
+class TestProfiling(unittest.TestCase):
+    """Test opt-in request profiling."""
+    
+    def setUp(self):
+        """Create a directory for profiles."""
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.profile_dir = Path(self.tempdir.name)
+    
+    def test_profile_names_service_and_database_functions(self):
+        """Test a request with the secret writes a pstats profile of the page."""
+        with mock.patch.dict(os.environ, {'PROFILE_SECRET': 's3cret', 'PROFILE_DIR': str(self.profile_dir)}):
+            client = create_app().test_client()
+        
+        self.assertNotIn('X-Profile-File', client.get('/pokemon/products', headers={'X-Profile': 'wrong'}).headers)
+        self.assertNotIn('X-Profile-File', client.get('/pokemon/products?profile=s3cret').headers)
+        response = client.get('/pokemon/products?category=box', headers={'X-Profile': 's3cret'})
+        
+        stats = pstats.Stats(str(self.profile_dir / response.headers['X-Profile-File']))
+        functions = {name for _, _, name in stats.stats}
+        self.assertTrue({'search_products', '_row_to_product', 'to_dict'} <= functions)
+        self.assertEqual(len(list(self.profile_dir.iterdir())), 1)
+        
+        # The page is now cached; a profiled request still renders it
+        response = client.get('/pokemon/products?category=box', headers={'X-Profile': 's3cret'})
+        stats = pstats.Stats(str(self.profile_dir / response.headers['X-Profile-File']))
+        self.assertIn('search_products', {name for _, _, name in stats.stats})
+    
+    def test_sampled_collapsed_stacks(self):
+        """Test sample mode writes collapsed stacks for every sampled request."""
+        app = Flask(__name__)
+        init_profiling(app, str(self.profile_dir), sample_rate=1.0, mode='sample')
+        
+        @app.route('/slow')
+        def slow_view():
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+            return 'done'
+        
+        response = app.test_client().get('/slow')
+        
+        lines = (self.profile_dir / response.headers['X-Profile-File']).read_text().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(any('slow_view (test_api.py:' in line for line in lines))
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in lines))
+
+
+
+class TestWorkerProcesses(unittest.TestCase):
+    """Test an app shared by several processes through one database file."""
+    
+    def setUp(self):
+        """Create an app on a database file, polling only when asked."""
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.path = os.path.join(self.tempdir.name, 'catalog.db')
+        with mock.patch.dict(os.environ, {'DATABASE_PATH': self.path, 'CHANGE_POLL_INTERVAL': '0'}):
+            self.app = create_app()
+        self.client = self.app.test_client()
+        self.db = self.app.extensions['database']
+        self.addCleanup(self.db.close)
+    
+    def test_reset_after_fork(self):
+        """Test a forked worker drops cached pages and restarts event ids."""
+        self.db.apply_product_updates([ProductUpdate('pm_001', stock_level=1)])
+        self.client.get('/pokemon/products')
+        self.client.get('/api/products').get_data()
+        broker = self.app.extensions['change_broker']
+        self.assertTrue(broker.events_after(broker.last_event_id - 1)[0])
+        self.assertTrue(len(self.app.extensions['page_cache'].pages))
+        self.assertTrue(len(self.app.extensions['product_json'].entries))
+        
+        time.sleep(0.002)
+        previous = broker.last_event_id
+        reset_after_fork(self.app)
+        
+        self.assertEqual(len(self.app.extensions['page_cache'].pages), 0)
+        self.assertEqual(len(self.app.extensions['product_json'].entries), 0)
+        self.assertEqual(len(self.app.extensions['product_cache'].products), 0)
+        self.assertGreater(broker.last_event_id, previous)
+        self.assertEqual(broker.events_after(previous), ([], False))  # A client of the parent refetches
+    
+    def test_other_process_writes_reach_listeners(self):
+        """Test polled writes from another connection reach the change feed and page cache."""
+        self.client.get('/pop_mart/products')
+        self.assertTrue(len(self.app.extensions['page_cache'].pages))
+        broker = self.app.extensions['change_broker']
+        start = broker.last_event_id
+        
+        other = DatabaseManager(self.path)
+        self.addCleanup(other.close)
+        other.apply_product_updates([ProductUpdate('pm_001', stock_level=0, stock_status=StockStatus.OUT_OF_STOCK)])
+        self.db.poll_external_changes()
+        
+        events, complete = broker.events_after(start)
+        self.assertTrue(complete)
+        self.assertEqual([(event.product_id, event.data['stock_level']) for event in events], [('pm_001', 0)])
+        self.assertEqual(len(self.app.extensions['page_cache'].pages), 0)
+    
+    def test_polling_starts_with_the_first_request(self):
+        """Test the polling thread picks up another connection's write without being called."""
+        with mock.patch.dict(os.environ, {'DATABASE_PATH': self.path, 'CHANGE_POLL_INTERVAL': '0.01'}):
+            app = create_app()
+        self.addCleanup(app.extensions['database'].close)
+        broker = app.extensions['change_broker']
+        start = broker.last_event_id
+        app.test_client().get('/api/health')
+        
+        other = DatabaseManager(self.path)
+        self.addCleanup(other.close)
+        other.apply_product_updates([ProductUpdate('pm_002', stock_level=7)])
+        
+        deadline = time.monotonic() + 5
+        while not broker.events_after(start)[0] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([event.product_id for event in broker.events_after(start)[0]], ['pm_002'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,230 @@
+"""
+Unit tests for core infrastructure.
+"""
+
+import json
+import tempfile
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta
+
+from src.main.python.core.response_store import ResponseStore
+from src.main.python.core.cache import LRUCache, TTLCache, PageCache, ProductCache, ProductJsonCache
+from src.main.python.core.database import DatabaseManager, ProductChange, ProductUpdate
+from src.main.python.models.product import BrandType
+
+
+class TestResponseStore(unittest.TestCase):
+    """Test content-addressed response storage."""
+    
+    def setUp(self):
+        """Set up a temporary store."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = ResponseStore(self.tmp_dir.name, compression='gzip')
+    
+    def tearDown(self):
+        """Remove the temporary store."""
+        self.tmp_dir.cleanup()
+    
+    def test_put_and_get_round_trip(self):
+        """Test bodies are stored compressed and read back intact."""
+        entry = self.store.put("https://example.com/p/1", b"<html>product</html>", source="pop_mart")
+        
+        self.assertEqual(self.store.get(entry.digest), b"<html>product</html>")
+        self.assertIsNone(self.store.get("0" * 64))
+    
+    def test_identical_bodies_are_deduplicated(self):
+        """Test the same body fetched twice is stored once but indexed twice."""
+        first = self.store.put("https://example.com/p/1", b"same body")
+        second = self.store.put("https://example.com/p/2", b"same body")
+        
+        self.assertEqual(first.digest, second.digest)
+        self.assertEqual(len(list(self.store.objects_dir.rglob('*.gz'))), 1)
+        self.assertEqual(len(list(self.store.entries())), 2)
+    
+    def test_latest_entries_per_url(self):
+        """Test the most recent body per URL is selected for replay."""
+        now = datetime.now()
+        self.store.put("https://example.com/p/1", b"old", source="pokemon", timestamp=now - timedelta(hours=1))
+        self.store.put("https://example.com/p/1", b"new", source="pokemon", timestamp=now)
+        self.store.put("https://example.com/p/2", b"other", source="pop_mart", timestamp=now)
+        
+        latest = self.store.latest_entries(source="pokemon")
+        
+        self.assertEqual(len(latest), 1)
+        self.assertEqual(self.store.get(latest[0].digest), b"new")
+        
+        as_of = self.store.latest_entries(source="pokemon", until=now - timedelta(minutes=30))
+        self.assertEqual(self.store.get(as_of[0].digest), b"old")
+
+
+class TestCaches(unittest.TestCase):
+    """Test the LRU and TTL caches."""
+    
+    def test_lru_evicts_least_recently_used(self):
+        """Test the entry cap evicts the oldest unused entry."""
+        cache = LRUCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats.evictions, 1)
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (3, 1))
+    
+    def test_memory_cap(self):
+        """Test entries are evicted to stay under the byte cap."""
+        cache = LRUCache(max_entries=100, max_bytes=250, sizeof=lambda value: 100)
+        for key in range(5):
+            cache.put(key, key)
+        
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.size_bytes, 200)
+    
+    def test_ttl_expiry(self):
+        """Test entries older than the TTL are not served."""
+        cache = TTLCache(ttl=0)
+        cache.put("a", 1)
+        
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats.evictions, 1)
+    
+    def test_on_evict(self):
+        """Test entries dropped for size, and values too large to store, are passed to on_evict."""
+        evicted = []
+        cache = LRUCache(max_entries=2, max_bytes=10, sizeof=len, on_evict=lambda key, value: evicted.append(key))
+        cache.put("a", "x")
+        cache.put("b", "x")
+        cache.put("c", "x")
+        cache.put("d", "x" * 11)
+        cache.invalidate("c")
+        
+        self.assertEqual(evicted, ["a", "d"])
+
+
+class TestPageCache(unittest.TestCase):
+    """Test cached pages and fragments."""
+    
+    def test_fragment_index_follows_evictions(self):
+        """Test evicted and invalidated fragments leave the product index."""
+        cache = PageCache(max_fragments=2)
+        for product_id in ("pm_001", "pm_002", "pm_003"):
+            cache.get_fragment(("card", "pop_mart", product_id, "t1"), lambda: "<div></div>")
+        
+        self.assertEqual(sorted(cache._fragment_keys), ["pm_002", "pm_003"])
+        cache.on_product_change(ProductChange("pm_002"))
+        self.assertEqual(list(cache._fragment_keys), ["pm_003"])
+        self.assertEqual(len(cache.fragments), 1)
+
+
+class TestProductCache(unittest.TestCase):
+    """Test read-through product caching and invalidation."""
+    
+    def setUp(self):
+        """Set up a cache over the sample database."""
+        self.db = DatabaseManager()
+        self.cache = ProductCache(self.db)
+        self.db.add_change_listener(self.cache.on_product_change)
+    
+    def tearDown(self):
+        """Close the database."""
+        self.db.close()
+    
+    def test_repeat_reads_hit_cache(self):
+        """Test a second read is served without a query."""
+        first = self.cache.get_product("pm_001")
+        second = self.cache.get_product("pm_001")
+        
+        self.assertIs(first, second)
+        self.assertEqual(self.cache.stats()['products']['hits'], 1)
+    
+    def test_writes_invalidate_product_and_brand_lists(self):
+        """Test a write drops the product and its brand's lists only."""
+        load = lambda brand: lambda: self.db.get_products(brand=brand)
+        self.cache.get_product("pm_001")
+        self.cache.get_list(('brand', 'pop_mart'), load(BrandType.POP_MART))
+        self.cache.get_list(('brand', 'pokemon'), load(BrandType.POKEMON))
+        
+        self.db.apply_product_updates([ProductUpdate("pm_001", stock_level=1)])
+        
+        self.assertEqual(self.cache.get_product("pm_001").stock_level, 1)
+        self.assertIsNone(self.cache.lists.peek(('brand', 'pop_mart')))
+        self.assertIsNotNone(self.cache.lists.peek(('brand', 'pokemon')))
+    
+    def test_read_racing_a_write_is_not_cached(self):
+        """Test a row read before a write isn't stored after the write invalidated it."""
+        def racing(load):
+            def loader():
+                stale = load()
+                self.db.apply_product_updates([ProductUpdate("pm_001", stock_level=3)])  # Lands mid-read
+                return stale
+            return loader
+        
+        read_product = self.db.get_product_by_id
+        with mock.patch.object(self.db, 'get_product_by_id', side_effect=lambda product_id: racing(
+            lambda: read_product(product_id)
+        )()):
+            stale = self.cache.get_product("pm_001")
+        self.cache.get_list(('brand', 'pop_mart'), racing(lambda: self.db.get_products(brand=BrandType.POP_MART)))
+        
+        self.assertNotEqual(stale.stock_level, 3)
+        self.assertIsNone(self.cache.products.peek("pm_001"))
+        self.assertIsNone(self.cache.lists.peek(('brand', 'pop_mart')))
+        self.assertEqual(self.cache.get_product("pm_001").stock_level, 3)
+    
+    def test_external_commit_clears_cache(self):
+        """Test commits from another connection reach the cache through the change poller."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = f"{tmp_dir}/catalog.db"
+            db = DatabaseManager(path)
+            cache = ProductCache(db)
+            db.add_change_listener(cache.on_product_change)
+            stock_level = cache.get_product("pm_001").stock_level
+            
+            other = DatabaseManager(path)
+            other.apply_product_updates([ProductUpdate("pm_001", stock_level=2)])
+            other.close()
+            
+            with mock.patch.object(db, "data_version", side_effect=AssertionError("reads don't check the database")):
+                self.assertEqual(cache.get_product("pm_001").stock_level, stock_level)
+            db.poll_external_changes()
+            self.assertEqual(cache.get_product("pm_001").stock_level, 2)
+            db.close()
+
+
+
+class TestProductJsonCache(unittest.TestCase):
+    """Test cached product serialization."""
+    
+    def setUp(self):
+        """Load a sample product."""
+        db = DatabaseManager()
+        self.product = db.get_product_by_id("pm_001")
+        db.close()
+        self.cache = ProductJsonCache()
+    
+    def test_bytes_reused_while_row_unchanged(self):
+        """Test a product is encoded once per version."""
+        first = self.cache.encode(self.product)
+        second = self.cache.encode(self.product)
+        
+        self.assertIs(first, second)
+        self.assertEqual(json.loads(first), self.product.to_dict())
+        
+        self.product.stock_level = 0
+        self.product.last_updated += timedelta(seconds=1)
+        self.assertEqual(json.loads(self.cache.encode(self.product))['stock_level'], 0)
+    
+    def test_change_releases_bytes(self):
+        """Test a write drops the product's entry."""
+        self.cache.encode(self.product)
+        self.cache.on_product_change(ProductChange(self.product.id))
+        
+        self.assertEqual(self.cache.stats()['entries'], 0)
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
+
@@ -0,0 +1,430 @@
+"""
+Unit tests for the database layer.
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+from src.main.python.core.database import (
+    DatabaseManager, ProductUpdate, UPDATE_APPLIED, UPDATE_CONFLICT, UPDATE_NOT_FOUND
+)
+from src.main.python.models.product import (
+    Product, BrandType, StockStatus, PriceHistory, StockAlert, PRODUCT_FIELDS
+)
+
+
+def make_product(product_id: str, **overrides) -> Product:
+    """Build a product with sensible defaults for database tests."""
+    fields = dict(
+        id=product_id,
+        name=f"Product {product_id}",
+        brand=BrandType.POP_MART,
+        source="Test Store",
+        purchase_link=f"https://example.com/{product_id}",
+        price=10.0,
+        stock_level=20,
+        stock_status=StockStatus.IN_STOCK,
+        image_url="/test/image.jpg",
+        category="test_cat"
+    )
+    fields.update(overrides)
+    return Product(**fields)
+
+
+class TestCatalogQueries(unittest.TestCase):
+    """Test catalog queries pushed down to SQL."""
+    
+    def setUp(self):
+        """Set up the sample database."""
+        self.db = DatabaseManager()
+    
+    def tearDown(self):
+        """Close the database."""
+        self.db.close()
+    
+    def test_low_stock_products(self):
+        """Test low stock excludes out of stock and orders scarcest first."""
+        self.db.save_product(make_product("low_1", stock_level=1, stock_status=StockStatus.LOW_STOCK))
+        self.db.save_product(make_product("gone", stock_level=0, stock_status=StockStatus.OUT_OF_STOCK))
+        
+        products = self.db.get_low_stock_products(threshold=5)
+        
+        self.assertEqual([p.id for p in products], ["low_1", "pm_002"])
+        self.assertEqual(self.db.get_low_stock_products(threshold=5, brand=BrandType.POKEMON), [])
+        self.assertEqual(len(self.db.get_low_stock_products(threshold=10, page=2, per_page=1)), 1)
+    
+    def test_sparse_fields_match_to_dict(self):
+        """Test partial rows serialize exactly like the full product."""
+        self.db.save_product(make_product("sale", original_price=12.5, tags=["a"], metadata={"k": 1}))
+        full = {p.id: p.to_dict() for p in self.db.search_products(per_page=100)}
+        
+        for fields in (PRODUCT_FIELDS, ("name", "discount_percentage"), ("tags",)):
+            for data in self.db.search_products(per_page=100, fields=fields):
+                self.assertEqual(list(data), list(fields))
+            rows = self.db.search_products(per_page=100, fields=("id",) + fields)
+            self.assertEqual(rows, [{"id": row["id"], **{k: full[row["id"]][k] for k in fields}} for row in rows])
+        
+        self.assertEqual(self.db.get_product_by_id("sale", fields=("is_on_sale",)), {"is_on_sale": True})
+        self.assertEqual(self.db.get_low_stock_products(threshold=5, fields=("id",)), [{"id": "pm_002"}])
+    
+    def test_price_histories_in_one_query(self):
+        """Test histories are grouped per product and bucketed to the last point."""
+        day = datetime(2030, 1, 2)
+        for hour, price in ((9, 10.0), (10, 11.0), (10.5, 12.0)):
+            self.db.save_price_history(PriceHistory("pm_001", price, day + timedelta(hours=hour), "Test"))
+        self.db.save_price_history(PriceHistory("pm_002", 5.0, day, "Test"))
+        
+        raw = self.db.get_price_histories(["pm_001", "pm_002", "missing"], since_date=day)
+        hourly = self.db.get_price_histories(["pm_001"], since_date=day, resolution="hour")
+        daily = self.db.get_price_histories(["pm_001"], since_date=day, resolution="day")
+        
+        self.assertEqual([p.price for p in raw["pm_001"]], [12.0, 11.0, 10.0])
+        self.assertEqual([p.price for p in raw["pm_002"]], [5.0])
+        self.assertEqual(raw["missing"], [])
+        self.assertEqual([p.price for p in hourly["pm_001"]], [12.0, 10.0])
+        self.assertEqual([(p.price, p.timestamp.minute) for p in daily["pm_001"]], [(12.0, 30)])
+        with self.assertRaises(ValueError):
+            self.db.get_price_histories(["pm_001"], resolution="minute")
+    
+    def test_price_drop_products(self):
+        """Test first-vs-last price comparison within the window."""
+        now = datetime.now()
+        self.db.save_product(make_product("riser"))
+        for product_id, prices in (("riser", [10.0, 12.0]), ("pm_003", [20.0, 15.99])):
+            for offset, price in enumerate(prices):
+                self.db.save_price_history(PriceHistory(product_id, price, now - timedelta(hours=2 - offset)))
+        # Old points outside the window are ignored
+        self.db.save_price_history(PriceHistory("riser", 30.0, now - timedelta(days=30)))
+        
+        products = self.db.get_price_drop_products(now - timedelta(days=7))
+        
+        # pm_003 dropped 20%, pk_002 ~11%, pm_001 ~13%; riser went up
+        self.assertEqual([p.id for p in products], ["pm_003", "pm_001", "pk_002"])
+        pokemon = self.db.get_price_drop_products(now - timedelta(days=7), brand=BrandType.POKEMON)
+        self.assertEqual([p.id for p in pokemon], ["pk_002"])
+    
+    
+    
+    def test_featured_products_ranked_by_score(self):
+        """Test deep stock, discounts and alerts outrank a bare listing."""
+        updated = datetime(2026, 1, 1)
+        for product_id, overrides in (
+            ("plain", dict(stock_level=5)),
+            ("deep", dict(stock_level=50)),
+            ("sale", dict(stock_level=5, price=3.0, original_price=12.0)),
+            ("watched", dict(stock_level=5)),
+            ("sold_out", dict(stock_level=0, stock_status=StockStatus.OUT_OF_STOCK, price=1.0, original_price=12.0)),
+        ):
+            self.db.save_product(make_product(product_id, brand=BrandType.POKEMON, last_updated=updated, **overrides))
+        for _ in range(20):
+            self.db.save_stock_alert(StockAlert("watched", "back_in_stock"))
+        
+        featured = self.db.get_featured_products(BrandType.POKEMON, limit=10)
+        
+        ranked = [p.id for p in featured if not p.id.startswith("pk_")]  # Skip fresher sample data
+        self.assertEqual(ranked, ["sale", "deep", "watched", "plain"])
+    
+    def test_featured_freshness_is_bounded(self):
+        """Test a fresh bare listing outranks a stale one but not deep stock."""
+        stale = datetime(2020, 1, 1)
+        for product_id, overrides in (
+            ("stale_plain", dict(stock_level=5, last_updated=stale)),
+            ("stale_deep", dict(stock_level=50, last_updated=stale)),
+            ("fresh_plain", dict(stock_level=5, last_updated=datetime.now())),
+        ):
+            self.db.save_product(make_product(product_id, brand=BrandType.POKEMON, **overrides))
+        
+        featured = self.db.get_featured_products(BrandType.POKEMON, limit=10)
+        
+        ranked = [p.id for p in featured if not p.id.startswith("pk_")]
+        self.assertEqual(ranked, ["stale_deep", "fresh_plain", "stale_plain"])
+        top = self.db.get_featured_products(BrandType.POKEMON, limit=2)
+        self.assertEqual([p.id for p in top], [p.id for p in featured[:2]])
+    
+    def test_featured_score_column_rebuilt_when_formula_changes(self):
+        """Test a database created with an older score formula gets the current one."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "catalog.db")
+            db = DatabaseManager(path)
+            db.connection.execute('DROP INDEX idx_products_featured')
+            db.connection.execute('ALTER TABLE products DROP COLUMN featured_score')
+            db.connection.execute(
+                'ALTER TABLE products ADD COLUMN featured_score REAL GENERATED ALWAYS AS (stock_level) VIRTUAL'
+            )
+            db.connection.commit()
+            db.close()
+            
+            db = DatabaseManager(path)
+            table_sql = db.connection.execute("SELECT sql FROM sqlite_master WHERE name = 'products'").fetchone()[0]
+            db.close()
+        
+        self.assertNotIn('AS (stock_level)', table_sql)
+        self.assertIn('MIN(alert_count, 20)', table_sql)
+    
+    def test_alert_count_follows_alerts(self):
+        """Test the alert count trigger tracks active alerts only."""
+        self.db.save_stock_alert(StockAlert("pm_001", "back_in_stock"))
+        self.db.save_stock_alert(StockAlert("pm_001", "back_in_stock", is_active=False))
+        
+        def alert_count():
+            row = self.db.connection.execute("SELECT alert_count FROM products WHERE id = 'pm_001'").fetchone()
+            return row[0]
+        
+        self.assertEqual(alert_count(), 1)
+        self.db.connection.execute("UPDATE stock_alerts SET is_active = 0 WHERE product_id = 'pm_001'")
+        self.assertEqual(alert_count(), 0)
+        
+        # A full product save keeps the maintained count
+        self.db.connection.execute("UPDATE stock_alerts SET is_active = 1 WHERE product_id = 'pm_001'")
+        self.db.save_product(self.db.get_product_by_id("pm_001"))
+        self.assertEqual(alert_count(), 2)
+
+
+
+class TestProductUpdates(unittest.TestCase):
+    """Test targeted stock and price updates."""
+    
+    def setUp(self):
+        """Set up the sample database."""
+        self.db = DatabaseManager()
+    
+    def tearDown(self):
+        """Close the database."""
+        self.db.close()
+    
+    def test_partial_update_keeps_other_columns(self):
+        """Test only stock, price and last_updated change."""
+        before = self.db.get_product_by_id("pm_001")
+        changed_at = datetime.now() + timedelta(minutes=1)
+        
+        results = self.db.apply_product_updates([
+            ProductUpdate("pm_001", stock_level=2, stock_status=StockStatus.LOW_STOCK, price=11.5, source="Feed"),
+            ProductUpdate("missing", stock_level=1),
+        ], updated_at=changed_at)
+        
+        self.assertEqual(results, [UPDATE_APPLIED, UPDATE_NOT_FOUND])
+        after = self.db.get_product_by_id("pm_001")
+        self.assertEqual((after.stock_level, after.stock_status, after.price), (2, StockStatus.LOW_STOCK, 11.5))
+        self.assertEqual((after.name, after.tags, after.original_price), (before.name, before.tags, before.original_price))
+        self.assertEqual(after.last_updated, changed_at)
+        
+        latest = self.db.get_price_history("pm_001")[0]
+        self.assertEqual((latest.price, latest.source, latest.timestamp), (11.5, "Feed", changed_at))
+    
+    def test_unchanged_price_not_recorded(self):
+        """Test history only grows when the price actually changes."""
+        history_size = len(self.db.get_price_history("pm_001"))
+        price = self.db.get_product_by_id("pm_001").price
+        
+        self.db.apply_product_updates([ProductUpdate("pm_001", price=price)])
+        
+        self.assertEqual(len(self.db.get_price_history("pm_001")), history_size)
+    
+    def test_compare_and_set(self):
+        """Test a stale expected_last_updated is reported as a conflict."""
+        seen = self.db.get_product_by_id("pm_001").last_updated
+        
+        first = self.db.apply_product_updates([ProductUpdate("pm_001", stock_level=7, expected_last_updated=seen)])
+        second = self.db.apply_product_updates([ProductUpdate("pm_001", stock_level=1, expected_last_updated=seen)])
+        
+        self.assertEqual(first, [UPDATE_APPLIED])
+        self.assertEqual(second, [UPDATE_CONFLICT])
+        self.assertEqual(self.db.get_product_by_id("pm_001").stock_level, 7)
+    
+    def test_single_writes_wait_for_open_transactions(self):
+        """Test a single-row write can't commit while another thread holds the write lock."""
+        writers = [
+            lambda: self.db.save_product(make_product("locked_1")),
+            lambda: self.db.save_price_history(PriceHistory("pm_001", 9.99)),
+            lambda: self.db.save_stock_alert(StockAlert("pm_001", "low_stock", threshold=1)),
+            lambda: self.db.save_offer("pm_001", "canonical_x"),
+        ]
+        with self.db._write_lock:
+            threads = [threading.Thread(target=writer) for writer in writers]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(0.1)
+            self.assertTrue(all(thread.is_alive() for thread in threads))
+        for thread in threads:
+            thread.join()
+        
+        self.assertIsNotNone(self.db.get_product_by_id("locked_1"))
+
+
+class TestChangeTracking(unittest.TestCase):
+    """Test the product change sequence and delete tombstones."""
+    
+    def setUp(self):
+        """Set up the sample database."""
+        self.db = DatabaseManager()
+    
+    def tearDown(self):
+        """Close the database."""
+        self.db.close()
+    
+    def test_writes_and_deletes_after_cursor(self):
+        """Test each changed product is reported once, deletes by id."""
+        cursor = self.db.get_change_seq()
+        self.db.apply_product_updates([ProductUpdate("pm_001", stock_level=1)])
+        self.db.save_product(make_product("pk_new"))
+        self.db.apply_product_updates([ProductUpdate("pm_001", stock_level=2)])
+        self.assertTrue(self.db.delete_product("pk_001"))
+        self.db.save_stock_alert(StockAlert(product_id="pm_002", alert_type="price_drop", target_price=5.0))
+        
+        changes = self.db.get_changes_since(cursor)
+        
+        self.assertEqual([p.id for p in changes.products], ["pk_new", "pm_001"])
+        self.assertEqual(changes.products[1].stock_level, 2)
+        self.assertEqual(changes.deleted_ids, ["pk_001"])
+        self.assertEqual(changes.cursor, self.db.get_change_seq())
+        self.assertFalse(changes.has_more)
+        self.assertIsNone(self.db.get_product_by_id("pk_001"))
+        self.assertEqual(self.db.get_price_history("pk_001"), [])
+    
+    def test_paging_and_resaved_tombstone(self):
+        """Test pages follow the cursor and a re-saved product is no longer deleted."""
+        product = self.db.get_product_by_id("pm_001")
+        self.db.delete_product("pm_001")
+        self.db.save_product(product)
+        
+        seen, deleted, since = [], [], 0
+        while True:
+            changes = self.db.get_changes_since(since, limit=2)
+            seen += [p.id for p in changes.products]
+            deleted += changes.deleted_ids
+            since = changes.cursor
+            if not changes.has_more:
+                break
+        
+        self.assertEqual(sorted(seen), sorted(p.id for p in self.db.get_products()))
+        self.assertEqual(deleted, [])
+        self.assertEqual(seen[-1], "pm_001")
+        self.assertEqual(self.db.get_changes_since(since).products, [])
+        self.assertFalse(self.db.delete_product("missing"))
+
+
+class TestCatalogExport(unittest.TestCase):
+    """Test snapshot exports."""
+    
+    def setUp(self):
+        """Set up a file database so the snapshot uses its own connection."""
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tempdir.name, "catalog.db"))
+    
+    def tearDown(self):
+        """Close the database and remove its files."""
+        self.db.close()
+        self.tempdir.cleanup()
+    
+    def test_export_ignores_concurrent_writes(self):
+        """Test an export started before a write doesn't see it."""
+        expected = [p.id for p in self.db.search_products()]
+        export = self.db.export_products(batch_size=2)
+        first = next(export)
+        
+        self.db.save_product(make_product("aaa_new"))
+        self.db.save_product(make_product("zzz_new"))
+        self.db.delete_product(expected[-1])
+        
+        self.assertEqual([first.id] + [p.id for p in export], sorted(expected))
+        self.assertIn("zzz_new", [p.id for p in self.db.export_products()])
+    
+    def test_reconnect(self):
+        """Test a new connection sees earlier writes and can write."""
+        self.db.save_product(make_product("before"))
+        self.db.reconnect()
+        self.db.save_product(make_product("after"))
+        
+        other = DatabaseManager(self.db.db_path)
+        self.addCleanup(other.close)
+        self.assertIsNotNone(self.db.get_product_by_id("before"))
+        self.assertIsNotNone(other.get_product_by_id("after"))
+    
+    def test_poll_external_changes(self):
+        """Test writes from other connections reach listeners once, and this connection's don't repeat."""
+        changes = []
+        self.db.add_change_listener(changes.append)
+        self.db.save_product(make_product("own"))
+        self.assertEqual(self.db.poll_external_changes(), 0)
+        
+        other = DatabaseManager(self.db.db_path)
+        self.addCleanup(other.close)
+        other.save_product(make_product("theirs"))
+        other.apply_product_updates([ProductUpdate("pm_001", stock_level=4)])
+        other.delete_product("pm_002")
+        changes.clear()
+        
+        self.assertEqual(self.db.poll_external_changes(), 3)
+        by_id = {change.product_id: change for change in changes}
+        self.assertEqual(set(by_id), {"theirs", "pm_001", "pm_002"})
+        self.assertEqual(by_id["pm_001"].product.stock_level, 4)
+        self.assertTrue(by_id["pm_002"].deleted)
+        self.assertEqual(self.db.poll_external_changes(), 0)
+    
+    def test_export_price_history_filters(self):
+        """Test price history exports filter by product and date, in order."""
+        self.db.save_price_history(PriceHistory("pm_001", 12.0, datetime.now() - timedelta(days=40), "Test"))
+        self.db.save_price_history(PriceHistory("pm_001", 11.0, datetime.now(), "Test"))
+        
+        history = list(self.db.export_price_history(["pm_001"], datetime.now() - timedelta(days=1)))
+        
+        self.assertEqual([point.price for point in history][-1], 11.0)
+        self.assertTrue(all(point.product_id == "pm_001" for point in history))
+        self.assertEqual(history, sorted(history, key=lambda point: point.timestamp))
+        self.assertGreater(len(list(self.db.export_price_history())), len(history))
+
+
+class TestCatalogStats(unittest.TestCase):
+    """Test trigger-maintained catalog statistics."""
+    
+    def setUp(self):
+        """Set up the sample database."""
+        self.db = DatabaseManager()
+    
+    def tearDown(self):
+        """Close the database."""
+        self.db.close()
+    
+    def totals(self, brand=None):
+        """Sum maintained aggregates by stock status."""
+        totals = {}
+        for row in self.db.get_catalog_stats(brand):
+            totals[row['stock_status']] = totals.get(row['stock_status'], 0) + row['product_count']
+        return totals
+    
+    def test_sample_data_counted(self):
+        """Test inserts are reflected in the aggregates."""
+        self.assertEqual(self.totals(BrandType.POP_MART), {'in_stock': 1, 'low_stock': 1, 'out_of_stock': 1})
+        self.assertEqual(self.db.check_catalog_stats(), [])
+    
+    def test_updates_apply_deltas(self):
+        """Test status, category and price changes move counts between groups."""
+        product = self.db.get_product_by_id("pm_003")
+        product.stock_level = 30
+        product.stock_status = StockStatus.IN_STOCK
+        product.category = "mega"
+        product.price = 0
+        self.db.save_product(product)
+        
+        self.assertEqual(self.totals(BrandType.POP_MART), {'in_stock': 2, 'low_stock': 1})
+        self.assertEqual(self.db.check_catalog_stats(), [])
+        
+        self.db.connection.execute("DELETE FROM products WHERE id = 'pm_001'")
+        self.assertEqual(self.totals(BrandType.POP_MART), {'in_stock': 1, 'low_stock': 1})
+        self.assertEqual(self.db.check_catalog_stats(), [])
+    
+    def test_check_detects_and_rebuild_repairs_drift(self):
+        """Test the consistency check catches drift and rebuild fixes it."""
+        self.db.connection.execute("UPDATE catalog_stats SET product_count = product_count + 5")
+        
+        self.assertNotEqual(self.db.check_catalog_stats(), [])
+        self.db.rebuild_catalog_stats()
+        self.assertEqual(self.db.check_catalog_stats(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,10 +2,14 @@
 Unit tests for data models.
 """
 
+import tempfile
 import unittest
 from datetime import datetime
-from src.main.python.models.product import Product, BrandType, StockStatus, PriceHistory
-from src.main.python.models.brand_config import get_brand_config, ColorScheme, Typography
+from pathlib import Path
+from src.main.python.models.product import (
+    Product, BrandType, StockStatus, PriceHistory, parse_product_fields, product_columns
+)
+from src.main.python.models.brand_config import get_brand_config, compile_brand_themes, ColorScheme, Typography
 
 
 class TestProduct(unittest.TestCase):
@@ -117,6 +121,17 @@ class TestProduct(unittest.TestCase):
         self.assertTrue(product_dict['is_on_sale'])
         self.assertIsNotNone(product_dict['discount_percentage'])
     
+    def test_sparse_fields(self):
+        """Test fieldsets are validated and map to the columns they need."""
+        fields = parse_product_fields("id, price,availability_text,id")
+        
+        self.assertEqual(fields, ("id", "price", "availability_text"))
+        self.assertEqual(product_columns(fields), ["id", "price", "stock_level", "stock_status"])
+        self.assertEqual(self.product.to_dict(fields), {k: self.product.to_dict()[k] for k in fields})
+        self.assertIsNone(parse_product_fields(""))
+        with self.assertRaises(ValueError):
+            parse_product_fields("id,password")
+    
     def test_from_dict(self):
         """Test product creation from dictionary."""
         product_dict = self.product.to_dict()
@@ -188,6 +203,24 @@ class TestBrandConfig(unittest.TestCase):
         self.assertIn('typography', config_dict)
         self.assertIn('assets', config_dict)
     
+    def test_compile_brand_themes(self):
+        """Test fingerprinted stylesheets and frozen theme dicts are generated."""
+        with tempfile.TemporaryDirectory() as static_dir:
+            stale = Path(static_dir) / "themes" / "pokemon.000000000000.css"
+            stale.parent.mkdir()
+            stale.write_text("old")
+            
+            themes = compile_brand_themes(static_dir)
+            
+            pokemon = themes[BrandType.POKEMON]
+            css = (Path(static_dir) / pokemon.stylesheet).read_text()
+            self.assertIn("--color-primary: #FFCB05;", css)
+            self.assertEqual(pokemon.theme['stylesheet'], pokemon.stylesheet)
+            self.assertFalse(stale.exists())
+            self.assertEqual(compile_brand_themes(static_dir)[BrandType.POKEMON].stylesheet, pokemon.stylesheet)
+            with self.assertRaises(TypeError):
+                pokemon.theme['colors']['--color-primary'] = "#000000"
+    
     def test_color_scheme_to_dict(self):
         """Test color scheme CSS variable generation."""
         colors = ColorScheme(
@@ -2,13 +2,19 @@
 Unit tests for service layer.
 """
 
+import json
+import random
+import sqlite3
+import tempfile
 import unittest
 from unittest.mock import Mock, patch
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from src.main.python.services.product_service import ProductService
-from src.main.python.models.product import Product, BrandType, StockStatus
-from src.main.python.core.database import DatabaseManager
+from src.main.python.models.product import Product, BrandType, StockStatus, PriceHistory
+from src.main.python.core.database import DatabaseManager, ProductChange, ProductUpdate
+from src.main.python.core.response_store import ResponseStore
+from src.main.python.utils import downsampling
 
 
 class TestProductService(unittest.TestCase):
@@ -79,55 +85,38 @@ class TestProductService(unittest.TestCase):
             search_term="test",
             sort_by="name",
             page=1,
-            per_page=20
+            per_page=20,
+            fields=None
         )
     
     def test_get_featured_products(self):
-        """Test featured products selection."""
-        # Create products with different stock levels
-        products = [
-            Product(
-                id=f"test_{i:03d}",
-                name=f"Test Product {i}",
-                brand=BrandType.POP_MART,
-                source="Test Store",
-                purchase_link="https://example.com/test",
-                price=12.99,
-                stock_level=15 if i % 2 == 0 else 3,  # Alternate high/low stock
-                stock_status=StockStatus.IN_STOCK,
-                image_url="/test/image.jpg"
-            )
-            for i in range(1, 11)
-        ]
-        
-        self.mock_db.get_products.return_value = products
+        """Test featured products come from the stored ranking."""
+        self.mock_db.get_featured_products.return_value = [self.sample_product]
         
-        # Call service method
         result = self.service.get_featured_products(BrandType.POP_MART, limit=4)
         
-        # Verify
-        self.assertLessEqual(len(result), 4)
-        # Featured products should prioritize high stock levels
-        high_stock_products = [p for p in result if p.stock_level > 10]
-        self.assertGreater(len(high_stock_products), 0)
+        self.assertEqual(result, [self.sample_product])
+        self.mock_db.get_featured_products.assert_called_once_with(BrandType.POP_MART, limit=4)
     
     def test_update_product_stock(self):
-        """Test stock level updates."""
-        # Mock existing product
+        """Test stock updates write only stock columns."""
+        self.mock_db.apply_product_updates.return_value = ['updated']
         self.mock_db.get_product_by_id.return_value = self.sample_product
         
         # Call service method
         result = self.service.update_product_stock("test_001", 5)
         
-        # Verify
-        self.assertIsNotNone(result)
-        self.assertEqual(result.stock_level, 5)
-        self.assertEqual(result.stock_status, StockStatus.LOW_STOCK)
-        self.mock_db.update_product.assert_called_once()
+        # Verify a targeted update with derived status was applied
+        self.assertIs(result, self.sample_product)
+        update, = self.mock_db.apply_product_updates.call_args[0][0]
+        self.assertEqual(update.stock_level, 5)
+        self.assertEqual(update.stock_status, StockStatus.LOW_STOCK)
+        self.assertIsNone(update.price)
+        self.mock_db.update_product.assert_not_called()
     
     def test_update_product_price(self):
-        """Test price updates with history tracking."""
-        # Mock existing product
+        """Test price updates are applied as targeted updates."""
+        self.mock_db.apply_product_updates.return_value = ['updated']
         self.mock_db.get_product_by_id.return_value = self.sample_product
         
         # Call service method with new price
@@ -135,67 +124,413 @@ class TestProductService(unittest.TestCase):
         
         # Verify
         self.assertIsNotNone(result)
-        self.assertEqual(result.price, 14.99)
-        self.mock_db.update_product.assert_called_once()
-        # Should have saved price history since price changed
-        self.mock_db.save_price_history.assert_called_once()
+        update, = self.mock_db.apply_product_updates.call_args[0][0]
+        self.assertEqual(update.price, 14.99)
+        self.assertEqual(update.source, "Test Update")
+        self.assertIsNone(update.stock_level)
+    
+    def test_update_conflict_returns_none(self):
+        """Test a failed compare-and-set returns no product."""
+        self.mock_db.apply_product_updates.return_value = ['conflict']
+        
+        result = self.service.update_product_stock("test_001", 5, expected_last_updated=datetime(2024, 1, 1))
+        
+        self.assertIsNone(result)
+        self.mock_db.get_product_by_id.assert_not_called()
+    
+    def test_bulk_update_validates_entries(self):
+        """Test invalid bulk entries reject the batch before writing."""
+        with self.assertRaises(ValueError):
+            self.service.bulk_update_products([{"product_id": "test_001", "stock_level": -1}])
+        with self.assertRaises(ValueError):
+            self.service.bulk_update_products([{"stock_level": 3}])
+        with self.assertRaises(ValueError):
+            self.service.bulk_update_products([{"product_id": "test_001", "stock_level": True}])
+        with self.assertRaises(ValueError):
+            self.service.bulk_update_products([{"product_id": "test_001", "price": False}])
+        with self.assertRaises(ValueError):
+            self.service.bulk_update_products([{"product_id": "test_001", "price": float('nan')}])
+        with self.assertRaisesRegex(ValueError, "Each update must be a JSON object"):
+            self.service.bulk_update_products(["test_001"])
+        self.mock_db.apply_product_updates.assert_not_called()
     
     def test_get_statistics(self):
-        """Test statistics generation."""
-        # Mock products with different statuses
-        products = [
-            Product(
-                id="test_001",
-                name="In Stock Product",
-                brand=BrandType.POP_MART,
-                source="Test Store",
-                purchase_link="https://example.com/test",
-                price=12.99,
-                stock_level=10,
-                stock_status=StockStatus.IN_STOCK,
-                image_url="/test/image.jpg",
-                category="test_cat"
-            ),
-            Product(
-                id="test_002",
-                name="Low Stock Product",
-                brand=BrandType.POP_MART,
-                source="Test Store",
-                purchase_link="https://example.com/test",
-                price=15.99,
-                stock_level=2,
-                stock_status=StockStatus.LOW_STOCK,
-                image_url="/test/image.jpg",
-                category="test_cat"
-            ),
-            Product(
-                id="test_003",
-                name="Out of Stock Product",
-                brand=BrandType.POP_MART,
-                source="Test Store",
-                purchase_link="https://example.com/test",
-                price=18.99,
-                stock_level=0,
-                stock_status=StockStatus.OUT_OF_STOCK,
-                image_url="/test/image.jpg",
-                category="other_cat"
-            )
+        """Test statistics generation from maintained aggregates."""
+        # Mock aggregate rows with different statuses
+        self.mock_db.get_catalog_stats.return_value = [
+            {'brand': 'pop_mart', 'stock_status': 'in_stock', 'category': 'test_cat',
+             'product_count': 1, 'priced_count': 1, 'price_sum': 12.99},
+            {'brand': 'pop_mart', 'stock_status': 'low_stock', 'category': 'test_cat',
+             'product_count': 1, 'priced_count': 1, 'price_sum': 15.99},
+            {'brand': 'pop_mart', 'stock_status': 'out_of_stock', 'category': 'other_cat',
+             'product_count': 1, 'priced_count': 1, 'price_sum': 18.99},
         ]
         
-        self.mock_db.get_products.return_value = products
-        
         # Call service method
         stats = self.service.get_statistics(BrandType.POP_MART)
         
         # Verify
+        self.mock_db.get_catalog_stats.assert_called_once_with(brand=BrandType.POP_MART)
         self.assertEqual(stats['total_products'], 3)
         self.assertEqual(stats['in_stock'], 1)
         self.assertEqual(stats['low_stock'], 1)
         self.assertEqual(stats['out_of_stock'], 1)
         self.assertEqual(len(stats['categories']), 2)
+        self.assertEqual(stats['category_counts'], {'other_cat': 1, 'test_cat': 2})
         self.assertAlmostEqual(stats['average_price'], 15.99, places=2)
 
 
+class TestProductIngestion(unittest.TestCase):
+    """Test NDJSON product ingestion."""
+    
+    def setUp(self):
+        """Set up a service over the sample database."""
+        self.db = DatabaseManager()
+        self.service = ProductService(self.db)
+    
+    def tearDown(self):
+        """Close the database."""
+        self.db.close()
+    
+    def _line(self, product_id, price=12.99, **overrides):
+        """One NDJSON product line."""
+        data = dict(
+            id=product_id, name=f"Figure {product_id}", brand="pop_mart", source="Partner",
+            purchase_link="https://example.com", price=price, stock_level=4,
+            stock_status="low_stock", image_url="/i.jpg"
+        )
+        data.update(overrides)
+        return json.dumps(data).encode('utf-8')
+    
+    def test_ingest_reports_outcomes_and_line_errors(self):
+        """Test valid lines are saved in chunks and bad ones reported."""
+        existing = self.db.get_product_by_id("pm_002").to_dict()
+        lines = [
+            self._line("new_1"),
+            b"{not json",
+            self._line("new_2", price=-1),
+            b"",
+            json.dumps(existing).encode('utf-8'),
+            self._line("pm_001", price=5.0, name="SKULLPANDA The Sound Series"),
+            json.dumps({"id": "x", "brand": "pop_mart"}).encode('utf-8'),
+        ]
+        
+        summary = self.service.ingest_products(lines, source="Partner feed", chunk_size=2)
+        
+        self.assertEqual(summary['received'], 6)
+        self.assertEqual((summary['created'], summary['updated'], summary['unchanged']), (1, 1, 1))
+        self.assertEqual(summary['failed'], 3)
+        self.assertEqual([error['line'] for error in summary['errors']], [2, 3, 7])
+        self.assertEqual(self.db.get_product_by_id("pm_001").price, 5.0)
+        self.assertEqual(self.db.get_price_history("pm_001")[0].source, "Partner feed")
+        self.assertEqual(self.db.get_price_history("new_1")[0].price, 12.99)
+        unlinked = {product.id for product in self.db.get_products_without_offers()}
+        self.assertFalse({"new_1", "pm_001"} & unlinked)
+        
+        bad = self.service.ingest_products([self._line("new_3", stock_level=True), self._line("new_4", price=False)])
+        self.assertEqual(bad['failed'], 2)
+    
+    def test_failed_chunk_is_retried_line_by_line(self):
+        """Test a row the database rejects fails alone instead of its whole chunk."""
+        save_products = self.db.save_products
+        
+        def reject_poisoned(products, **kwargs):
+            if any(product.id == "poisoned" for product in products):
+                raise sqlite3.IntegrityError("NOT NULL constraint failed: products.name")
+            return save_products(products, **kwargs)
+        
+        lines = [self._line("new_6"), self._line("poisoned"), self._line("new_7")]
+        with patch.object(self.db, "save_products", side_effect=reject_poisoned):
+            summary = self.service.ingest_products(lines, chunk_size=3)
+        
+        self.assertEqual((summary['created'], summary['failed']), (2, 1))
+        self.assertEqual(summary['errors'][0]['line'], 2)
+        self.assertIn("NOT NULL", summary['errors'][0]['error'])
+        self.assertIsNotNone(self.db.get_product_by_id("new_6"))
+        self.assertIsNotNone(self.db.get_product_by_id("new_7"))
+    
+    def test_ingest_saves_offers_in_the_chunk_transaction(self):
+        """Test new listings are linked to canonical products without a second commit."""
+        with patch.object(self.db, "save_offers") as save_offers:
+            summary = self.service.ingest_products([self._line("new_8", name="Midnight Owl Plush")])
+        
+        save_offers.assert_not_called()
+        self.assertEqual(summary['created'], 1)
+        self.assertNotIn("new_8", [product.id for product in self.db.get_products_without_offers()])
+        canonical = next(c for c in self.db.get_canonical_products() if c.name == "Midnight Owl Plush")
+        self.assertEqual([product.id for product in self.db.get_offers(canonical.id)], ["new_8"])
+    
+    def test_ingest_reports_overlong_lines(self):
+        """Test a line over the length cap fails alone."""
+        from src.main.python.services import product_service
+        
+        with patch.object(product_service, "MAX_INGEST_LINE_BYTES", 300):
+            summary = self.service.ingest_products([self._line("new_9", description="x" * 400), self._line("new_10")])
+        
+        self.assertEqual((summary['created'], summary['failed']), (1, 1))
+        self.assertEqual(summary['errors'], [{'line': 1, 'error': "Line longer than 300 bytes"}])
+    
+    def test_ingest_rejects_lines_the_database_or_pages_cant_take(self):
+        """Test each malformed field fails only its own line."""
+        malformed = [
+            {'name': None}, {'source': None}, {'image_url': None}, {'name': 5}, {'price': float('nan')},
+            {'price': float('inf')}, {'original_price': float('nan')}, {'tags': {'a': 1}}, {'tags': 'notalist'},
+            {'tags': [1]}, {'metadata': [1]}, {'category': 7}, {'description': 3}, {'last_updated': 5},
+        ]
+        lines = [self._line(f"bad_{i}", **fields) for i, fields in enumerate(malformed)] + [self._line("new_5")]
+        
+        summary = self.service.ingest_products(lines, chunk_size=len(lines))
+        
+        self.assertEqual(summary['failed'], len(malformed))
+        self.assertEqual([error['line'] for error in summary['errors']], list(range(1, len(malformed) + 1)))
+        self.assertEqual(summary['created'], 1)
+        self.assertIsNotNone(self.db.get_product_by_id("new_5"))
+        self.assertIsNone(self.db.get_product_by_id("bad_7"))
+
+
+class TestProductCanonicalizer(unittest.TestCase):
+    """Test cross-retailer product canonicalization."""
+    
+    def setUp(self):
+        """Set up a database with one item listed by three retailers."""
+        from src.main.python.services.canonicalizer import ProductCanonicalizer
+        
+        self.db = DatabaseManager()
+        self.canonicalizer = ProductCanonicalizer(self.db)
+        self.listings = [
+            ("etb_pc", "Pokémon TCG: Scarlet & Violet Elite Trainer Box", "Pokémon Center", 49.99, StockStatus.OUT_OF_STOCK),
+            ("etb_amz", "Scarlet and Violet Elite Trainer Box", "Amazon", 44.99, StockStatus.IN_STOCK),
+            ("etb_tcg", "Scarlet & Violet Elite Trainer Box (Sealed)", "TCG Player", 39.99, StockStatus.LOW_STOCK),
+            ("sv_pack", "Scarlet & Violet Booster Pack", "TCG Player", 4.49, StockStatus.IN_STOCK),
+        ]
+        for product_id, name, source, price, status in self.listings:
+            product = Product(
+                id=product_id,
+                name=name,
+                brand=BrandType.POKEMON,
+                source=source,
+                purchase_link=f"https://example.com/{product_id}",
+                price=price,
+                stock_level=0 if status == StockStatus.OUT_OF_STOCK else 10,
+                stock_status=status,
+                image_url="/test/image.jpg"
+            )
+            self.db.save_product(product)
+    
+    def tearDown(self):
+        """Close the database."""
+        self.db.close()
+    
+    def test_normalize_name(self):
+        """Test names normalize regardless of accents, '&' and filler words."""
+        from src.main.python.services.canonicalizer import normalize_name
+        
+        self.assertEqual(
+            normalize_name("Pokémon TCG: Scarlet & Violet Elite Trainer Box"),
+            normalize_name("scarlet and violet elite trainer box")
+        )
+    
+    def test_listings_grouped_under_one_canonical_product(self):
+        """Test the same item from different retailers shares a canonical id."""
+        self.canonicalizer.backfill()
+        
+        ids = {
+            product_id: self.canonicalizer.assign(self.db.get_product_by_id(product_id)).id
+            for product_id, *_ in self.listings
+        }
+        
+        self.assertEqual(ids["etb_pc"], ids["etb_amz"])
+        self.assertEqual(ids["etb_pc"], ids["etb_tcg"])
+        self.assertNotEqual(ids["etb_pc"], ids["sv_pack"])
+        self.assertEqual(len(self.db.get_offers(ids["etb_pc"])), 3)
+    
+    def test_best_offer_per_canonical_product(self):
+        """Test the cheapest available offer is returned once per item."""
+        self.canonicalizer.backfill()
+        
+        listings = {
+            listing.canonical.name: listing
+            for listing in self.db.get_best_offers(brand=BrandType.POKEMON)
+            if listing.best_offer.id.startswith(("etb", "sv_"))
+        }
+        
+        self.assertEqual(len(listings), 2)
+        etb = next(l for l in listings.values() if l.offer_count == 3)
+        self.assertEqual(etb.best_offer.id, "etb_tcg")
+        self.assertEqual(etb.best_offer.price, 39.99)
+
+
+class TestRelatedProductsIndex(unittest.TestCase):
+    """Test the precomputed related-products index."""
+    
+    def setUp(self):
+        """Set up a database with a few similar figures."""
+        from src.main.python.services.related_products import RelatedProductsIndex
+        
+        self.db = DatabaseManager()
+        for product_id, name, category, tags in [
+            ("fig_a", "Space Molly Figure", "figures", ["molly", "space"]),
+            ("fig_b", "Space Molly Mini Figure", "figures", ["molly", "space"]),
+            ("fig_c", "Labubu Forest Figure", "figures", ["labubu"]),
+            ("plush", "Labubu Plush", "plush", ["labubu"]),
+        ]:
+            self.db.save_product(self._product(product_id, name, category, tags))
+        self.index = RelatedProductsIndex(self.db, k=3).build()
+        self.db.add_change_listener(self.index.on_product_change)
+    
+    def tearDown(self):
+        """Close the database."""
+        self.db.close()
+    
+    def _product(self, product_id, name, category, tags):
+        """Build a Pop Mart product."""
+        return Product(
+            id=product_id,
+            name=name,
+            brand=BrandType.POP_MART,
+            source="Test Store",
+            purchase_link=f"https://example.com/{product_id}",
+            price=12.99,
+            stock_level=10,
+            stock_status=StockStatus.IN_STOCK,
+            image_url="/test/image.jpg",
+            category=category,
+            tags=tags
+        )
+    
+    def test_most_similar_product_ranked_first(self):
+        """Test shared name, tags and category outrank a shared category alone."""
+        related = self.index.related_ids("fig_a", limit=3)
+        
+        self.assertEqual(related[0], "fig_b")
+        self.assertIn("fig_c", related)
+        self.assertNotIn("fig_a", related)
+    
+    def test_index_follows_product_changes(self):
+        """Test saved and re-categorized products update neighbour lists."""
+        self.db.save_product(self._product("fig_d", "Space Molly Figure Deluxe", "figures", ["molly", "space"]))
+        self.assertIn("fig_d", self.index.related_ids("fig_a", limit=2))
+        
+        self.db.save_product(self._product("fig_d", "Crybaby Keychain", "keychains", ["crybaby"]))
+        self.assertNotIn("fig_d", self.index.related_ids("fig_a"))
+        self.assertEqual(self.index.related_ids("fig_d"), [])
+    
+    def test_background_updates(self):
+        """Test queued changes are applied by the worker."""
+        from src.main.python.services.related_products import RelatedProductsIndex
+        
+        index = RelatedProductsIndex(self.db, k=3, background=True).build()
+        self.db.add_change_listener(index.on_product_change)
+        self.db.save_product(self._product("fig_d", "Space Molly Figure Deluxe", "figures", ["molly", "space"]))
+        
+        self.assertTrue(index.flush(timeout=5))
+        self.assertIn("fig_d", index.related_ids("fig_a", limit=2))
+    
+    def test_common_features_are_ignored(self):
+        """Test a feature shared by too many products doesn't relate them."""
+        from src.main.python.services.related_products import RelatedProductsIndex
+        
+        index = RelatedProductsIndex(self.db, k=3, max_feature_products=2).build()
+        
+        self.assertEqual(index.related_ids("fig_a", limit=3), ["fig_b"])
+    
+    def test_service_uses_index(self):
+        """Test related products come from the index in ranked order."""
+        service = ProductService(self.db, related_index=self.index)
+        
+        related = service.get_related_products("fig_a", BrandType.POP_MART, limit=2)
+        
+        self.assertEqual(related[0].id, "fig_b")
+        self.assertEqual(len(related), 2)
+        self.assertNotIn("fig_a", [p.id for p in related])
+
+
+class TestChangeBroker(unittest.TestCase):
+    """Test the server-sent events change feed."""
+    
+    def setUp(self):
+        """Set up a broker fed by the sample database."""
+        from src.main.python.services.change_feed import ChangeBroker
+        
+        self.db = DatabaseManager()
+        self.broker = ChangeBroker(self.db.get_product_by_id, buffer_size=3, heartbeat=0.01)
+        self.db.add_change_listener(self.broker.on_product_change)
+    
+    def tearDown(self):
+        """Close the database."""
+        self.db.close()
+    
+    def test_visible_changes_are_published(self):
+        """Test stock changes publish events and repeated states don't."""
+        start = self.broker.last_event_id
+        self.db.apply_product_updates([ProductUpdate("pm_001", stock_level=3)])
+        self.broker.on_product_change(ProductChange("pm_001"))
+        
+        events, complete = self.broker.events_after(start)
+        self.assertTrue(complete)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].data['stock_level'], 3)
+        self.assertEqual(events[0].brand, 'pop_mart')
+    
+    def test_remembered_states_are_bounded(self):
+        """Test the broker forgets the least recently changed products beyond max_states."""
+        self.broker.max_states = 2
+        for product_id in ("pm_001", "pm_002", "pk_001"):
+            self.broker.on_product_change(ProductChange(product_id))
+        
+        self.assertEqual(list(self.broker._states), ["pm_002", "pk_001"])
+        self.broker.on_product_change(ProductChange("pm_001", deleted=True))
+        self.broker.on_product_change(ProductChange("pk_001", deleted=True))
+        self.assertEqual(list(self.broker._states), ["pm_002"])
+    
+    def test_resume_filters_by_brand(self):
+        """Test a resumed stream replays only matching buffered events."""
+        start = self.broker.last_event_id
+        self.db.apply_product_updates([ProductUpdate("pm_001", price=9.99), ProductUpdate("pk_001", price=8.99)])
+        
+        stream = self.broker.listen(start, brand='pokemon')
+        self.assertEqual(next(stream), "retry: 5000\n\n")
+        message = next(stream)
+        
+        self.assertIn('"id": "pk_001"', message)
+        self.assertNotIn('pm_001', message)
+        self.assertEqual(next(stream), ": keep-alive\n\n")
+        self.broker.close()
+        self.assertEqual(list(stream), [])
+        self.assertEqual(self.broker.subscriber_count, 0)
+    
+    def test_stale_cursor_gets_reset(self):
+        """Test a client that fell behind the buffer is told to refetch."""
+        start = self.broker.last_event_id
+        for level in range(1, 5):
+            self.db.apply_product_updates([ProductUpdate("pm_001", stock_level=level)])
+        
+        stream = self.broker.listen(start)
+        next(stream)
+        
+        self.assertIn("event: reset", next(stream))
+        self.assertEqual(self.broker.events_after(start), ([], False))
+        self.assertEqual(self.broker.events_after(start - 1000)[1], False)
+    
+    def test_subscriber_limit(self):
+        """Test a slot is taken when listening starts and released when the stream closes."""
+        from src.main.python.services.change_feed import StreamLimitReached
+        
+        self.broker.max_subscribers = 1
+        stream = self.broker.listen()
+        self.assertEqual(self.broker.subscriber_count, 1)
+        with self.assertRaises(StreamLimitReached):
+            self.broker.listen()
+        
+        stream.close()  # Never iterated, as when a client disconnects before the first event
+        self.assertEqual(self.broker.subscriber_count, 0)
+        stream = self.broker.listen()
+        next(stream)
+        self.broker.close()
+        self.assertEqual(list(stream), [])
+        self.assertEqual(self.broker.subscriber_count, 0)
+
+
 class TestDataCollectionManager(unittest.TestCase):
     """Test data collection functionality."""
     
@@ -217,5 +552,185 @@ class TestDataCollectionManager(unittest.TestCase):
         mock_pokemon.assert_called_once_with(self.mock_db)
 
 
+
+class TestDownsampling(unittest.TestCase):
+    """Test LTTB downsampling of price history."""
+    
+    def setUp(self):
+        """Build a noisy hourly series with one spike."""
+        rng = random.Random(0)
+        start = datetime(2024, 1, 1)
+        self.history = [
+            PriceHistory("pm_001", round(rng.uniform(12, 13), 2), start + timedelta(hours=i))
+            for i in range(5000)
+        ]
+        self.history[2718].price = 49.99
+    
+    def test_keeps_ends_and_spikes(self):
+        """Test the first, last and spike points survive."""
+        reduced = downsampling.downsample_history(self.history, 100)
+        
+        self.assertEqual(len(reduced), 100)
+        self.assertIs(reduced[0], self.history[0])
+        self.assertIs(reduced[-1], self.history[-1])
+        self.assertIn(self.history[2718], reduced)
+        self.assertEqual(downsampling.downsample_history(self.history[:50], 100), self.history[:50])
+        with self.assertRaises(ValueError):
+            downsampling.downsample_history(self.history, 2)
+    
+    def test_pure_python_matches(self):
+        """Test the fallback without numpy picks the same points."""
+        expected = downsampling.downsample_history(self.history, 250)
+        with patch.object(downsampling, 'np', None):
+            self.assertEqual(downsampling.downsample_history(self.history, 250), expected)
+    
+    def test_service_max_points(self):
+        """Test the service downsamples single and batch histories."""
+        db = Mock(spec=DatabaseManager)
+        db.get_price_history.return_value = self.history
+        db.get_price_histories.return_value = {"pm_001": self.history}
+        service = ProductService(db)
+        
+        self.assertEqual(len(service.get_price_history("pm_001", max_points=300)), 300)
+        self.assertEqual(len(service.get_price_history("pm_001")), 5000)
+        self.assertEqual(len(service.get_price_histories(["pm_001"], max_points=300)["pm_001"]), 300)
+
+
+class TestResponseReplay(unittest.TestCase):
+    """Test archiving and offline replay of retailer responses."""
+    
+    PRODUCT_PAGE = """<html><head>
+    <script type="application/ld+json">{}</script>
+    </head><body>Product</body></html>"""
+    
+    def setUp(self):
+        """Set up a store holding one archived product page."""
+        from src.main.python.services.data_collector import PokemonCollector
+        
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = ResponseStore(self.tmp_dir.name, compression='gzip')
+        self.db = DatabaseManager()
+        self.collector = PokemonCollector(self.db)
+        
+        schema = {
+            "@context": "https://schema.org",
+            "@type": "Product",
+            "sku": "pk_900",
+            "name": "Stored Elite Trainer Box",
+            "image": ["/static/images/stored.jpg"],
+            "category": "box",
+            "keywords": "elite, trainer",
+            "offers": {
+                "@type": "Offer",
+                "price": "42.50",
+                "availability": "https://schema.org/InStock",
+                "inventoryLevel": {"value": 3},
+                "seller": {"name": "Stub Retailer"},
+                "priceSpecification": {"priceType": "https://schema.org/ListPrice", "price": "49.99"}
+            }
+        }
+        self.store.put(
+            "https://retailer.test/pk_900",
+            self.PRODUCT_PAGE.format(json.dumps(schema)).encode('utf-8'),
+            source=BrandType.POKEMON.value
+        )
+    
+    def tearDown(self):
+        """Clean up the store and database."""
+        self.db.close()
+        self.tmp_dir.cleanup()
+    
+    def test_replay_parses_stored_pages_without_network(self):
+        """Test replay rebuilds products from stored bodies."""
+        self.collector.attach_response_store(self.store, replay=True)
+        self.collector.session.get = Mock(side_effect=AssertionError("network used"))
+        
+        products = self.collector.replay_stored_responses()
+        
+        self.assertEqual(len(products), 1)
+        product = products[0]
+        self.assertEqual(product.id, "pk_900")
+        self.assertEqual(product.price, 42.50)
+        self.assertEqual(product.original_price, 49.99)
+        self.assertEqual(product.stock_status, StockStatus.LOW_STOCK)
+        self.assertEqual(product.source, "Stub Retailer")
+        self.assertEqual(product.tags, ["elite", "trainer"])
+    
+    def test_replay_mode_serves_requests_from_store(self):
+        """Test requests in replay mode are answered from the store."""
+        self.collector.attach_response_store(self.store, replay=True)
+        
+        data = self.collector._scrape_product_page("https://retailer.test/pk_900")
+        
+        self.assertEqual(data['name'], "Stored Elite Trainer Box")
+        self.assertIsNone(self.collector._make_request("https://retailer.test/missing"))
+    
+    def test_replay_reads_index_once(self):
+        """Test replaying many URLs reads the index a single time."""
+        self.collector.attach_response_store(self.store, replay=True)
+        
+        with patch.object(self.store, 'entries', wraps=self.store.entries) as entries:
+            for _ in range(3):
+                self.assertIsNotNone(self.collector._make_request("https://retailer.test/pk_900"))
+            self.collector._make_request("https://retailer.test/missing")
+        
+        self.assertEqual(entries.call_count, 1)
+    
+    def test_manager_replay_updates_database(self):
+        """Test the manager runs the update pipeline over replayed products."""
+        from src.main.python.services.data_collector import DataCollectionManager
+        
+        manager = DataCollectionManager(self.db, response_store=self.store, replay=True)
+        results = manager.run_collection()
+        
+        self.assertEqual(results['mode'], 'replay')
+        self.assertEqual(results['collections']['pokemon']['products_collected'], 1)
+        self.assertEqual(self.db.get_product_by_id("pk_900").price, 42.50)
+
+
+
+class TestCollectorHarness(unittest.TestCase):
+    """Test collectors against the local stub retailer."""
+    
+    def test_crawl_stub_retailer(self):
+        """Test a collector crawls the stub sitemap and parses every page."""
+        from src.main.python.services.data_collector import PopMartCollector
+        from src.main.python.utils.stub_retailer import StubRetailerServer, StubConfig
+        
+        db = DatabaseManager()
+        with StubRetailerServer(StubConfig(products_per_brand=5)) as stub:
+            collector = PopMartCollector(db)
+            collector.base_url = stub.base_url
+            collector.rate_limit_delay = 0.0
+            collector.rate_limit_jitter = 0.0
+            
+            products = collector.collect_data()
+            self.assertEqual(len(products), 5)
+            self.assertTrue(all(p.brand == BrandType.POP_MART for p in products))
+            
+            # Unchanged pages are skipped via ETags on the next crawl
+            self.assertEqual(collector.collect_data(), [])
+            self.assertEqual(stub.stats.status_counts.get(304), 6)
+        db.close()
+    
+    def test_harness_report(self):
+        """Test the harness reports throughput, latency and write figures."""
+        from src.main.python.utils.stub_retailer import StubConfig
+        from src.main.python.utils.collector_harness import run_collector_harness
+        
+        report = run_collector_harness(
+            StubConfig(products_per_brand=10, rate_limit_rate=0.1),
+            rounds=2,
+            mutate_fraction=0.5
+        )
+        
+        self.assertGreaterEqual(report.pages_fetched, 44)
+        self.assertEqual(report.errors, [])
+        self.assertGreaterEqual(report.products_written, 20)
+        self.assertGreater(report.pages_per_second, 0)
+        self.assertGreaterEqual(report.fetch_latency_p99_ms, report.fetch_latency_p50_ms)
+        self.assertIn('304', report.status_counts)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file